@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+""" Micro benchmarks
+
+	python3 bench.py [NAME...] [-n N]
+
+Runs every benchmark when no name is given.
+"""
+
+import argparse
+import struct
+import time
+
+import gen_lnk
+
+# Default number of iterations
+N = 20000
+
+def timed(label, n, fn):
+	""" Runs fn() and reports the rate of `n` operations """
+	start = time.perf_counter()
+	fn()
+	elapsed = time.perf_counter() - start
+	print(f'  {label:<40} {n / elapsed:>12,.0f}/s  {elapsed:8.3f}s')
+	return elapsed
+
+def bench_template(n=N):
+	""" Variants of malicious() differing in Arguments and WriteTime """
+	from filetime import FileTime
+	from template import LinkTemplate
+
+	def build():
+		for i in range(n):
+			lnk = gen_lnk.malicious()
+			lnk.Arguments = f'/c echo {i}'
+			lnk.ShellLinkHeader.WriteTime = FileTime(i, 0x01D8)
+			bytes(lnk)
+
+	def render():
+		tpl = LinkTemplate(gen_lnk.malicious(), ('Arguments', 'WriteTime'))
+		for i in range(n):
+			tpl.render(Arguments=f'/c echo {i}', WriteTime=0x01D8 << 32 | i)
+
+	slow = timed('malicious() + bytes(Link) per variant', n, build)
+	fast = timed('LinkTemplate.render', n, render)
+	print(f'  speedup {slow / fast:.1f}x')
+
+def bench_layout(n=N):
+	""" Generated Layout codecs against hand-written struct calls """
+	from extra_data import ConsoleDataBlock
+	from reader import Reader
+
+	block = ConsoleDataBlock()
+	buf = bytearray(block.size())
+	reader = Reader(bytes(block))
+
+	# ConsoleDataBlock as it was written before Layout
+	def pack_by_hand():
+		b = block
+		for _ in range(n):
+			struct.pack_into('<2I8H5I', buf, 0,
+				b.Size, b.Signature,
+				b.FillAttributes, b.PopupFillAttributes,
+				b.ScreenBufferSizeX, b.ScreenBufferSizeY,
+				b.WindowSizeX, b.WindowSizeY,
+				b.WindowOriginX, b.WindowOriginY,
+				b.Unused0, b.Unused1,
+				b.FontSize, b.FontFamily, b.FontWeight)
+			offset = struct.calcsize('<2I8H5I')
+			buf[offset:offset + 64] = b.FaceName
+			offset += 64
+			struct.pack_into('<8I', buf, offset,
+				b.CursorSize, b.FullScreen, b.QuickEdit, b.InsertMode,
+				b.AutoPosition, b.HistoryBufferSize,
+				b.NumberOfHistoryBuffers, b.HistoryNoDup)
+			offset += struct.calcsize('<8I')
+			struct.pack_into(f'<{len(b.ColorTable)}I', buf, offset,
+				*b.ColorTable)
+
+	def unpack_by_hand():
+		for _ in range(n):
+			b = ConsoleDataBlock.__new__(ConsoleDataBlock)
+			(b.Size, b.Signature,
+			 b.FillAttributes, b.PopupFillAttributes,
+			 b.ScreenBufferSizeX, b.ScreenBufferSizeY,
+			 b.WindowSizeX, b.WindowSizeY,
+			 b.WindowOriginX, b.WindowOriginY,
+			 b.Unused0, b.Unused1,
+			 b.FontSize, b.FontFamily, b.FontWeight) = \
+				reader.unpack_from('<2I8H5I', 0)
+			offset = struct.calcsize('<2I8H5I')
+			b.FaceName = reader.slice(offset, offset + 64)
+			offset += 64
+			(b.CursorSize, b.FullScreen, b.QuickEdit, b.InsertMode,
+			 b.AutoPosition, b.HistoryBufferSize,
+			 b.NumberOfHistoryBuffers, b.HistoryNoDup) = \
+				reader.unpack_from('<8I', offset)
+			offset += struct.calcsize('<8I')
+			b.ColorTable = list(reader.unpack_from('<16I', offset))
+
+	def pack():
+		for _ in range(n):
+			block.pack_into(buf, 0)
+
+	def unpack():
+		for _ in range(n):
+			ConsoleDataBlock.from_buffer(reader, 0)
+
+	slow = timed('ConsoleDataBlock pack, by hand', n, pack_by_hand)
+	fast = timed('ConsoleDataBlock pack, Layout', n, pack)
+	print(f'  speedup {slow / fast:.1f}x')
+	slow = timed('ConsoleDataBlock unpack, by hand', n, unpack_by_hand)
+	fast = timed('ConsoleDataBlock unpack, Layout', n, unpack)
+	print(f'  speedup {slow / fast:.1f}x')
+
+def bench_memory(n=N):
+	""" Bytes per parsed link, the source buffers excluded """
+	import tracemalloc
+	from shell_link import Link, LazyLink, CompactLink
+
+	parsers = (('Link', Link.from_bytes), ('LazyLink', LazyLink),
+		('CompactLink', CompactLink))
+	for shape in ('example', 'malicious'):
+		lnk = getattr(gen_lnk, shape)()
+		data = [bytes(lnk) for _ in range(n)]
+		print(f'  {shape}() shape, {len(data[0])} bytes')
+		for label, parse in parsers:
+			tracemalloc.start()
+			before = tracemalloc.get_traced_memory()[0]
+			links = [parse(bs) for bs in data]
+			used = tracemalloc.get_traced_memory()[0] - before
+			tracemalloc.stop()
+			del links
+			print(f'    {label:<38} {used / n:>12,.0f} bytes/link')
+
+def bench_idlist(n=100000):
+	""" Links to n files of a deep tree, IDLists built item by item or by from_path """
+	from constants import CLSID
+	from linktarget_idlist import (LinkTargetIDList, RootShellItem,
+		VolumeShellItem, FileShellItem)
+
+	paths = [f'C:\\Users\\user\\AppData\\Roaming\\project\\src\\'
+		f'd{i // 1000 % 10}\\d{i // 100 % 10}\\d{i // 10 % 10}\\file{i}.txt'
+		for i in range(n)]
+	lnk = gen_lnk.example()
+
+	def by_hand():
+		for path in paths:
+			idlist = LinkTargetIDList()
+			idlist.add_payload(RootShellItem(bytes(CLSID.MY_COMPUTER.value)))
+			idlist.add_payload(VolumeShellItem('C:\\'.ljust(22, '\x00')))
+			names = path.split('\\')[1:]
+			for name in names[:-1]:
+				item = FileShellItem(name + '\x00')
+				item.set('FILE_ATTRIBUTE_DIRECTORY', 1)
+				idlist.add(3, 1, bytes(item))
+			item = FileShellItem(names[-1] + '\x00')
+			item.set('FILE_ATTRIBUTE_NORMAL', 1)
+			idlist.add(3, 2, bytes(item))
+			lnk.LinkTargetIDList = idlist
+			bytes(lnk)
+
+	def from_path():
+		for path in paths:
+			lnk.LinkTargetIDList = LinkTargetIDList.from_path(path)
+			bytes(lnk)
+
+	slow = timed('FileShellItem per component', n, by_hand)
+	LinkTargetIDList.cache_clear()
+	fast = timed('LinkTargetIDList.from_path', n, from_path)
+	print(f'  speedup {slow / fast:.1f}x, {LinkTargetIDList.cache_info()}')
+
+BENCHMARKS = {
+	'template': bench_template,
+	'layout': bench_layout,
+	'memory': bench_memory,
+	'idlist': bench_idlist,
+}
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__,
+		formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('names', nargs='*',
+		help='benchmarks to run: ' + ', '.join(BENCHMARKS))
+	parser.add_argument('-n', type=int, default=None,
+		help=f'iterations (default: {N}, 100000 paths for idlist)')
+	args = parser.parse_args(argv)
+	for name in args.names:
+		if name not in BENCHMARKS:
+			parser.error(f'unknown benchmark {name}')
+
+	for name in args.names or BENCHMARKS:
+		print(f'{name}: {BENCHMARKS[name].__doc__.strip()}')
+		if args.n is None:
+			BENCHMARKS[name]()
+		else:
+			BENCHMARKS[name](args.n)
+
+if __name__ == '__main__':
+	main()
@@ -1,62 +1,145 @@
 import struct
 
+# Compiled schemas, keyed on (field_names, storage_size, name)
+_SCHEMAS = {}
+
 class BitFlags():
 	""" A class representing a BitFlags object
 		Stored as a 32-bit le integer
 		Field names represent bits 0-32
+
+		A flag set is described once with BitFlags.define(), which
+		compiles the name -> mask table and returns a subclass shared
+		by every instance of that flag set. Instances only hold the
+		integer value.
+
+		BitFlags(field_names, storage_size=32) still builds a cleared
+		instance of the schema of `field_names`, as before define()
 	"""
 
-	def __init__(self, field_names, storage_size=32):
-		self.storage_size = storage_size
-		if self.storage_size == 8:
-			self.fmts = 'B' # unsigned byte
-		elif self.storage_size == 16:
-			self.fmts = 'H' # unsigned short
-		elif self.storage_size == 32:
-			self.fmts = 'I'	# unsigned int
-		elif self.storage_size == 64: 
-			self.fmts = 'Q'	# unsigned long long
+	__slots__ = ('value',)
+
+	# Filled in by define()
+	field_names  = ()
+	masks		 = {}
+	storage_size = 32
+	fmt			 = struct.Struct('<I')
+
+	@classmethod
+	def define(cls, field_names, storage_size=32, name='BitFlags'):
+		""" Compiles (or fetches the already compiled) schema for
+			`field_names`, bit i being named by field_names[i] """
+		key = (tuple(field_names), storage_size, name)
+		if key in _SCHEMAS:
+			return _SCHEMAS[key]
+
+		if storage_size == 8:
+			fmts = 'B' # unsigned byte
+		elif storage_size == 16:
+			fmts = 'H' # unsigned short
+		elif storage_size == 32:
+			fmts = 'I'	# unsigned int
+		elif storage_size == 64:
+			fmts = 'Q'	# unsigned long long
 		else:
-			raise ValueError(f'Invalid storage size ({self.storage_size})')
+			raise ValueError(f'Invalid storage size ({storage_size})')
 
-		self.size = len(field_names)
-		if self.size > self.storage_size:
+		if len(field_names) > storage_size:
 			raise ValueError('Number of fields in flag may not exceed storage size')
 
-		for fn in field_names:
-			if field_names.count(fn) > 1:
+		masks = {}
+		for i, fn in enumerate(field_names):
+			if fn in masks:
 				raise ValueError(f'Field {fn} occurs more than once!')
+			masks[fn] = 1 << i
+
+		schema = type(name, (cls,), {
+			'__slots__': (),
+			'field_names': key[0],
+			'masks': masks,
+			'storage_size': storage_size,
+			'fmt': struct.Struct('<' + fmts),
+		})
+		_SCHEMAS[key] = schema
+		return schema
+
+	def __new__(cls, value=0, storage_size=32):
+		if cls is not BitFlags:
+			return super().__new__(cls)
+		# BitFlags(field_names, storage_size=32)
+		return cls.define(value, storage_size)()
+
+	def __init__(self, value=0, storage_size=None):
+		if not isinstance(value, int):
+			# BitFlags(field_names, storage_size), built by __new__
+			return
+		if value < 0 or value >> self.storage_size:
+			raise ValueError(f'Value {value:#x} does not fit in '
+				f'{self.storage_size} bits')
+		self.value = value
+
+	@classmethod
+	def from_int(cls, value):
+		return cls(value)
 
-		self.field_names = field_names
-		self.field_states = [0 for _ in range(self.size)]
+	def __int__(self):
+		return self.value
+
+	# Packed by struct and Layout like the integer it stores
+	__index__ = __int__
+
+	def __reduce__(self):
+		# Schemas are classes built at run time, so they are
+		# pickled by their definition
+		return _unpickle, (self.field_names, self.storage_size,
+			type(self).__name__, self.value)
+
+	def __eq__(self, other):
+		if isinstance(other, BitFlags):
+			return self.value == other.value and self.masks is other.masks
+		return NotImplemented
+
+	def __hash__(self):
+		return hash((type(self), self.value))
+
+	def __repr__(self):
+		names = [fn for fn in self.field_names if self.value & self.masks[fn]]
+		return f'{type(self).__name__}({self.value:#x}: {"|".join(names)})'
 
 	def __bytes__(self):
-		for s in self.field_states:
-			if s > 1 or s < 0:
-				raise ValueError('Invalid bit state')
+		return self.fmt.pack(self.value)
 
-		bits = ''.join(
-			[str(s) for s in self.field_states][::-1]
-		).rjust(self.storage_size, '0')
+	def size(self):
+		return self.fmt.size
 
-		return struct.pack('<'+self.fmts, int(bits,2))
+	def pack_into(self, buf, offset):
+		self.fmt.pack_into(buf, offset, self.value)
+		return offset + self.fmt.size
 
 	def get(self, field_name):
-		i = 0
-		for fn in self.field_names:
-			if field_name == fn:
-				return self.field_states[i]
-			i += 1
-		raise ValueError(f'Field {field_name} does not exist')
+		try:
+			return 1 if self.value & self.masks[field_name] else 0
+		except KeyError:
+			raise ValueError(f'Field {field_name} does not exist') from None
 
 	def set(self, field_name, state):
-		if state < 0 or state > 1:
+		if state not in (0, 1):
 			raise ValueError(f'State can only be 0 or 1')
 
-		i = 0
-		for fn in self.field_names:
-			if field_name == fn:
-				self.field_states[i] = state
-				return
-			i += 1
-		raise ValueError(f'Field {field_name} does not exist')
+		try:
+			mask = self.masks[field_name]
+		except KeyError:
+			raise ValueError(f'Field {field_name} does not exist') from None
+
+		if state:
+			self.value |= mask
+		else:
+			self.value &= ~mask
+
+	def set_many(self, states=(), **kwargs):
+		""" Sets several fields at once, from a mapping and/or keywords """
+		for field_name, state in dict(states, **kwargs).items():
+			self.set(field_name, state)
+
+def _unpickle(field_names, storage_size, name, value):
+	return BitFlags.define(field_names, storage_size, name)(value)
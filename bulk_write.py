@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+""" Asynchronous bulk writer for generated links
+
+write_links() consumes an iterator of (path, Link or bytes) and writes
+every link to its path. Links are serialized on a thread or process
+pool and handed to `concurrency` writer tasks through a bounded queue,
+so at most `queue_size` links are held in memory and a slow disk
+throttles the producer. Files are written by a thread pool, asyncio has
+no file I/O of its own.
+
+With fsync_every=N, written files are kept open and synced N at a time
+together with their directories, instead of one fsync per file.
+
+	stats = asyncio.run(write_links(items, concurrency=16))
+	python3 bulk_write.py OUT_DIR -n 100000 [--pool process] [--fsync-every 256]
+"""
+
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+WriteStats = collections.namedtuple('WriteStats', [
+	'files', 'bytes', 'seconds',
+	'max_queue', 'mean_queue',		# queue depth seen by the producer
+	'stalls', 'stall_seconds',		# producer waits on a full queue
+	'fsyncs',						# fsync batches
+])
+
+def _serialize(lnk):
+	return bytes(lnk)
+
+def _open_flags():
+	return os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+
+def _write_file(path, data, keep_open):
+	""" Writes `data` to `path`, returns the open descriptor if
+		`keep_open`, for a later fsync """
+	fd = os.open(path, _open_flags(), 0o644)
+	try:
+		view = memoryview(data)
+		while view:
+			view = view[os.write(fd, view):]
+	except BaseException:
+		os.close(fd)
+		raise
+	if keep_open:
+		return fd
+	os.close(fd)
+	return None
+
+def _fsync_batch(fds, directories):
+	try:
+		for fd in fds:
+			os.fsync(fd)
+	finally:
+		for fd in fds:
+			os.close(fd)
+	# Directory entries of new files are only durable once
+	# their directory is synced, not supported on Windows
+	if os.name == 'posix':
+		for directory in directories:
+			fd = os.open(directory or '.', os.O_RDONLY)
+			try:
+				os.fsync(fd)
+			finally:
+				os.close(fd)
+
+async def write_links(items, concurrency=8, queue_size=None, pool='thread',
+		workers=None, fsync_every=0, progress=None):
+	""" Writes every (path, Link or bytes) of `items`, returns WriteStats
+
+		`pool` is 'thread' or 'process', the executor serializing the
+		Links (`workers` of them); bytes are written as they are.
+		`queue_size` bounds the links in flight, 4 * concurrency by
+		default. `progress`, if given, is called with the file count
+		after every write. The first error stops the writers and is
+		raised once the pipeline is drained.
+	"""
+	loop = asyncio.get_running_loop()
+	queue_size = queue_size or 4 * concurrency
+	queue = asyncio.Queue(queue_size)
+	serializer = (ProcessPoolExecutor if pool == 'process' else
+		ThreadPoolExecutor)(workers)
+	io_pool = ThreadPoolExecutor(concurrency)
+
+	files = nbytes = stalls = depth_total = depth_samples = max_depth = 0
+	stall_seconds = 0.0
+	fsyncs = 0
+	pending_fds = []
+	pending_dirs = set()
+	errors = []
+
+	async def flush():
+		nonlocal fsyncs
+		if not pending_fds:
+			return
+		fds, dirs = pending_fds[:], set(pending_dirs)
+		pending_fds.clear()
+		pending_dirs.clear()
+		fsyncs += 1
+		await loop.run_in_executor(io_pool, _fsync_batch, fds, dirs)
+
+	async def writer():
+		nonlocal files, nbytes
+		while True:
+			entry = await queue.get()
+			try:
+				if entry is None:
+					return
+				path, data = entry
+				if errors:
+					continue
+				if isinstance(data, asyncio.Future):
+					data = await data
+				fd = await loop.run_in_executor(io_pool, _write_file,
+					path, data, fsync_every > 0)
+				files += 1
+				nbytes += len(data)
+				if fd is not None:
+					pending_fds.append(fd)
+					pending_dirs.add(os.path.dirname(path))
+					if len(pending_fds) >= fsync_every:
+						await flush()
+				if progress:
+					progress(files)
+			except Exception as e:
+				errors.append(e)
+			finally:
+				queue.task_done()
+
+	start = time.perf_counter()
+	tasks = [asyncio.create_task(writer()) for _ in range(concurrency)]
+	try:
+		for path, lnk in items:
+			if errors:
+				break
+			if isinstance(lnk, (bytes, bytearray, memoryview)):
+				data = lnk
+			else:
+				data = loop.run_in_executor(serializer, _serialize, lnk)
+
+			depth = queue.qsize()
+			depth_total += depth
+			depth_samples += 1
+			max_depth = max(max_depth, depth)
+			if queue.full():
+				stalls += 1
+				waited = time.perf_counter()
+				await queue.put((path, data))
+				stall_seconds += time.perf_counter() - waited
+			else:
+				queue.put_nowait((path, data))
+
+		for _ in tasks:
+			await queue.put(None)
+		await asyncio.gather(*tasks)
+		if not errors:
+			await flush()
+	finally:
+		for task in tasks:
+			task.cancel()
+		for fd in pending_fds:
+			os.close(fd)
+		serializer.shutdown(cancel_futures=True)
+		io_pool.shutdown()
+
+	if errors:
+		raise errors[0]
+	return WriteStats(files, nbytes, time.perf_counter() - start,
+		max_depth, depth_total / depth_samples if depth_samples else 0.0,
+		stalls, stall_seconds, fsyncs)
+
+def format_stats(stats):
+	seconds = max(stats.seconds, 1e-9)
+	return (f'{stats.files} files, {stats.bytes / 1e6:.1f} MB in '
+		f'{stats.seconds:.2f}s: {stats.files / seconds:.0f} files/s, '
+		f'{stats.bytes / 1e6 / seconds:.1f} MB/s; queue depth max '
+		f'{stats.max_queue}, mean {stats.mean_queue:.1f}; {stats.stalls} '
+		f'stalls ({stats.stall_seconds:.2f}s); {stats.fsyncs} fsync batches')
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Write N variants of a '
+		'generated link to a directory, reporting the write throughput')
+	parser.add_argument('directory')
+	parser.add_argument('-n', type=int, default=10000,
+		help='number of links (default: 10000)')
+	parser.add_argument('--shape', choices=('example', 'malicious'),
+		default='malicious', help='generated link (default: malicious)')
+	parser.add_argument('-c', '--concurrency', type=int, default=8,
+		help='concurrent file writes (default: 8)')
+	parser.add_argument('-q', '--queue-size', type=int, default=None,
+		help='links in flight (default: 4 * concurrency)')
+	parser.add_argument('--pool', choices=('thread', 'process'),
+		default='thread', help='serializer pool (default: thread)')
+	parser.add_argument('-j', '--workers', type=int, default=None,
+		help='serializer workers (default: executor default)')
+	parser.add_argument('--fsync-every', type=int, default=0,
+		help='fsync files in batches of N (default: 0, no fsync)')
+	args = parser.parse_args(argv)
+
+	import gen_lnk
+	make = getattr(gen_lnk, args.shape)
+
+	def items():
+		for i in range(args.n):
+			lnk = make()
+			lnk.set('HasArguments', 1)
+			lnk.Arguments = f'{i}'
+			yield os.path.join(args.directory, f'{i}.lnk'), lnk
+
+	os.makedirs(args.directory, exist_ok=True)
+	stats = asyncio.run(write_links(items(), args.concurrency,
+		args.queue_size, args.pool, args.workers, args.fsync_every))
+	print(format_stats(stats), file=sys.stderr)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+""" Carves links out of raw disk images and memory dumps
+
+The image is memory-mapped and searched for the start of a
+ShellLinkHeader: HeaderSize 0x4C followed by the LinkCLSID. Every hit is
+validated by parsing the link in place, so only hits whose sizes and
+offsets check out are reported. Large images are split in chunks
+searched in parallel by worker processes, each mapping the image itself.
+
+	python3 carve.py IMAGE [-j WORKERS] [-o DIR] > carved.jsonl
+"""
+
+import argparse
+import collections
+import json
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from shell_link import LazyLink
+from shell_link_header import ShellLinkHeader
+from reader import DEFAULT_LIMITS, Reader
+from scan import record
+
+SIGNATURE = ShellLinkHeader.SIGNATURE
+
+Carved = collections.namedtuple('Carved', [
+	'offset', 'size',
+	'record',	# scan.LinkRecord
+	'data',		# the carved bytes, if extracted
+])
+
+def _validate(reader, path, offset, extract):
+	""" Parses the candidate link at `offset`, None if invalid """
+	# Kept in its own frame so every view into the map is
+	# released when it returns
+	reader.restart()
+	try:
+		lnk = LazyLink(reader, offset)
+		size = lnk.index['end'] - offset
+		# Parsing the sections checks their sizes and offsets
+		lnk.LinkTargetIDList, lnk.LinkInfo, lnk.ExtraData
+		rec = record(f'{path}@{offset:#x}', size, lnk)
+	except (ValueError, UnicodeDecodeError):
+		return None
+	data = bytes(reader.mv[offset:offset + size]) if extract else None
+	return Carved(offset, size, rec, data)
+
+def carve_chunk(path, start, stop, max_size=1 << 20, extract=False):
+	""" Returns the valid links starting in [start, stop) of the image.
+		Links may extend past `stop`, hits are searched in the
+		signature sized overlap with the next chunk """
+	found = []
+	with open(path, 'rb') as f, \
+			mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+		if hasattr(mm, 'madvise'):
+			aligned = start - start % mmap.PAGESIZE
+			mm.madvise(mmap.MADV_SEQUENTIAL, aligned, stop - aligned)
+		# Every hit is untrusted, max_size is enforced while indexing
+		reader = Reader(mm, limits=DEFAULT_LIMITS._replace(
+			max_link_bytes=max_size))
+		search_end = min(stop + len(SIGNATURE) - 1, len(mm))
+		hit = mm.find(SIGNATURE, start, search_end)
+		while hit >= 0:
+			carved = _validate(reader, path, hit, extract)
+			if carved:
+				found.append(carved)
+			# Links can be embedded in others, so the
+			# search does not skip over valid hits
+			hit = mm.find(SIGNATURE, hit + 1, search_end)
+		del reader
+	return found
+
+def chunks(size, chunk_size):
+	""" (start, stop) ranges covering [0, size) """
+	return [(start, min(start + chunk_size, size))
+		for start in range(0, size, chunk_size)]
+
+def carve(path, workers=None, chunk_size=64 << 20, max_size=1 << 20,
+		extract=False):
+	""" Yields the lists of Carved links of each chunk of the image,
+		in image order
+
+		`workers` processes are used (os.cpu_count() by default), with
+		at most two chunks per worker in flight. workers=0 carves in
+		the calling process.
+	"""
+	size = os.path.getsize(path)
+	ranges = chunks(size, chunk_size)
+	if workers == 0:
+		for start, stop in ranges:
+			yield carve_chunk(path, start, stop, max_size, extract)
+		return
+
+	workers = workers or os.cpu_count() or 1
+	with ProcessPoolExecutor(workers) as pool:
+		pending = collections.deque()
+		for start, stop in ranges:
+			pending.append(pool.submit(carve_chunk, path, start, stop,
+				max_size, extract))
+			if len(pending) >= 2 * workers:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Carve links out of a raw '
+		'image and write one JSON record per link to stdout')
+	parser.add_argument('image')
+	parser.add_argument('-j', '--workers', type=int, default=None,
+		help='worker processes (default: CPU count, 0: no pool)')
+	parser.add_argument('-c', '--chunk-size', type=int, default=64,
+		help='chunk size in MiB (default: 64)')
+	parser.add_argument('-m', '--max-size', type=int, default=1 << 20,
+		help='largest link accepted, in bytes (default: 1 MiB)')
+	parser.add_argument('-o', '--output', metavar='DIR',
+		help='also write every carved link to DIR/<offset>.lnk')
+	args = parser.parse_args(argv)
+
+	if args.output:
+		os.makedirs(args.output, exist_ok=True)
+
+	out = sys.stdout
+	links = 0
+	start = time.perf_counter()
+	for batch in carve(args.image, args.workers, args.chunk_size << 20,
+			args.max_size, extract=bool(args.output)):
+		for carved in batch:
+			links += 1
+			out.write(json.dumps({'offset': carved.offset,
+				**carved.record._asdict()}) + '\n')
+			if args.output:
+				name = os.path.join(args.output, f'{carved.offset:012x}.lnk')
+				with open(name, 'wb') as f:
+					f.write(carved.data)
+
+	nbytes = os.path.getsize(args.image)
+	elapsed = max(time.perf_counter() - start, 1e-9)
+	print(f'{links} links in {nbytes / 1e6:.1f} MB in {elapsed:.2f}s: '
+		f'{nbytes / 1e6 / elapsed:.1f} MB/s', file=sys.stderr)
+
+if __name__ == '__main__':
+	main()
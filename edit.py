@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+""" In-place editing of serialized links
+
+LinkEditor edits a copy of a link's bytes without building its object
+graph. Only the section offsets are indexed when it is created. An
+edit serializes just the new value, splices it over the old bytes and
+fixes the size and offset fields depending on it (IDListSize,
+LinkInfoSize and the LinkInfo offsets, the section index). Bytes not
+edited are kept as they are.
+
+	ed = LinkEditor(data)
+	ed.set('WorkingDir', 'C:\\\\Windows')
+	ed.set('LocalBasePath', 'C:\\\\Windows\\\\notepad.exe')
+	ed.set('WriteTime', 0x01D9A2B3C4D5E6F7)
+	data = bytes(ed)
+
+	python3 edit.py FILE.lnk WorkingDir='C:\\\\Windows' [-o OUT.lnk]
+"""
+
+import argparse
+import os
+import stat
+import struct
+import sys
+import tempfile
+
+from constants import MAX_SHORT
+from filetime import FileTime
+from link_info import LinkInfo
+from linktarget_idlist import LinkTargetIDList
+from reader import Reader
+from shell_link import STRING_FIELDS, index_sections
+from shell_link_header import ShellLinkHeader, LinkFlags
+from string_data import ANSI_ENCODING
+from template import HEADER_SLOTS, STRING_SLOTS
+from validate import FLAG_BLOCKS
+
+# LinkInfo offset fields: name -> position in the LinkInfo header
+LINK_INFO_OFFSETS = {name: pos for layout in (LinkInfo.LAYOUT,
+	LinkInfo.UNICODE_LAYOUT) for name, (pos, _) in layout.offsets.items()
+	if name.endswith(('Offset', 'OffsetUnicode'))}
+
+# LinkInfo strings: name -> (offset field, wide)
+LINK_INFO_STRINGS = {
+	'LocalBasePath': ('LocalBasePathOffset', False),
+	'CommonPathSuffix': ('CommonPathSuffixOffset', False),
+	'LocalBasePathUnicode': ('LocalBasePathOffsetUnicode', True),
+	'CommonPathSuffixUnicode': ('CommonPathSuffixOffsetUnicode', True),
+}
+
+_U32 = struct.Struct('<I')
+_U16 = struct.Struct('<H')
+
+def _string_data(s, unicode):
+	""" A StringData section in the encoding IsUnicode gives, so that
+		the edited link still parses """
+	if not s.endswith('\x00'):
+		s += '\x00'
+	if len(s) > MAX_SHORT:
+		raise ValueError('`String` can not be longer than 0xffff')
+	return _U16.pack(len(s)) + s.encode('utf-16-le' if unicode
+		else ANSI_ENCODING)
+
+class LinkEditor():
+	""" Editable bytes of the link at `offset` of `data`, see the
+		module docstring. The link is copied once """
+
+	def __init__(self, data, offset=0):
+		reader = Reader(data)
+		header = ShellLinkHeader.from_buffer(reader, offset)
+		index = index_sections(reader, header, offset)
+		self.buf = bytearray(reader.mv[offset:index['end']])
+		del reader
+
+		# Section starts relative to the link
+		self.blocks = [block - offset for block in index.pop('DataBlocks')]
+		self.index = {name: start - offset for name, start in index.items()}
+
+	@classmethod
+	def from_file(cls, path):
+		with open(path, 'rb') as f:
+			return cls(f.read())
+
+	def __bytes__(self):
+		return bytes(self.buf)
+
+	def __len__(self):
+		return len(self.buf)
+
+	# Flags
+
+	def get(self, field_name):
+		return LinkFlags.from_int(_U32.unpack_from(self.buf, 0x14)[0]).get(
+			field_name)
+
+	def _set_flag(self, field_name, state):
+		flags = LinkFlags.from_int(_U32.unpack_from(self.buf, 0x14)[0])
+		flags.set(field_name, state)
+		flags.pack_into(self.buf, 0x14)
+
+	# Splicing
+
+	def _splice(self, start, end, data):
+		""" Replaces buf[start:end] with `data`, shifting the sections
+			starting at or after `end` """
+		delta = len(data) - (end - start)
+		self.buf[start:end] = data
+		if delta:
+			for name, pos in self.index.items():
+				if pos >= end:
+					self.index[name] = pos + delta
+			self.blocks = [pos + delta if pos >= end else pos
+				for pos in self.blocks]
+		return delta
+
+	def _section_end(self, name):
+		""" End of a section: the start of the next present one """
+		start = self.index[name]
+		return min(pos for key, pos in self.index.items() if pos > start)
+
+	# Edits
+
+	def set(self, name, value):
+		""" Sets a StringData field (None removes it), a LinkInfo string
+			(LocalBasePath also sets LocalBasePathUnicode if present),
+			the LinkTargetIDList (a LinkTargetIDList, a local path or
+			None) or one of the fixed header fields of
+			template.HEADER_SLOTS and FileAttributes """
+		if name in STRING_SLOTS:
+			self._set_string(name, value)
+		elif name in LINK_INFO_STRINGS:
+			self._set_link_info_string(name, value)
+		elif name == 'LinkTargetIDList':
+			self._set_idlist(value)
+		elif name in HEADER_SLOTS or name == 'FileAttributes':
+			self._set_header(name, value)
+		else:
+			raise ValueError(f'Field {name} can not be edited')
+		return self
+
+	def edit(self, **values):
+		for name, value in values.items():
+			self.set(name, value)
+		return self
+
+	def _set_header(self, name, value):
+		if isinstance(value, FileTime):
+			value = value.dwHighDateTime << 32 | value.dwLowDateTime
+		if name == 'FileAttributes':
+			offset, fmt = 0x18, _U32
+		else:
+			offset, fmt = HEADER_SLOTS[name]
+		value = int(value)
+		if not 0 <= value < 1 << 8 * fmt.size:
+			raise ValueError(f'{name} {value} does not fit in '
+				f'{8 * fmt.size} bits')
+		fmt.pack_into(self.buf, offset, value)
+
+	def _set_string(self, name, value):
+		flag = STRING_SLOTS[name]
+		present = name in self.index
+		if present:
+			start, end = self.index[name], self._section_end(name)
+		else:
+			# Before the next present string, or the ExtraData
+			later = [self.index[n] for _, n in
+				STRING_FIELDS[[n for _, n in STRING_FIELDS].index(name) + 1:]
+				if n in self.index]
+			start = end = min(later or [self.index['ExtraData']])
+
+		if value is None:
+			if present:
+				del self.index[name]
+				self._splice(start, end, b'')
+				self._set_flag(flag, 0)
+			return
+
+		data = _string_data(value, self.get('IsUnicode'))
+		self._splice(start, end, data)
+		if not present:
+			self._set_flag(flag, 1)
+			# Inserted before the sections at `start`, which moved
+			self.index[name] = start
+
+	def _set_idlist(self, value):
+		present = 'LinkTargetIDList' in self.index
+		if present:
+			start = self.index['LinkTargetIDList']
+			end = self._section_end('LinkTargetIDList')
+		else:
+			start = end = ShellLinkHeader.LAYOUT.size
+
+		if value is None:
+			if present:
+				del self.index['LinkTargetIDList']
+				self._splice(start, end, b'')
+				self._set_flag('HasLinkTargetIDList', 0)
+			return
+
+		if isinstance(value, str):
+			value = LinkTargetIDList.from_path(value)
+		self._splice(start, end, bytes(value))
+		if not present:
+			self._set_flag('HasLinkTargetIDList', 1)
+			self.index['LinkTargetIDList'] = start
+
+	def _link_info_offsets(self, base):
+		header_size, = _U32.unpack_from(self.buf, base + 4)
+		return {name: _U32.unpack_from(self.buf, base + pos)[0]
+			for name, pos in LINK_INFO_OFFSETS.items() if pos < header_size}
+
+	def _set_link_info_string(self, name, value):
+		if 'LinkInfo' not in self.index:
+			raise ValueError(f'{name} needs a LinkInfo')
+		base = self.index['LinkInfo']
+		offsets = self._link_info_offsets(base)
+		field, wide = LINK_INFO_STRINGS[name]
+		start = offsets.get(field)
+		if not start:
+			raise ValueError(f'The LinkInfo has no {name}')
+
+		# Like the parser, the string runs up to the next field
+		size, = _U32.unpack_from(self.buf, base)
+		end = min([o for o in offsets.values() if o > start] + [size])
+
+		text = value
+		if isinstance(value, str):
+			value = value.encode('utf-16-le' if wide else ANSI_ENCODING)
+		terminator = b'\x00\x00' if wide else b'\x00'
+		if not value.endswith(terminator) or (wide and len(value) % 2):
+			value += terminator
+
+		delta = self._splice(base + start, base + end, value)
+		if delta:
+			# The LinkInfo and the offsets of the fields after the string
+			_U32.pack_into(self.buf, base, size + delta)
+			for other, pos in LINK_INFO_OFFSETS.items():
+				if offsets.get(other, 0) > start:
+					_U32.pack_into(self.buf, base + pos,
+						offsets[other] + delta)
+
+		# Keeps the UTF-16 copy of the path, if any, in step
+		unicode = offsets.get('LocalBasePathOffsetUnicode')
+		if (name == 'LocalBasePath' and unicode and
+				list(offsets.values()).count(unicode) == 1):
+			if isinstance(text, bytes):
+				text = text.decode(ANSI_ENCODING)
+			self._set_link_info_string('LocalBasePathUnicode', text)
+
+	# ExtraData
+
+	def _find_block(self, signature):
+		for i, pos in enumerate(self.blocks):
+			if _U32.unpack_from(self.buf, pos + 4)[0] == signature:
+				return i
+		return None
+
+	def set_block(self, block):
+		""" Replaces the first block with the signature of `block`, or
+			adds it before the TerminalBlock. The LinkFlag announcing
+			the block, if any, is set """
+		i = self._find_block(block.Signature)
+		data = bytes(block)
+		if i is None:
+			start = end = self.index['end'] - 4
+		else:
+			start = self.blocks[i]
+			end = start + _U32.unpack_from(self.buf, start)[0]
+		extra_data = self.index['ExtraData']
+		self._splice(start, end, data)
+		if i is None:
+			# Appended: the ExtraData still starts at its first block
+			self.index['ExtraData'] = extra_data
+			self.blocks.append(start)
+		for flag, cls in FLAG_BLOCKS:
+			if cls.SIGNATURE == block.Signature:
+				self._set_flag(flag, 1)
+		return self
+
+	def remove_block(self, signature):
+		""" Removes the first block with `signature`, and clears its
+			LinkFlag if no other such block remains """
+		i = self._find_block(signature)
+		if i is None:
+			raise ValueError(f'No block with signature {signature:#x}')
+		start = self.blocks.pop(i)
+		self._splice(start, start + _U32.unpack_from(self.buf, start)[0], b'')
+		if self._find_block(signature) is None:
+			for flag, cls in FLAG_BLOCKS:
+				if cls.SIGNATURE == signature:
+					self._set_flag(flag, 0)
+		return self
+
+def edit_file(path, output=None, **values):
+	""" Edits the link at `path`, written to `output` (by default
+		`path`, replaced atomically with the same permissions) """
+	ed = LinkEditor.from_file(path).edit(**values)
+	output = output or path
+	directory = os.path.dirname(os.path.abspath(output))
+	# The permissions of the file replaced, or else of the original
+	mode = os.stat(output if os.path.exists(output) else path).st_mode
+	fd, tmp = tempfile.mkstemp(dir=directory, suffix='.lnk')
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			f.write(ed.buf)
+		# mkstemp() files are only readable by their owner
+		os.chmod(tmp, stat.S_IMODE(mode))
+		os.replace(tmp, output)
+	except BaseException:
+		os.unlink(tmp)
+		raise
+
+def _value(name, text):
+	""" A field value given on the command line """
+	if name in HEADER_SLOTS or name == 'FileAttributes':
+		return int(text, 0)
+	if name in STRING_SLOTS and text == '-':
+		return None
+	return text
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Edit fields of a .lnk '
+		'file in place')
+	parser.add_argument('path')
+	parser.add_argument('edits', nargs='+', metavar='FIELD=VALUE',
+		help='StringData fields (- removes them), LinkInfo strings, '
+			'LinkTargetIDList (a local path) or header fields '
+			'(' + ', '.join(HEADER_SLOTS) + ', FileAttributes)')
+	parser.add_argument('-o', '--output', help='write to OUTPUT instead')
+	args = parser.parse_args(argv)
+
+	values = {}
+	for edit in args.edits:
+		name, sep, text = edit.partition('=')
+		if not sep:
+			parser.error(f'{edit} is not FIELD=VALUE')
+		values[name] = _value(name, text)
+	try:
+		edit_file(args.path, args.output, **values)
+	except (OSError, ValueError) as e:
+		print(f'{args.path}: {e}', file=sys.stderr)
+		return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
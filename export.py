@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+""" Exports parsed links to Parquet, Arrow IPC or JSONL
+
+Records (scan.LinkRecord) are consumed from an iterator and written in
+batches of a fixed number of rows, one Parquet row group or Arrow record
+batch each, so memory use is bounded by the batch size. Parquet and
+Arrow need pyarrow, JSONL has no dependencies.
+
+	python3 export.py DIR_OR_FILE... -o links.parquet [-j WORKERS]
+
+Links parsed elsewhere are turned into records by scan.record().
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+
+try:
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+except ImportError:
+	pa = pq = None
+
+from scan import LinkRecord, scan
+
+FORMATS = {
+	'.parquet': 'parquet',
+	'.arrow': 'arrow',
+	'.feather': 'arrow',
+	'.jsonl': 'jsonl',
+	'.json': 'jsonl',
+}
+
+# FILETIME of 1970-01-01, in 100ns intervals since 1601-01-01
+UNIX_EPOCH_FILETIME = 116444736000000000
+TIME_FIELDS = ('CreationTime', 'AccessTime', 'WriteTime')
+
+def _unix_us(filetime):
+	""" FILETIME to microseconds since 1970, None for 0 """
+	if not filetime:
+		return None
+	return (filetime - UNIX_EPOCH_FILETIME) // 10
+
+def schema():
+	""" The Arrow schema of LinkRecord, FILETIMEs as UTC timestamps """
+	if pa is None:
+		raise ImportError('pyarrow is required for Parquet and Arrow output')
+	types = {
+		'size': pa.int64(),
+		'LinkFlags': pa.uint32(),
+		'FileAttributes': pa.uint32(),
+		'FileSize': pa.uint32(),
+		'IconIndex': pa.int32(),
+		'ShowCommand': pa.uint32(),
+		'DriveSerialNumber': pa.uint32(),
+	}
+	for name in TIME_FIELDS:
+		types[name] = pa.timestamp('us', tz='UTC')
+	return pa.schema([(name, types.get(name, pa.string()))
+		for name in LinkRecord._fields])
+
+def to_record_batch(records, arrow_schema=None):
+	""" Builds one Arrow RecordBatch from a list of LinkRecords """
+	arrow_schema = arrow_schema or schema()
+	columns = []
+	for i, field in enumerate(arrow_schema):
+		values = [rec[i] for rec in records]
+		if field.name in TIME_FIELDS:
+			values = [_unix_us(v) for v in values]
+		elif field.name == 'IconIndex':
+			# Stored as unsigned, a signed index per the specification
+			values = [v - (1 << 32) if v is not None and v >= 1 << 31
+				else v for v in values]
+		columns.append(pa.array(values, type=field.type))
+	return pa.RecordBatch.from_arrays(columns, schema=arrow_schema)
+
+def batches(records, batch_size):
+	""" Regroups an iterable of records in lists of `batch_size` """
+	records = iter(records)
+	while True:
+		batch = list(itertools.islice(records, batch_size))
+		if not batch:
+			return
+		yield batch
+
+def write_parquet(records, path, batch_size=65536):
+	""" Writes the records to a Parquet file, returns the row count """
+	arrow_schema = schema()
+	rows = 0
+	with pq.ParquetWriter(path, arrow_schema) as writer:
+		for batch in batches(records, batch_size):
+			writer.write_batch(to_record_batch(batch, arrow_schema))
+			rows += len(batch)
+	return rows
+
+def write_arrow(records, path, batch_size=65536):
+	""" Writes the records to an Arrow IPC file, returns the row count """
+	arrow_schema = schema()
+	rows = 0
+	with pa.OSFile(path, 'wb') as sink, \
+			pa.ipc.new_file(sink, arrow_schema) as writer:
+		for batch in batches(records, batch_size):
+			writer.write_batch(to_record_batch(batch, arrow_schema))
+			rows += len(batch)
+	return rows
+
+def write_jsonl(records, path, batch_size=65536):
+	""" Writes one JSON object per record, returns the row count.
+		`path` may also be a text file object """
+	if isinstance(path, (str, os.PathLike)):
+		with open(path, 'w', encoding='utf-8') as f:
+			return write_jsonl(records, f, batch_size)
+
+	rows = 0
+	for batch in batches(records, batch_size):
+		path.write(''.join(json.dumps(rec._asdict()) + '\n' for rec in batch))
+		rows += len(batch)
+	return rows
+
+WRITERS = {
+	'parquet': write_parquet,
+	'arrow': write_arrow,
+	'jsonl': write_jsonl,
+}
+
+def export(records, path, fmt=None, batch_size=65536):
+	""" Writes the records to `path` in `fmt` (parquet, arrow or
+		jsonl), by default guessed from the file extension """
+	if fmt is None:
+		fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+		if fmt is None:
+			raise ValueError(f'Unknown output format for {path}')
+	if fmt not in WRITERS:
+		raise ValueError(f'Unknown output format {fmt}')
+	if fmt != 'jsonl' and pa is None:
+		raise ImportError(f'pyarrow is required for {fmt} output, '
+			'use a .jsonl output instead')
+	return WRITERS[fmt](records, path, batch_size)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Parse .lnk files in bulk '
+		'and export them to Parquet, Arrow IPC or JSONL')
+	parser.add_argument('paths', nargs='+', help='files or directories')
+	parser.add_argument('-o', '--output', required=True,
+		help='output file, the format is taken from its extension '
+			'(.parquet, .arrow, .jsonl)')
+	parser.add_argument('-f', '--format', choices=sorted(WRITERS))
+	parser.add_argument('-j', '--workers', type=int, default=None,
+		help='worker processes (default: CPU count, 0: no pool)')
+	parser.add_argument('-b', '--batch-size', type=int, default=65536,
+		help='rows per row group / record batch (default: 65536)')
+	parser.add_argument('-p', '--pattern', default='*.lnk',
+		help='file name pattern in directories (default: *.lnk)')
+	args = parser.parse_args(argv)
+
+	records = itertools.chain.from_iterable(scan(args.paths, args.workers,
+		pattern=args.pattern))
+	try:
+		rows = export(records, args.output, args.format, args.batch_size)
+	except (ImportError, ValueError) as e:
+		parser.error(str(e))
+	print(f'{rows} records written to {args.output}', file=sys.stderr)
+
+if __name__ == '__main__':
+	main()
@@ -1,19 +1,43 @@
+""" ExtraData blocks
+
+EXTRA_DATA = *EXTRA_DATA_BLOCK TERMINAL_BLOCK
+
+Every block starts with its BlockSize and BlockSignature. Parsed blocks
+are kept as RawDataBlocks, which only slice the input, and are decoded
+into their class from DATA_BLOCKS when asked for (ExtraData.find or
+ExtraData.decode). Unknown blocks stay raw and are written back as-is.
+"""
+
 import struct
+import uuid
 
-# TODO: Not implemented yet, need to implement
-#		the different DataBlocks.
-#
-#		Currently only supports the TerminalBlock,
-#		which indicates the end of the the ExtraData
-#		structure.
+from layout import Layout
+from serialize import Tracked, to_bytes, pack_bytes
+from reader import Reader, LinkParseError
 
-class FileDataBlock():
+class FileDataBlock(Tracked):
 	""" Source: 010editor LNK template """
 
 	# MFT File Reference struct?
 	FILE_REFERENCE = 0x4B00000000006C57
 	SIGNATURE      = 0xBEEF0004
 
+	# Followed by the Name and VersionOffset
+	LAYOUT = Layout('FileDataBlock', [
+		('Size', 'H'),
+		('Version', 'H'),
+		('Signature', 'I'),
+		('Created', 'I'),
+		('Accessed', 'I'),
+		('Identifier', 'H'),
+		('Unknown0', 'H'),
+		('FileReference', 'Q'),
+		('Unknown1', 'Q'),
+		('LongStringSize', 'H'),
+		('Unknown2', 'I'),
+		('Unknown3', 'I'),
+	])
+
 	def __init__(self, fname):
 		self.Size = 0x0000			# Short
 		self.Version = 0x0009		# Short
@@ -32,36 +56,54 @@ class FileDataBlock():
 
 		self.VersionOffset = 0x14
 
-	def build(self):
-		bs = b''
-		bs += struct.pack('<HHIIIHHQQHII',
-				self.Size,
-				self.Version,
-				self.Signature,
-				self.Created,
-				self.Accessed,
-				self.Identifier,
-				self.Unknown0,
-				self.FileReference,
-				self.Unknown1,
-				self.LongStringSize,
-				self.Unknown2,
-				self.Unknown3)
-
-		bs += self.Name
-		bs += struct.pack('<H', self.VersionOffset)
-
-		self.Size = len(bs)
-		return bs
-
-	def __bytes__(self):
-		if not self.Size:
-			self.build()
-		return self.build()
-
-class EnvironmentVariableDataBlock():
-	SIGNATURE = 0xA0000001
-	MAX_LEN   = 259
+	def size(self):
+		self.Size = self.LAYOUT.size + len(self.Name) + 2
+		return self.Size
+
+	def pack_into(self, buf, offset):
+		offset = self.LAYOUT.pack_into(self, buf, offset)
+		offset = pack_bytes(buf, offset, self.Name)
+		struct.pack_into('<H', buf, offset, self.VersionOffset)
+
+		return offset + 2
+
+	__bytes__ = to_bytes
+
+# BlockSize and BlockSignature, common to every data block
+BLOCK_HEADER = Layout('ExtraData block', [
+	('Size', 'I'),
+	('Signature', 'I'),
+])
+
+class FixedDataBlock(Tracked):
+	""" Base class of the data blocks entirely described by their LAYOUT """
+
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		self = cls.__new__(cls)
+		cls.LAYOUT.unpack_into(self, reader, offset)
+		return self
+
+	def size(self):
+		self.Size = self.LAYOUT.size
+		return self.Size
+
+	def pack_into(self, buf, offset):
+		return self.LAYOUT.pack_into(self, buf, offset)
+
+	__bytes__ = to_bytes
+
+class EnvironmentVariableDataBlock(FixedDataBlock):
+	SIGNATURE  = 0xA0000001
+	BLOCK_SIZE = 0x314
+	MAX_LEN    = 259
+	LAYOUT = Layout('EnvironmentVariableDataBlock', [
+		('Size', 'I'),
+		('Signature', 'I'),
+		('TargetANSI', f'{MAX_LEN + 1}s'),
+		('TargetUnicode', f'{2 * (MAX_LEN + 1)}s'),
+	])
+
 	def __init__(self, target):
 		self.Size = 0
 		self.Signature = self.SIGNATURE
@@ -75,23 +117,37 @@ class EnvironmentVariableDataBlock():
 		self.TargetANSI = target.encode('ascii')
 		self.TargetUnicode = target.encode('utf-16-le')
 
-	def build(self):
-		bs = struct.pack('<II',
-				self.Size,
-				self.Signature) 
-		bs += self.TargetANSI
-		bs += self.TargetUnicode
-		self.Size = len(bs)
-
-		return bs
+class ConsoleDataBlock(FixedDataBlock):
+	SIGNATURE  = 0xA0000002
+	BLOCK_SIZE = 0xCC
+	LAYOUT = Layout('ConsoleDataBlock', [
+		('Size', 'I'),
+		('Signature', 'I'),
+		('FillAttributes', 'H'),
+		('PopupFillAttributes', 'H'),
+		('ScreenBufferSizeX', 'H'),
+		('ScreenBufferSizeY', 'H'),
+		('WindowSizeX', 'H'),
+		('WindowSizeY', 'H'),
+		('WindowOriginX', 'H'),
+		('WindowOriginY', 'H'),
+		('Unused0', 'I'),
+		('Unused1', 'I'),
+		('FontSize', 'I'),
+		('FontFamily', 'I'),
+		('FontWeight', 'I'),
+		('FaceName', '64s'),
+		('CursorSize', 'I'),
+		('FullScreen', 'I'),
+		('QuickEdit', 'I'),
+		('InsertMode', 'I'),
+		('AutoPosition', 'I'),
+		('HistoryBufferSize', 'I'),
+		('NumberOfHistoryBuffers', 'I'),
+		('HistoryNoDup', 'I'),
+		('ColorTable', '16I'),
+	])
 
-	def __bytes__(self):
-		if not self.Size:
-			self.build()
-		return self.build()
-
-class ConsoleDataBlock():
-	SIGNATURE = 0xA0000002
 	def __init__(self):
 		self.Size = 0
 		self.Signature = self.SIGNATURE
@@ -124,40 +180,265 @@ class ConsoleDataBlock():
 			0x000000FF, 0x00FF00FF, 0x0000FFFF, 0x00FFFFFF
 		]
 
-	def build(self):
-		bs = struct.pack('<2I8H5I',
-				self.Size, self.Signature,
-				self.FillAttributes, self.PopupFillAttributes,
-				self.ScreenBufferSizeX, self.ScreenBufferSizeY,
-				self.WindowSizeX, self.WindowSizeY,
-				self.WindowOriginX, self.WindowOriginY,
-				self.Unused0, self.Unused1,
-				self.FontSize, self.FontFamily, self.FontWeight)
-		# TODO: Seems to be more to this struct than just face name
-		bs += self.FaceName
-		bs += struct.pack('<8I',
-				self.CursorSize,
-				self.FullScreen,
-				self.QuickEdit,
-				self.InsertMode,
-				self.AutoPosition,
-				self.HistoryBufferSize,
-				self.NumberOfHistoryBuffers,
-				self.HistoryNoDup)
-
-		for c in self.ColorTable:
-			bs += struct.pack('<I', c)
-
-		self.Size = len(bs)
-		return bs
-
-	def __bytes__(self):
-		if not self.Size:
-			self.build()
-		return self.build()
-
-
-class ExtraData():
+class TrackerDataBlock(FixedDataBlock):
+	""" Distributed Link Tracking data of the link target """
+	SIGNATURE  = 0xA0000003
+	BLOCK_SIZE = 0x60
+	LAYOUT = Layout('TrackerDataBlock', [
+		('Size', 'I'),
+		('Signature', 'I'),
+		('Length', 'I'),			# Must be 0x58
+		('Version', 'I'),
+		('MachineID', '16s'),
+		('Droid', '32s'),			# 2 GUIDs: volume, object
+		('DroidBirth', '32s'),
+	])
+
+	def __init__(self, MachineID, Droid=bytes(32), DroidBirth=None):
+		if len(MachineID) > 15:
+			raise ValueError('`MachineID` is too long')
+		self.Size = 0
+		self.Signature = self.SIGNATURE
+		self.Length = 0x58
+		self.Version = 0
+		self.MachineID = MachineID.encode('ascii').ljust(16, b'\x00')
+		self.Droid = Droid
+		self.DroidBirth = Droid if DroidBirth is None else DroidBirth
+
+	@property
+	def machine(self):
+		""" The NetBIOS name of the machine the target was last on """
+		return bytes(self.MachineID).split(b'\x00', 1)[0].decode('latin-1')
+
+	@staticmethod
+	def _guids(bs):
+		bs = bytes(bs)
+		return uuid.UUID(bytes_le=bs[:16]), uuid.UUID(bytes_le=bs[16:32])
+
+	@property
+	def droid(self):
+		""" (volume, object) GUIDs """
+		return self._guids(self.Droid)
+
+	@property
+	def droid_birth(self):
+		return self._guids(self.DroidBirth)
+
+class ConsoleFEDataBlock(FixedDataBlock):
+	""" Code page of the console window """
+	SIGNATURE  = 0xA0000004
+	BLOCK_SIZE = 0xC
+	LAYOUT = Layout('ConsoleFEDataBlock', [
+		('Size', 'I'),
+		('Signature', 'I'),
+		('CodePage', 'I'),
+	])
+
+	def __init__(self, CodePage):
+		self.Size = 0
+		self.Signature = self.SIGNATURE
+		self.CodePage = CodePage
+
+class SpecialFolderDataBlock(FixedDataBlock):
+	""" Location of a special folder (CSIDL) in the LinkTargetIDList,
+		`Offset` is the offset of its ItemID in the IDList """
+	SIGNATURE  = 0xA0000005
+	BLOCK_SIZE = 0x10
+	LAYOUT = Layout('SpecialFolderDataBlock', [
+		('Size', 'I'),
+		('Signature', 'I'),
+		('SpecialFolderID', 'I'),
+		('Offset', 'I'),
+	])
+
+	def __init__(self, SpecialFolderID, Offset):
+		self.Size = 0
+		self.Signature = self.SIGNATURE
+		self.SpecialFolderID = SpecialFolderID
+		self.Offset = Offset
+
+class DarwinDataBlock(EnvironmentVariableDataBlock):
+	""" Application identifier used instead of the LinkTargetIDList,
+		same layout as the EnvironmentVariableDataBlock """
+	SIGNATURE = 0xA0000006
+
+class IconEnvironmentDataBlock(EnvironmentVariableDataBlock):
+	""" Icon path with environment variables, same layout as
+		the EnvironmentVariableDataBlock """
+	SIGNATURE = 0xA0000007
+
+class ShimDataBlock(Tracked):
+	""" Name of the shim layer applied when activating the target """
+	SIGNATURE  = 0xA0000008
+	BLOCK_SIZE = None		# At least 0x88
+
+	def __init__(self, LayerName):
+		self.Size = 0
+		self.Signature = self.SIGNATURE
+		self.LayerName = LayerName.encode('utf-16-le').ljust(0x80, b'\x00')
+
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		self = cls.__new__(cls)
+		BLOCK_HEADER.unpack_into(self, reader, offset)
+		if self.Size < 0x88:
+			raise LinkParseError(f'Invalid ShimDataBlock size {self.Size:#x}',
+				offset)
+		self.LayerName = reader.slice(offset + 8, offset + self.Size)
+		return self
+
+	def size(self):
+		self.Size = 8 + len(self.LayerName)
+		return self.Size
+
+	def pack_into(self, buf, offset):
+		offset = BLOCK_HEADER.pack_into(self, buf, offset)
+		return pack_bytes(buf, offset, self.LayerName)
+
+	__bytes__ = to_bytes
+
+class PropertyStoreDataBlock(Tracked):
+	""" Serialized property storage [MS-PROPSTORE], kept as bytes """
+	SIGNATURE  = 0xA0000009
+	BLOCK_SIZE = None		# At least 0xC
+
+	def __init__(self, PropertyStore):
+		self.Size = 0
+		self.Signature = self.SIGNATURE
+		self.PropertyStore = PropertyStore
+
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		self = cls.__new__(cls)
+		BLOCK_HEADER.unpack_into(self, reader, offset)
+		if self.Size < 0xC:
+			raise LinkParseError('Invalid PropertyStoreDataBlock size '
+				f'{self.Size:#x}', offset)
+		self.PropertyStore = reader.slice(offset + 8, offset + self.Size)
+		return self
+
+	def size(self):
+		self.Size = 8 + len(self.PropertyStore)
+		return self.Size
+
+	def pack_into(self, buf, offset):
+		offset = BLOCK_HEADER.pack_into(self, buf, offset)
+		return pack_bytes(buf, offset, self.PropertyStore)
+
+	__bytes__ = to_bytes
+
+class KnownFolderDataBlock(FixedDataBlock):
+	""" Location of a known folder in the LinkTargetIDList,
+		`Offset` is the offset of its ItemID in the IDList """
+	SIGNATURE  = 0xA000000B
+	BLOCK_SIZE = 0x1C
+	LAYOUT = Layout('KnownFolderDataBlock', [
+		('Size', 'I'),
+		('Signature', 'I'),
+		('KnownFolderID', '16s'),
+		('Offset', 'I'),
+	])
+
+	def __init__(self, KnownFolderID, Offset):
+		if len(KnownFolderID) != 16:
+			raise ValueError('`KnownFolderID` must be a 16 byte GUID')
+		self.Size = 0
+		self.Signature = self.SIGNATURE
+		self.KnownFolderID = KnownFolderID
+		self.Offset = Offset
+
+	@property
+	def guid(self):
+		return uuid.UUID(bytes_le=bytes(self.KnownFolderID))
+
+class VistaAndAboveIDListDataBlock(Tracked):
+	""" Alternate IDList used instead of the LinkTargetIDList
+		on Windows Vista and later """
+	SIGNATURE  = 0xA000000C
+	BLOCK_SIZE = None		# At least 0xA
+
+	def __init__(self, IDList):
+		self.Size = 0
+		self.Signature = self.SIGNATURE
+		self.IDList = IDList
+
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		# linktarget_idlist imports this module
+		from linktarget_idlist import IDList
+
+		self = cls.__new__(cls)
+		BLOCK_HEADER.unpack_into(self, reader, offset)
+		self.IDList = IDList.from_buffer(reader, offset + 8, offset + self.Size)
+		return self
+
+	def size(self):
+		self.Size = 8 + self.IDList.size()
+		return self.Size
+
+	def pack_into(self, buf, offset):
+		offset = BLOCK_HEADER.pack_into(self, buf, offset)
+		return self.IDList.pack_into(buf, offset)
+
+	__bytes__ = to_bytes
+
+class RawDataBlock(Tracked):
+	""" A data block kept as-is: blocks not decoded yet, and blocks
+		that are not implemented """
+	BLOCK_SIZE = None
+
+	def __init__(self, Signature, Data=b''):
+		self.Size = 0
+		self.Signature = Signature
+		self.Data = Data
+
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		self = cls.__new__(cls)
+		BLOCK_HEADER.unpack_into(self, reader, offset)
+		self.Data = reader.slice(offset + 8, offset + self.Size)
+		# Decoded from the source while unchanged
+		self._source = (reader, offset, self.Signature, self.Data)
+		return self
+
+	def size(self):
+		self.Size = 8 + len(self.Data)
+		return self.Size
+
+	def pack_into(self, buf, offset):
+		offset = BLOCK_HEADER.pack_into(self, buf, offset)
+		return pack_bytes(buf, offset, self.Data)
+
+	def decode(self):
+		""" Returns the block decoded into its class from DATA_BLOCKS,
+			or this block if the signature is unknown """
+		if self.Signature not in DATA_BLOCKS:
+			return self
+		reader, offset, signature, data = getattr(self, '_source',
+			(None, None, None, None))
+		if signature != self.Signature or data is not self.Data:
+			reader, offset = Reader(bytes(self)), 0
+		return ExtraData.block_from_buffer(reader, offset)
+
+	__bytes__ = to_bytes
+
+# Data blocks by BlockSignature. BLOCK_SIZE is the size a block must
+# have to be decoded, or None for variable size blocks
+DATA_BLOCKS = {block.SIGNATURE: block for block in (
+	EnvironmentVariableDataBlock,
+	ConsoleDataBlock,
+	TrackerDataBlock,
+	ConsoleFEDataBlock,
+	SpecialFolderDataBlock,
+	DarwinDataBlock,
+	IconEnvironmentDataBlock,
+	ShimDataBlock,
+	PropertyStoreDataBlock,
+	KnownFolderDataBlock,
+	VistaAndAboveIDListDataBlock,
+)}
+
+class ExtraData(Tracked):
 	""" ExtraData refers to a set of structures that convey
 		additional information about a link target. These
 		optional structes can be present in an extra data
@@ -167,9 +448,71 @@ class ExtraData():
 	def __init__(self):
 		self.DataBlocks = []
 
-	def __bytes__(self):
-		bs = b''
+	@staticmethod
+	def index(reader, offset):
+		""" Walks the block size prefixes up to the TerminalBlock
+			(size < 4), returns the block offsets and the end offset """
+		blocks = []
+		while True:
+			size, = reader.unpack_from('<I', offset, 'ExtraData')
+			if size < 4:
+				return blocks, offset + 4
+			if size < 8:
+				raise LinkParseError(f'Invalid BlockSize {size:#x}', offset)
+			reader.check(offset, size, 'ExtraData block')
+			reader.limit('max_section_bytes', size, offset)
+			reader.limit('max_blocks', len(blocks) + 1, offset)
+			blocks.append(offset)
+			offset += size
+
+	@staticmethod
+	def block_from_buffer(reader, offset):
+		""" Decodes the data block at `offset` """
+		size, signature = BLOCK_HEADER.unpack(reader, offset)
+		block = DATA_BLOCKS.get(signature, RawDataBlock)
+		if block.BLOCK_SIZE not in (None, size):
+			block = RawDataBlock
+		return block.from_buffer(reader, offset)
+
+	@classmethod
+	def from_buffer(cls, reader, offset, blocks=None):
+		""" `blocks` are the block offsets, if already indexed.
+			Blocks are not decoded, see find() and decode() """
+		if blocks is None:
+			blocks = cls.index(reader, offset)[0]
+
+		self = cls()
+		self.DataBlocks = [RawDataBlock.from_buffer(reader, block)
+			for block in blocks]
+		return self
+
+	def find(self, signature):
+		""" Returns the first block with `signature`, decoded, or None.
+			Blocks of a known signature with the wrong size are skipped """
+		for i, db in enumerate(self.DataBlocks):
+			if db.Signature == signature:
+				if isinstance(db, RawDataBlock):
+					db = self.DataBlocks[i] = db.decode()
+				if isinstance(db, RawDataBlock) and signature in DATA_BLOCKS:
+					continue
+				return db
+		return None
+
+	def decode(self):
+		""" Decodes every known block, returns the blocks """
+		self.DataBlocks = [db.decode() if isinstance(db, RawDataBlock) else db
+			for db in self.DataBlocks]
+		return self.DataBlocks
+
+	def size(self):
+		# Terminal Block
+		return sum(db.size() for db in self.DataBlocks) + 4
+
+	def pack_into(self, buf, offset):
 		for db in self.DataBlocks:
-			bs += bytes(db)
+			offset = db.pack_into(buf, offset)
+
+		struct.pack_into('<I', buf, offset, 0x0) # Terminal Block
+		return offset + 4
 
-		return bs + struct.pack('<I',0x0) # Terminal Block
+	__bytes__ = to_bytes
@@ -1,9 +1,26 @@
-import struct
+from serialize import Tracked, to_bytes
+from layout import Layout
+
+class FileTime(Tracked):
+	LAYOUT = Layout('FileTime', [
+		('dwLowDateTime', 'I'),
+		('dwHighDateTime', 'I'),
+	])
 
-class FileTime():
 	def __init__(self, lowDateTime, highDateTime):
 		self.dwLowDateTime = lowDateTime
 		self.dwHighDateTime = highDateTime
 
-	def __bytes__(self):
-		return struct.pack('<II', self.dwLowDateTime, self.dwHighDateTime)
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		self = cls.__new__(cls)
+		cls.LAYOUT.unpack_into(self, reader, offset)
+		return self
+
+	def size(self):
+		return self.LAYOUT.size
+
+	def pack_into(self, buf, offset):
+		return self.LAYOUT.pack_into(self, buf, offset)
+
+	__bytes__ = to_bytes
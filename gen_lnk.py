@@ -6,11 +6,9 @@ import sys
 import enum
 import os
 
-from shell_link_header import ShellLinkHeader
-from linktarget_idlist import LinkTargetIDList, RootShellItem, VolumeShellItem, FileShellItem
-from link_info import LinkInfo
-from string_data import StringData
-from extra_data import ExtraData, EnvironmentVariableDataBlock, ConsoleDataBlock
+from shell_link import Link
+from linktarget_idlist import RootShellItem, VolumeShellItem, FileShellItem
+from extra_data import EnvironmentVariableDataBlock, ConsoleDataBlock
 	
 from constants import DriveType, ShowCommand, CLSID, ShellItemType, FileShellItemTypeData
 
@@ -21,64 +19,11 @@ SHELL_LINK = SHELL_LINK_HEADER [LINKTARGET_IDLIST] [LINKINFO] [STRING_DATA] *EXT
 
 """
 
-logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 log = logging.getLogger('lnk_gen')
 
-class Link():
-	def __init__(self):
-		self.ShellLinkHeader = ShellLinkHeader()
-		self.LinkTargetIDList = LinkTargetIDList()
-		self.LinkInfo = LinkInfo()
-		self.ExtraData = ExtraData()
-
-		self.Name = 'name\x00'
-		self.RelativePath = 'relative_path\x00'
-		self.WorkingDir = 'working_dir\x00'
-		self.Arguments  = 'arguments\x00'
-		self.IconLocation = 'icon_location\x00'
-
-	# Setters/getters for LinkHeader flags
-	def get(self, field_name):
-		return self.ShellLinkHeader.LinkFlags.get(field_name)
-	def set(self, field_name, field_state):
-		self.ShellLinkHeader.LinkFlags.set(field_name, field_state)
-
-	def __bytes__(self):
-		bs = b''
-
-		# SHELL_LINK_HEADER (done)
-		bs += bytes(self.ShellLinkHeader)
-
-		# [LINKTARGET_IDLIST] (done)
-		if self.get('HasLinkTargetIDList'):
-			bs += bytes(self.LinkTargetIDList)
-
-		# [LINKINFO]
-		if self.get('HasLinkInfo'):
-			bs += bytes(self.LinkInfo)
-
-		# [STRING_DATA] (done)
-		# Fail in 010 cause it only supports wchar_t
-		if self.get('HasName'):
-			bs += bytes(StringData(self.Name))
-		if self.get('HasRelativePath'):
-			bs += bytes(StringData(self.RelativePath))
-		if self.get('HasWorkingDir'):
-			bs += bytes(StringData(self.WorkingDir))
-		if self.get('HasArguments'):
-			bs += bytes(StringData(self.Arguments))
-		if self.get('HasIconLocation'):
-			bs += bytes(StringData(self.IconLocation))
-
-		# *EXTRA_DATA
-		bs += bytes(self.ExtraData)
-
-		return bs
-
 def example():
 	""" Generates the sample file in the specification,
-		pointing to `C:\\test\\a.txt`
-		Currently no unicode! """
+		pointing to `C:\\test\\a.txt` """
 
 	lnk = Link()
 
@@ -87,8 +32,7 @@ def example():
 	lnk.set('HasLinkInfo', 1)
 	lnk.set('HasRelativePath', 1)
 	lnk.set('HasWorkingDir', 1)
-	# TODO: Implement full Unicode support
-	# lnk.set('HasUnicode', 1)
+	lnk.set('IsUnicode', 1)
 	lnk.set('EnableTargetMetadata', 1)
 	
 	lnk.ShellLinkHeader.FileAttributes.set('FILE_ATTRIBUTE_ARCHIVE', 1)
@@ -160,9 +104,10 @@ def malicious():
 	return lnk
 
 if __name__ == '__main__':
+	# stdout holds the link
+	logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
 	lnk = malicious()
 
-	bs = bytes(lnk)
-	sys.stdout.buffer.write(bs)
+	lnk.write_to(sys.stdout.buffer)
 
 		
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+""" Generates links in bulk from JSONL or CSV specs
+
+One spec per line (JSONL) or row (CSV, with a header row). Every key is
+optional:
+
+	base		start from gen_lnk.example() or gen_lnk.malicious()
+	output		file name in the output directory, default N.lnk;
+				not a path
+	flags		LinkFlags to set, a {name: 0 or 1} object or
+				names joined with '|'
+	attributes	FileAttributes to set, as flags
+	target		local path of the target, builds the LinkTargetIDList
+				and the LinkInfo
+	serial		DriveSerialNumber of the target volume
+	Name, RelativePath, WorkingDir, Arguments, IconLocation
+				StringData, their Has* flag and IsUnicode (unless
+				given in flags) are set
+	CreationTime, AccessTime, WriteTime
+				FILETIMEs, as integers
+	FileSize, IconIndex, ShowCommand
+	extra		list of ExtraData blocks, {"block": class name, ...}
+				with the constructor arguments of the block; GUIDs
+				are strings and PropertyStore is hex. Blocks with a
+				LinkFlag (HasExpString...) set it
+
+In CSV, `extra` holds the JSON list and empty cells are ignored. Specs
+that can not be read or built are reported with their index and skipped.
+
+	python3 generate.py specs.jsonl -o OUT_DIR [-j WORKERS]
+	python3 generate.py specs.csv -a links.bin
+	echo '{"target": "C:\\\\a.txt"}' | python3 generate.py - -a - > a.lnk
+
+The library is only imported once specs are read, and by the workers.
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import struct
+import sys
+
+STRINGS = ('Name', 'RelativePath', 'WorkingDir', 'Arguments', 'IconLocation')
+TIMES = ('CreationTime', 'AccessTime', 'WriteTime')
+INTEGERS = ('FileSize', 'IconIndex', 'ShowCommand', 'serial', *TIMES)
+
+def _names(value):
+	""" {name: state} of a flags spec """
+	if isinstance(value, str):
+		return {name.strip(): 1 for name in value.split('|') if name.strip()}
+	return dict(value)
+
+def _guid(value):
+	import uuid
+	return uuid.UUID(value).bytes_le
+
+def _droid(value):
+	""" A droid, given as its two GUIDs """
+	return b''.join(map(_guid, value))
+
+# Spec values of block constructor arguments that are not plain
+BLOCK_ARGS = {
+	'KnownFolderID': _guid,
+	'Droid': _droid,
+	'DroidBirth': _droid,
+	'PropertyStore': bytes.fromhex,
+}
+
+def _block(spec):
+	from extra_data import DATA_BLOCKS
+
+	spec = dict(spec)
+	name = spec.pop('block', None)
+	classes = {cls.__name__: cls for cls in DATA_BLOCKS.values()}
+	if name not in classes:
+		raise ValueError(f'Unknown ExtraData block {name}')
+	kwargs = {key: BLOCK_ARGS[key](value) if key in BLOCK_ARGS else value
+		for key, value in spec.items()}
+	return classes[name](**kwargs)
+
+def _set_target(lnk, path, serial, attributes):
+	from constants import DriveType
+	from linktarget_idlist import LinkTargetIDList
+
+	lnk.LinkTargetIDList = LinkTargetIDList.from_path(path, attributes)
+	lnk.set('HasLinkTargetIDList', 1)
+
+	lnk.set('HasLinkInfo', 1)
+	lnk.LinkInfo.set('VolumeIDAndLocalBasePath', 1)
+	lnk.LinkInfo.VolumeID.DriveType = DriveType.DRIVE_FIXED.value
+	lnk.LinkInfo.VolumeID.DriveSerialNumber = serial
+	lnk.LinkInfo.VolumeID.Data = b'\x00'
+	lnk.LinkInfo.LocalBasePath = path.encode('ascii') + b'\x00'
+	lnk.LinkInfo.CommonPathSuffix = b'\x00'
+
+def build(spec):
+	""" Builds the Link described by a spec, see the module docstring """
+	import gen_lnk
+	from filetime import FileTime
+	from shell_link import Link
+	from validate import FLAG_BLOCKS
+
+	spec = {key: value for key, value in spec.items()
+		if value is not None and value != ''}
+	unknown = set(spec) - {'base', 'output', 'flags', 'attributes', 'target',
+		'extra', *STRINGS, *INTEGERS}
+	if unknown:
+		raise ValueError(f'Unknown spec keys {", ".join(sorted(unknown))}')
+
+	base = spec.get('base')
+	if base is None:
+		lnk = Link()
+	elif base in ('example', 'malicious'):
+		lnk = getattr(gen_lnk, base)()
+	else:
+		raise ValueError(f'Unknown base {base}')
+	header = lnk.ShellLinkHeader
+
+	flags = _names(spec.get('flags', {}))
+	for name, state in flags.items():
+		lnk.set(name, int(state))
+	attributes = _names(spec.get('attributes', {}))
+	header.FileAttributes.set_many({name: int(state)
+		for name, state in attributes.items()})
+
+	if 'target' in spec:
+		_set_target(lnk, spec['target'], spec.get('serial', 0),
+			attributes or None)
+
+	for name in STRINGS:
+		if name in spec:
+			lnk.set(f'Has{name}', 1)
+			setattr(lnk, name, spec[name])
+			# Any string can be written as UTF-16
+			if 'IsUnicode' not in flags:
+				lnk.set('IsUnicode', 1)
+
+	for name in TIMES:
+		if name in spec:
+			value = spec[name]
+			setattr(header, name, FileTime(value & 0xFFFFFFFF, value >> 32))
+	for name in ('FileSize', 'IconIndex', 'ShowCommand'):
+		if name in spec:
+			setattr(header, name, spec[name])
+
+	extra = spec.get('extra', [])
+	block_flags = {block: flag for flag, block in FLAG_BLOCKS}
+	for block_spec in extra:
+		block = _block(block_spec)
+		lnk.ExtraData.DataBlocks.append(block)
+		if type(block) in block_flags:
+			lnk.set(block_flags[type(block)], 1)
+	return lnk
+
+def _csv_spec(row):
+	spec = {key: value for key, value in row.items() if value}
+	for key in INTEGERS:
+		if key in spec:
+			spec[key] = int(spec[key], 0)
+	if 'extra' in spec:
+		spec['extra'] = json.loads(spec['extra'])
+	return spec
+
+def _json_spec(line):
+	spec = json.loads(line)
+	if not isinstance(spec, dict):
+		raise ValueError('A spec must be a JSON object')
+	return spec
+
+def read_specs(f, fmt='jsonl'):
+	""" Yields the specs of a text file object, one at a time. A line
+		or row that can not be read is yielded as its ValueError """
+	if fmt == 'csv':
+		rows, parse = csv.DictReader(f), _csv_spec
+	else:
+		rows, parse = (line for line in f if line.strip()), _json_spec
+	for row in rows:
+		try:
+			yield parse(row)
+		except ValueError as e:
+			yield e
+
+def _output_path(directory, spec, index):
+	name = spec.get('output', f'{index}.lnk')
+	if (not isinstance(name, str) or name in ('', '.', '..') or
+			os.path.basename(name) != name):
+		raise ValueError(f'Invalid output name {name!r}')
+	return os.path.join(directory, name)
+
+def render_batch(batch, directory=None):
+	""" Builds the (index, spec) pairs of `batch`. Returns their
+		(index, bytes, error), the bytes are written to `directory`
+		instead if given and None is returned in their place """
+	results = []
+	for index, spec in batch:
+		try:
+			if isinstance(spec, ValueError):
+				raise spec
+			data = bytes(build(spec))
+			if directory is not None:
+				with open(_output_path(directory, spec, index), 'wb') as f:
+					f.write(data)
+				data = None
+		except (OSError, ValueError, TypeError, struct.error) as e:
+			results.append((index, None, f'{type(e).__name__}: {e}'))
+		else:
+			results.append((index, data, None))
+	return results
+
+def _batches(iterable, batch_size):
+	iterable = iter(iterable)
+	while True:
+		batch = list(itertools.islice(iterable, batch_size))
+		if not batch:
+			return
+		yield batch
+
+def generate(specs, directory=None, workers=None, batch_size=64):
+	""" Builds the specs in `workers` processes (os.cpu_count() by
+		default, 0 in this process), yielding the render_batch()
+		results of every batch in order. At most two batches per
+		worker are in flight """
+	batches = _batches(enumerate(specs), batch_size)
+	if workers == 0:
+		for batch in batches:
+			yield render_batch(batch, directory)
+		return
+
+	import collections
+	from concurrent.futures import ProcessPoolExecutor
+
+	workers = workers or os.cpu_count() or 1
+	with ProcessPoolExecutor(workers) as pool:
+		pending = collections.deque()
+		for batch in batches:
+			pending.append(pool.submit(render_batch, batch, directory))
+			if len(pending) >= 2 * workers:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__,
+		formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('specs', help="spec file, '-' for stdin")
+	parser.add_argument('-f', '--format', choices=('jsonl', 'csv'),
+		help='spec format (default: from the extension, jsonl for stdin)')
+	out = parser.add_mutually_exclusive_group(required=True)
+	out.add_argument('-o', '--output', metavar='DIR',
+		help='write one file per spec to DIR')
+	out.add_argument('-a', '--archive', metavar='FILE',
+		help="write the links back to back to FILE, '-' for stdout")
+	parser.add_argument('-j', '--workers', type=int, default=None,
+		help='worker processes (default: CPU count, 0: no pool)')
+	parser.add_argument('-b', '--batch-size', type=int, default=64)
+	args = parser.parse_args(argv)
+
+	fmt = args.format
+	if fmt is None:
+		fmt = 'csv' if args.specs.lower().endswith('.csv') else 'jsonl'
+	if args.specs == '-':
+		spec_file = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8',
+			newline='')
+	else:
+		spec_file = open(args.specs, encoding='utf-8', newline='')
+
+	if args.output:
+		os.makedirs(args.output, exist_ok=True)
+		archive = None
+	elif args.archive == '-':
+		archive = sys.stdout.buffer
+	else:
+		archive = open(args.archive, 'wb')
+
+	links = errors = 0
+	with spec_file:
+		for batch in generate(read_specs(spec_file, fmt), args.output,
+				args.workers, args.batch_size):
+			for index, data, error in batch:
+				if error:
+					errors += 1
+					print(f'spec {index}: {error}', file=sys.stderr)
+					continue
+				links += 1
+				if archive is not None:
+					archive.write(data)
+	if archive is not None and archive is not sys.stdout.buffer:
+		archive.close()
+	print(f'{links} links written, {errors} errors', file=sys.stderr)
+	return 1 if errors else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,263 @@
+""" Reads the links stored in Jump List files
+
+*.automaticDestinations-ms files are OLE compound files [MS-CFB] with
+one link per numbered stream, next to a DestList stream.
+*.customDestinations-ms files hold links back to back, separated by
+category headers and footers.
+
+	for name, lnk in jumplist.iter_links(path):
+		...
+
+The file is memory-mapped and links are parsed in place when their
+stream is stored contiguously, otherwise the stream is assembled first.
+The map is closed when the last link referencing it is released.
+"""
+
+import array
+import collections
+import mmap
+import sys
+
+from layout import Layout
+from reader import Reader, LinkParseError
+from shell_link import Link, index_sections
+from shell_link_header import ShellLinkHeader
+
+SIGNATURE = ShellLinkHeader.SIGNATURE
+
+CFB_SIGNATURE = bytes.fromhex('D0CF11E0A1B11AE1')
+
+# Special sector numbers
+MAXREGSECT = 0xFFFFFFFA
+ENDOFCHAIN = 0xFFFFFFFE
+NOSTREAM   = 0xFFFFFFFF
+
+# Directory entry object types
+STREAM_OBJECT = 2
+ROOT_STORAGE_OBJECT = 5
+
+DirEntry = collections.namedtuple('DirEntry', [
+	'id', 'name', 'type', 'start', 'size'])
+
+class CompoundFile():
+	""" A read-only OLE compound file
+
+		The FAT and MiniFAT are loaded when opened, directory entries
+		are read as they are iterated and streams when they are opened.
+	"""
+
+	HEADER = Layout('CompoundFileHeader', [
+		('Signature', '8s'),
+		('CLSID', '16s'),
+		('MinorVersion', 'H'),
+		('MajorVersion', 'H'),
+		('ByteOrder', 'H'),
+		('SectorShift', 'H'),
+		('MiniSectorShift', 'H'),
+		(None, '6x'),
+		('NumDirectorySectors', 'I'),
+		('NumFATSectors', 'I'),
+		('FirstDirectorySector', 'I'),
+		('TransactionSignature', 'I'),
+		('MiniStreamCutoff', 'I'),
+		('FirstMiniFATSector', 'I'),
+		('NumMiniFATSectors', 'I'),
+		('FirstDIFATSector', 'I'),
+		('NumDIFATSectors', 'I'),
+		('DIFAT', '109I'),
+	])
+
+	DIRECTORY_ENTRY = Layout('DirectoryEntry', [
+		('Name', '64s'),
+		('NameLength', 'H'),
+		('ObjectType', 'B'),
+		('ColorFlag', 'B'),
+		('LeftSiblingID', 'I'),
+		('RightSiblingID', 'I'),
+		('ChildID', 'I'),
+		('CLSID', '16s'),
+		('StateBits', 'I'),
+		('CreationTime', 'Q'),
+		('ModifiedTime', 'Q'),
+		('StartingSector', 'I'),
+		('StreamSize', 'Q'),
+	])
+
+	def __init__(self, data):
+		self.reader = data if isinstance(data, Reader) else Reader(data)
+		self.HEADER.unpack_into(self, self.reader, 0)
+		if bytes(self.Signature) != CFB_SIGNATURE:
+			raise LinkParseError('Invalid compound file signature', 0)
+		if self.ByteOrder != 0xFFFE:
+			raise LinkParseError(f'Invalid byte order {self.ByteOrder:#x}', 0x1C)
+		if self.SectorShift not in (9, 12) or self.MiniSectorShift != 6:
+			raise LinkParseError('Invalid sector size', 0x1E)
+		self.sector_size = 1 << self.SectorShift
+
+		self.fat = self._table(self._fat_sectors())
+		self.minifat = self._table(self.chain(self.FirstMiniFATSector))
+
+		root = next(self.entries(), None)
+		if root is None or root.type != ROOT_STORAGE_OBJECT:
+			raise LinkParseError('Missing root directory entry')
+		self._ministream = self.chain(root.start)
+
+	def _offset(self, sector):
+		offset = (sector + 1) << self.SectorShift
+		self.reader.check(offset, self.sector_size, 'sector')
+		return offset
+
+	def _fat_sectors(self):
+		""" Sectors holding the FAT, listed by the DIFAT """
+		per_sector = self.sector_size // 4 - 1
+		sectors = self.DIFAT[:self.NumFATSectors]
+		difat = self.FirstDIFATSector
+		count = (self.reader.end >> self.SectorShift) - 1
+		seen = set()
+		# NumDIFATSectors is not trusted, the walk stops once
+		# the FAT is complete
+		while len(sectors) < self.NumFATSectors and difat < MAXREGSECT:
+			if difat in seen or difat >= count:
+				raise LinkParseError(f'Invalid DIFAT chain at {difat:#x}')
+			seen.add(difat)
+			entries = self._table([difat])
+			sectors += entries[:per_sector]
+			difat = entries[per_sector]
+		return [s for s in sectors[:self.NumFATSectors] if s < MAXREGSECT]
+
+	def _table(self, sectors):
+		""" The little-endian 32 bit entries of `sectors` """
+		table = array.array('I')
+		for sector in sectors:
+			offset = self._offset(sector)
+			table.frombytes(self.reader.mv[offset:offset + self.sector_size])
+		if sys.byteorder == 'big':
+			table.byteswap()
+		return table
+
+	def chain(self, start, fat=None):
+		""" The sectors of the chain starting at `start` """
+		fat = self.fat if fat is None else fat
+		sectors = []
+		sector = start
+		while sector < MAXREGSECT:
+			if sector >= len(fat) or len(sectors) > len(fat):
+				raise LinkParseError(f'Invalid sector chain at {sector:#x}')
+			sectors.append(sector)
+			sector = fat[sector]
+		return sectors
+
+	def entries(self):
+		""" Yields the directory entries in storage order """
+		size = self.DIRECTORY_ENTRY.size
+		index = 0
+		for sector in self.chain(self.FirstDirectorySector):
+			offset = self._offset(sector)
+			for pos in range(offset, offset + self.sector_size, size):
+				(name, nameLength, objectType, _, _, _, _, _, _, _, _,
+				 start, streamSize) = self.DIRECTORY_ENTRY.unpack(
+					self.reader, pos)
+				if objectType:
+					length = min(max(nameLength - 2, 0), 64)
+					if self.MajorVersion == 3:
+						streamSize &= 0xFFFFFFFF
+					yield DirEntry(index,
+						str(name[:length], 'utf-16-le', 'replace'),
+						objectType, start, streamSize)
+				index += 1
+
+	def streams(self):
+		""" Yields the stream directory entries """
+		for entry in self.entries():
+			if entry.type == STREAM_OBJECT:
+				yield entry
+
+	def _ranges(self, entry):
+		""" File ranges holding the stream, adjacent ranges merged """
+		if entry.size < self.MiniStreamCutoff:
+			unit = 64
+			offsets = []
+			for mini in self.chain(entry.start, self.minifat):
+				pos = mini << 6
+				index = pos >> self.SectorShift
+				if index >= len(self._ministream):
+					raise LinkParseError('Mini sector out of the mini stream')
+				offsets.append(self._offset(self._ministream[index]) +
+					(pos & (self.sector_size - 1)))
+		else:
+			unit = self.sector_size
+			offsets = [self._offset(s) for s in self.chain(entry.start)]
+
+		ranges = []
+		remaining = entry.size
+		for offset in offsets:
+			if remaining <= 0:
+				break
+			length = min(unit, remaining)
+			remaining -= length
+			if ranges and ranges[-1][1] == offset:
+				ranges[-1][1] += length
+			else:
+				ranges.append([offset, offset + length])
+		if remaining > 0:
+			raise LinkParseError(f'Stream {entry.name} is truncated')
+		return ranges
+
+	def open(self, entry):
+		""" A (Reader, offset) pair for the stream, sharing the file
+			buffer when the stream is stored contiguously """
+		ranges = self._ranges(entry)
+		if len(ranges) == 1:
+			start, stop = ranges[0]
+			return Reader(self.reader.data, end=stop), start
+		data = b''.join(self.reader.mv[start:stop] for start, stop in ranges)
+		return Reader(data), 0
+
+def _map(path):
+	with open(path, 'rb') as f:
+		# Not closed explicitly: links keep views into the map
+		return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def iter_automatic(data, cls=Link):
+	""" Yields (stream name, link) for the links of an
+		automaticDestinations compound file. Streams that do not hold
+		a valid link are skipped """
+	cfb = CompoundFile(data)
+	for entry in cfb.streams():
+		try:
+			reader, offset = cfb.open(entry)
+			if reader.mv[offset:offset + len(SIGNATURE)] != SIGNATURE:
+				continue	# DestList
+			lnk = cls.from_bytes(reader, offset)
+		except ValueError:
+			continue
+		yield entry.name, lnk
+
+def iter_custom(data, cls=Link):
+	""" Yields (offset, link) for the links of a customDestinations
+		file, found by their header signature """
+	reader = data if isinstance(data, Reader) else Reader(data)
+	offset = reader.find(SIGNATURE)
+	while offset >= 0:
+		try:
+			header = ShellLinkHeader.from_buffer(reader, offset)
+			end = index_sections(reader, header, offset)['end']
+			lnk = cls.from_bytes(reader, offset)
+		except ValueError:
+			end = offset + 1
+		else:
+			yield offset, lnk
+		offset = reader.find(SIGNATURE, end)
+
+def iter_links(path, cls=Link):
+	""" Yields (name, link) for each link of a Jump List file, the
+		stream name or the offset of the link in the file. `cls`
+		is Link or another class with from_bytes(reader, offset) """
+	try:
+		mm = _map(path)
+	except ValueError:		# Empty file
+		return
+	if mm[:len(CFB_SIGNATURE)] == CFB_SIGNATURE:
+		yield from iter_automatic(mm, cls)
+	else:
+		yield from iter_custom(mm, cls)
@@ -0,0 +1,158 @@
+""" Declarative layouts of fixed size structures
+
+A structure declares its fields once, in file order, and the Layout
+generates the struct.Struct objects and the functions reading and
+writing them, shared by the parser and the serializer:
+
+	LAYOUT = Layout('FileTime', [
+		('dwLowDateTime', 'I'),
+		('dwHighDateTime', 'I'),
+	])
+	LAYOUT.unpack_into(obj, reader, offset)	# sets obj.dwLowDateTime, ...
+	LAYOUT.pack_into(obj, buf, offset)		# returns the end offset
+
+Fields are little-endian. A format is one struct code (B, H, I, Q and
+the signed variants) for an integer, 'Ns' for N raw bytes, 'NI' (any
+integer code) for a list of N integers, or 'Nx' for N bytes of padding,
+with a name of None. A class with a LAYOUT of integer fields, like
+FileTime, is a nested structure: its fields are inlined and read into a
+new instance.
+
+Raw byte fields are read as zero-copy views of the source buffer. When
+packed, they must have the exact size of the field.
+
+A structure whose trailing fields are optional declares them in a second
+Layout with `start`, the offset of its first field in the structure. Its
+codecs still take the offset of the structure, and `offsets` are
+relative to the structure.
+"""
+
+import re
+import struct
+
+_FORMAT = re.compile(r'(\d*)([xBbHhIiQqs])')
+
+def _exact(value, size, field):
+	""" The bytes of a raw field, which struct would silently pad
+		or truncate """
+	value = bytes(value)
+	if len(value) != size:
+		raise ValueError(f'{field} must be {size} bytes, not {len(value)}')
+	return value
+
+class Layout():
+	""" A fixed size layout and its generated codecs """
+
+	def __init__(self, name, fields, start=0):
+		self.name = name
+		self.fields = tuple(fields)
+		self.start = start
+		self.offsets = {}	# field -> (offset, format)
+
+		pack_fmt = unpack_fmt = '<'
+		pack_args = []
+		assigns = []
+		nested = {}	# namespace name -> class of nested structures
+		pos = start	# byte offset of the field
+		index = 0	# index of the field in the unpacked values
+		for field, fmt in self.fields:
+			if not isinstance(fmt, str):
+				cls = fmt
+				inner = [(f, code) for f, code in cls.LAYOUT.fields]
+				if any(f is None or not _FORMAT.fullmatch(code) or
+						code[-1] in 'xs' or code[:-1] for f, code in inner):
+					raise ValueError(f'Nested {cls.__name__} must only '
+						'have integer fields')
+				fmt = ''.join(code for _, code in inner)
+				size = struct.calcsize('<' + fmt)
+				pack_fmt += fmt
+				unpack_fmt += fmt
+				self.offsets[field] = (pos, fmt)
+
+				t = f'_t{len(nested)}'
+				nested[t] = cls
+				assigns.append(f'obj.{field} = x = {t}.__new__({t})')
+				for f, _ in inner:
+					pack_args.append(f'obj.{field}.{f}')
+					assigns.append(f'x.{f} = v[{index}]')
+					index += 1
+				pos += size
+				continue
+
+			m = _FORMAT.fullmatch(fmt)
+			if not m:
+				raise ValueError(f'Invalid format {fmt!r} for {field}')
+			count, code = m.groups()
+			size = struct.calcsize('<' + fmt)
+			pack_fmt += fmt
+
+			if code == 'x':
+				if field is not None:
+					raise ValueError(f'Padding can not be named ({field})')
+				unpack_fmt += fmt
+				pos += size
+				continue
+			if field is None or not field.isidentifier():
+				raise ValueError(f'Invalid field name {field!r}')
+			self.offsets[field] = (pos, fmt)
+
+			pack_args.append(f'obj.{field}')
+			if code == 's':
+				# Skipped by the unpack struct, sliced instead.
+				# struct only packs bytes, not views
+				pack_args[-1] = f'_exact(obj.{field}, {size}, {field!r})'
+				unpack_fmt += f'{size}x'
+				assigns.append(f'obj.{field} = mv[offset + {pos}:'
+					f'offset + {pos + size}]')
+			elif count:
+				unpack_fmt += fmt
+				pack_args[-1] = f'*obj.{field}'
+				assigns.append(f'obj.{field} = list(v[{index}:'
+					f'{index + int(count)}])')
+				index += int(count)
+			else:
+				unpack_fmt += fmt
+				assigns.append(f'obj.{field} = v[{index}]')
+				index += 1
+			pos += size
+
+		self.struct = struct.Struct(pack_fmt)
+		self.size = self.struct.size
+		self.end = start + self.size
+		self._unpack = struct.Struct(unpack_fmt)
+
+		body = '\n\t'.join(assigns) or 'pass'
+		src = (
+			f'def unpack_into(obj, reader, offset):\n'
+			f'\tv = reader.unpack_from(_unpack, offset + {start}, _name)\n'
+			f'\tmv = reader.mv\n'
+			f'\t{body}\n'
+			f'\n'
+			f'def pack_into(obj, buf, offset):\n'
+			f'\t_pack_into(buf, offset + {start}, {", ".join(pack_args)})\n'
+			f'\treturn offset + {self.end}\n')
+		namespace = {
+			'_unpack': self._unpack,
+			'_name': name,
+			'_pack_into': self.struct.pack_into,
+			'_exact': _exact,
+			**nested,
+		}
+		exec(compile(src, f'<layout {name}>', 'exec'), namespace)
+
+		self.unpack_into = namespace['unpack_into']
+		self.unpack_into.__doc__ = f""" Reads a {name} at `offset` of the
+			Reader into the attributes of `obj` """
+		self.pack_into = namespace['pack_into']
+		self.pack_into.__doc__ = f""" Writes the attributes of `obj` as a
+			{name} into `buf` at `offset`, returns the end offset """
+
+	def unpack(self, reader, offset):
+		""" Returns the field values of the structure at `offset`
+			of the Reader as a tuple, without the padding """
+		return reader.unpack_from(self.struct, offset + self.start,
+			self.name)
+
+	def __repr__(self):
+		start = f', start={self.start:#x}' if self.start else ''
+		return f'Layout({self.name!r}, {list(self.fields)!r}{start})'
@@ -1,20 +1,45 @@
-import struct
-
 from bitflags import BitFlags
+from layout import Layout
+from serialize import Tracked, to_bytes, pack_bytes
+from reader import LinkParseError
+
+CommonNetworkRelativeLinkFlags = BitFlags.define([
+	'ValidDevice', # If set, DeviceNameOffset field is set
+	'ValidNetType'
+], name='CommonNetworkRelativeLinkFlags')
+
+LinkInfoFlags = BitFlags.define([
+	'VolumeIDAndLocalBasePath',
+	'CommonNetworkRelativeLinkAndPathSuffix'], name='LinkInfoFlags')
 
-class CommonNetworkRelativeLink():
+def _bound(start, later, end):
+	""" End of the field at `start`: where the next field in writing
+		order begins, or `end` for the last one """
+	return min((s for s in later if s >= start), default=end)
+
+class CommonNetworkRelativeLink(Tracked):
 	""" Specifies information about the network location
 		where a link target is stored, including the mapped drive
 		letter and UNC path prefix """
 
+	LAYOUT = Layout('CommonNetworkRelativeLink', [
+		('CommonNetworkRelativeLinkSize', 'I'),
+		('CommonNetworkRelativeLinkFlags', 'I'),
+		('NetNameOffset', 'I'),
+		('DeviceNameOffset', 'I'),
+		('NetworkProviderType', 'I'),
+	])
+	# Present if NetNameOffset > 0x14
+	UNICODE_LAYOUT = Layout('CommonNetworkRelativeLink', [
+		('NetNameOffsetUnicode', 'I'),
+		('DeviceNameOffsetUnicode', 'I'),
+	], start=LAYOUT.size)
+
 	def __init__(self, use_opt=False):
 		""" :param: use_opt		use optional unicode fields
 		"""
 		self.CommonNetworkRelativeLinkSize = 0x14 # MUST be >= 0x14
-		self.CommonNetworkRelativeLinkFlags = BitFlags([
-			'ValidDevice', # If set, DeviceNameOffset field is set
-			'ValidNetType'
-		])
+		self.CommonNetworkRelativeLinkFlags = CommonNetworkRelativeLinkFlags()
 
 		self.NetNameOffset = 0
 		self.DeviceNameOffset = 0
@@ -28,51 +53,99 @@ class CommonNetworkRelativeLink():
 
 		self.use_opt = use_opt
 
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		self = cls.__new__(cls)
+		cls.LAYOUT.unpack_into(self, reader, offset)
+		size = self.CommonNetworkRelativeLinkSize
+		if size < 0x14:
+			raise LinkParseError('Invalid '
+				f'CommonNetworkRelativeLinkSize {size:#x}', offset)
+		end = offset + size
+		reader.check(offset, size, 'CommonNetworkRelativeLink')
+
+		self.CommonNetworkRelativeLinkFlags = \
+			CommonNetworkRelativeLinkFlags.from_int(
+				self.CommonNetworkRelativeLinkFlags)
+
+		# Unicode offsets are only present if NetNameOffset > 0x14
+		self.use_opt = self.NetNameOffset > 0x14
+		if self.use_opt:
+			cls.UNICODE_LAYOUT.unpack_into(self, reader, offset)
+		else:
+			self.NetNameOffsetUnicode = 0
+			self.DeviceNameOffsetUnicode = 0
+
+		starts = [offset + o if o else end for o in (
+			self.NetNameOffset, self.DeviceNameOffset,
+			self.NetNameOffsetUnicode, self.DeviceNameOffsetUnicode)]
+		fields = (('NetName', False), ('DeviceName', False),
+			('NetNameUnicode', True), ('DeviceNameUnicode', True))
+		for i, (name, wide) in enumerate(fields):
+			if starts[i] == end:
+				setattr(self, name, b'')
+				continue
+			stop = _bound(starts[i], starts[i + 1:], end)
+			setattr(self, name, reader.cstring(starts[i], stop, wide))
+		return self
+
 	# Getters/setters for this objects flags
 	def set(self, field_name, field_value):
 		self.CommonNetworkRelativeLinkFlags.set(field_name, field_value)
 	def get(self, field_name):
 		return self.CommonNetworkRelativeLinkFlags.get(field_name)
 
-	def build(self):
-		bs = struct.pack('<I', self.CommonNetworkRelativeLinkSize)
-		bs += bytes(self.CommonNetworkRelativeLinkFlags)
+	def size(self):
+		""" Fills in the offset and size fields, returns the size """
+		off = 0x1C if self.use_opt else 0x14
 
-		bs += struct.pack('<III',
-				self.NetNameOffset,
-				self.DeviceNameOffset,
-				self.NetworkProviderType)
+		self.NetNameOffset = off
+		off += len(self.NetName)
+		self.DeviceNameOffset = off
+		off += len(self.DeviceName)
 
 		if self.use_opt:
-			bs += struct.pack('<II',
-					self.NetNameOffsetUnicode,
-					self.DeviceNameOffsetUnicode)
+			self.NetNameOffsetUnicode = off
+			off += len(self.NetNameUnicode)
+			self.DeviceNameOffsetUnicode = off
+			off += len(self.DeviceNameUnicode)
 
-		self.NetNameOffset = len(bs)
-		bs += self.NetName
-		self.DeviceNamOffset = len(bs)
-		bs += self.DeviceName
+		self.CommonNetworkRelativeLinkSize = off
+		return off
 
+	def pack_into(self, buf, offset):
+		start = offset
+		offset = self.LAYOUT.pack_into(self, buf, start)
 		if self.use_opt:
-			self.NetNameOffsetUnicode = len(bs)
-			bs += self.NetNameUnicode
-			self.DeviceNameOffsetUnicode = len(bs)
-			bs += self.DeviceNameUnicode
+			offset = self.UNICODE_LAYOUT.pack_into(self, buf, start)
+
+		offset = pack_bytes(buf, offset, self.NetName)
+		offset = pack_bytes(buf, offset, self.DeviceName)
 
-		self.CommonNetworkRelativeLinkSize = len(bs)
+		if self.use_opt:
+			offset = pack_bytes(buf, offset, self.NetNameUnicode)
+			offset = pack_bytes(buf, offset, self.DeviceNameUnicode)
 
-		return bs
+		return offset
 
-	def __bytes__(self):
-		if not self.CommonNetworkRelativeLinkSize:
-			self.build()
-		return self.build()
+	__bytes__ = to_bytes
 
-class VolumeID():
+class VolumeID(Tracked):
 	""" Specifies information about the volume that a link target was on
 		when the link was created, for resolving links not found in
 		their original location """
 
+	LAYOUT = Layout('VolumeID', [
+		('VolumeIDSize', 'I'),
+		('DriveType', 'I'),
+		('DriveSerialNumber', 'I'),
+		('VolumeLabelOffset', 'I'),
+	])
+	# Present if VolumeLabelOffset is 0x14
+	UNICODE_LAYOUT = Layout('VolumeID', [
+		('VolumeLabelOffsetUnicode', 'I'),
+	], start=LAYOUT.size)
+
 	def __init__(self, use_opt=False):
 		self.VolumeIDSize = 0 # MUST be > 0x10
 		self.DriveType 	  = 0
@@ -83,34 +156,67 @@ class VolumeID():
 
 		self.use_opt = use_opt
 
-	def build(self):
-		bs = struct.pack('<IIII',
-			self.VolumeIDSize,
-			self.DriveType,
-			self.DriveSerialNumber,
-			self.VolumeLabelOffset)
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		self = cls.__new__(cls)
+		cls.LAYOUT.unpack_into(self, reader, offset)
+		if self.VolumeIDSize <= 0x10:
+			raise LinkParseError('Invalid VolumeIDSize '
+				f'{self.VolumeIDSize:#x}', offset)
 
-		# VolumeLabelOffsetUnicode
+		# VolumeLabelOffsetUnicode is present if VolumeLabelOffset is 0x14
+		self.use_opt = self.VolumeLabelOffset == 0x14
 		if self.use_opt:
-			bs += struct.pack('<I', self.VolumeLabelOffsetUnicode)
+			cls.UNICODE_LAYOUT.unpack_into(self, reader, offset)
+		else:
+			self.VolumeLabelOffsetUnicode = 0
 
-		# Data 
-		self.VolumeLabelOffset = len(bs)
+		self.Data = reader.slice(offset + (0x14 if self.use_opt else 0x10),
+			offset + self.VolumeIDSize, 'VolumeID')
+		return self
+
+	def size(self):
+		""" Fills in the offset and size fields, returns the size """
+		off = 0x14 if self.use_opt else 0x10
+
+		# Data
+		self.VolumeLabelOffset = off
 		if self.use_opt:
-			self.VolumeLabelOffsetUnicode = len(bs)
-		bs += self.Data
+			self.VolumeLabelOffsetUnicode = off
+		off += len(self.Data)
+
+		self.VolumeIDSize = off
+		return off
+
+	def pack_into(self, buf, offset):
+		start = offset
+		offset = self.LAYOUT.pack_into(self, buf, start)
 
-		self.VolumeIDSize = len(bs)
+		# VolumeLabelOffsetUnicode
+		if self.use_opt:
+			offset = self.UNICODE_LAYOUT.pack_into(self, buf, start)
 
-		return bs
-	
-	def __bytes__(self):
-		# Build twice to fill in offsets and size
-		if not self.VolumeIDSize:
-			self.build()
-		return self.build()
+		# Data 
+		return pack_bytes(buf, offset, self.Data)
+
+	__bytes__ = to_bytes
+
+class LinkInfo(Tracked):
+	LAYOUT = Layout('LinkInfo', [
+		('LinkInfoSize', 'I'),
+		('LinkInfoHeaderSize', 'I'),
+		('LinkInfoFlags', 'I'),
+		('VolumeIDOffset', 'I'),
+		('LocalBasePathOffset', 'I'),
+		('CommonNetworkRelativeLinkOffset', 'I'),
+		('CommonPathSuffixOffset', 'I'),
+	])
+	# Present if LinkInfoHeaderSize >= 0x24
+	UNICODE_LAYOUT = Layout('LinkInfo', [
+		('LocalBasePathOffsetUnicode', 'I'),
+		('CommonPathSuffixOffsetUnicode', 'I'),
+	], start=LAYOUT.size)
 
-class LinkInfo():
 	def __init__(self, use_opt=False):
 		""" :param: use_opt		Use optional unicode structures
 		"""
@@ -122,9 +228,7 @@ class LinkInfo():
 		else:
 			self.LinkInfoHeaderSize = 0x1C
 
-		self.LinkInfoFlags = BitFlags([
-			'VolumeIDAndLocalBasePath',
-			'CommonNetworkRelativeLinkAndPathSuffix'])
+		self.LinkInfoFlags = LinkInfoFlags()
 		self.VolumeIDOffset = 0
 		self.LocalBasePathOffset = 0
 		self.CommonNetworkRelativeLinkOffset = 0
@@ -141,80 +245,122 @@ class LinkInfo():
 
 		self.use_opt = use_opt # Use optional unicode fields
 
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		self = cls.__new__(cls)
+		cls.LAYOUT.unpack_into(self, reader, offset)
+		if (self.LinkInfoHeaderSize < 0x1C or
+				self.LinkInfoHeaderSize > self.LinkInfoSize):
+			raise LinkParseError('Invalid LinkInfoHeaderSize '
+				f'{self.LinkInfoHeaderSize:#x}', offset)
+		end = offset + self.LinkInfoSize
+		reader.check(offset, self.LinkInfoSize, 'LinkInfo')
+
+		self.LinkInfoFlags = LinkInfoFlags.from_int(self.LinkInfoFlags)
+
+		# Unicode offsets are present if LinkInfoHeaderSize >= 0x24
+		self.use_opt = self.LinkInfoHeaderSize >= 0x24
+		if self.use_opt:
+			cls.UNICODE_LAYOUT.unpack_into(self, reader, offset)
+		else:
+			self.LocalBasePathOffsetUnicode = 0
+			self.CommonPathSuffixOffsetUnicode = 0
+
+		# Field starts, in writing order
+		starts = [offset + o if o else end for o in (
+			self.LocalBasePathOffset, self.CommonNetworkRelativeLinkOffset,
+			self.CommonPathSuffixOffset, self.LocalBasePathOffsetUnicode,
+			self.CommonPathSuffixOffsetUnicode)]
+
+		if self.get('VolumeIDAndLocalBasePath'):
+			self.VolumeID = VolumeID.from_buffer(reader,
+				offset + self.VolumeIDOffset)
+			self.LocalBasePath = reader.cstring(starts[0],
+				_bound(starts[0], starts[1:], end))
+		else:
+			self.VolumeID = VolumeID(self.use_opt)
+			self.LocalBasePath = b''
+
+		if self.get('CommonNetworkRelativeLinkAndPathSuffix'):
+			self.CommonNetworkRelativeLink = CommonNetworkRelativeLink.from_buffer(
+				reader, starts[1])
+		else:
+			self.CommonNetworkRelativeLink = CommonNetworkRelativeLink(self.use_opt)
+
+		self.CommonPathSuffix = reader.cstring(starts[2],
+			_bound(starts[2], starts[3:], end))
+		self.LocalBasePathUnicode = reader.cstring(starts[3],
+			_bound(starts[3], starts[4:], end), wide=True)
+		self.CommonPathSuffixUnicode = reader.cstring(starts[4], end, wide=True)
+		return self
+
 	# Getters/Setters for LinkInfoFlags
 	def set(self, field_name, field_state):
 		self.LinkInfoFlags.set(field_name, field_state)
 	def get(self, field_name):
 		return self.LinkInfoFlags.get(field_name)
 
-	def build(self):
-		bs = struct.pack('<II',
-				self.LinkInfoSize,
-				self.LinkInfoHeaderSize)
-
-		bs += bytes(self.LinkInfoFlags)
+	def size(self):
+		""" Computes every offset and size of this structure, including
+			the nested VolumeID and CommonNetworkRelativeLink,
+			returns the size """
+		off = 0x24 if self.use_opt else 0x1C
 
-		# VolumeIDOffset
 		if self.get('VolumeIDAndLocalBasePath'):
-			bs += struct.pack('<I', self.VolumeIDOffset)
-		else:
-			bs += b'\x00\x00\x00\x00'
+			# VolumeID
+			self.VolumeIDOffset = off
+			off += self.VolumeID.size()
 
-		# LocalBasePathOffset
-		if self.get('VolumeIDAndLocalBasePath'):
-			bs += struct.pack('<I', self.LocalBasePathOffset)
+			# LocalBasePath
+			self.LocalBasePathOffset = off
+			off += len(self.LocalBasePath)
 		else:
-			bs += b'\x00\x00\x00\x00'
+			self.VolumeIDOffset = 0
+			self.LocalBasePathOffset = 0
 
-		# CommonNetworkRelativeLinkOffset
+		# CommonNetworkRelativeLink
 		if self.get('CommonNetworkRelativeLinkAndPathSuffix'):
-			bs += struct.pack('<I', self.CommonNetworkRelativeLinkOffset)
+			self.CommonNetworkRelativeLinkOffset = off
+			off += self.CommonNetworkRelativeLink.size()
 		else:
-			bs += b'\x00\x00\x00\x00'
+			self.CommonNetworkRelativeLinkOffset = 0
 
-		# CommonPathSuffixOffset
-		bs += struct.pack('<I', self.CommonPathSuffixOffset)
+		# CommonPathSuffix
+		self.CommonPathSuffixOffset = off
+		off += len(self.CommonPathSuffix)
 
 		if self.use_opt:
-			# LocalBasePathOffsetUnicode
 			if self.get('VolumeIDAndLocalBasePath'):
-				bs += struct.pack('<I', self.LocalBasePathOffsetUnicode)
+				self.LocalBasePathOffsetUnicode = off
 			else:
-				bs += b'\x00\x00\x00\x00'
-
-			# CommonPathSuffixOffsetUnicode
-			bs += struct.pack('<I', self.CommonPathSuffixUnicode)
+				self.LocalBasePathOffsetUnicode = 0
+			off += len(self.LocalBasePathUnicode)
+			self.CommonPathSuffixOffsetUnicode = off
+			off += len(self.CommonPathSuffixUnicode)
+
+		self.LinkInfoSize = off
+		return off
+
+	def pack_into(self, buf, offset):
+		""" Writes the structure in one pass, size() must have run """
+		start = offset
+		offset = self.LAYOUT.pack_into(self, buf, start)
+		if self.use_opt:
+			offset = self.UNICODE_LAYOUT.pack_into(self, buf, start)
 
 		if self.get('VolumeIDAndLocalBasePath'):
-			# VolumeID
-			self.VolumeIDOffset = len(bs)
-			bs += bytes(self.VolumeID)
+			offset = self.VolumeID.pack_into(buf, offset)
+			offset = pack_bytes(buf, offset, self.LocalBasePath)
 
-			# LocalBasePath
-			self.LocalBasePathOffset = len(bs)
-			bs += self.LocalBasePath
-
-		# CommonNetworkRelativeLink
 		if self.get('CommonNetworkRelativeLinkAndPathSuffix'):
-			self.CommonNetworkRelativeLinkOffset = len(bs)
-			bs += bytes(self.CommonNetworkRelativeLink)
+			offset = self.CommonNetworkRelativeLink.pack_into(buf, offset)
 
-		# CommonPathSuffix
-		self.CommonPathSuffixOffset = len(bs)
-		bs += self.CommonPathSuffix
+		offset = pack_bytes(buf, offset, self.CommonPathSuffix)
 
 		if self.use_opt:
-			self.LocalBasePathOffsetUnicode = len(bs)
-			bs += self.LocalBasePathUnicode
-			self.CommonPathSuffixOffsetUnicode = len(bs)
-			bs += self.CommonPathSuffixUnicode
-
-		self.LinkInfoSize = len(bs)
-		return bs
+			offset = pack_bytes(buf, offset, self.LocalBasePathUnicode)
+			offset = pack_bytes(buf, offset, self.CommonPathSuffixUnicode)
 
+		return offset
 
-	def __bytes__(self):
-		# Need to build twice to fill in offsets
-		if self.LinkInfoSize == 0:
-			self.build()
-		return self.build()
+	__bytes__ = to_bytes
@@ -1,9 +1,14 @@
+import functools
+import ntpath
 import struct
 
-from constants import MAX_SHORT
+from constants import MAX_SHORT, CLSID, FileShellItemTypeData
 from filetime import FileTime
 from bitflags import BitFlags
+from shell_link_header import FileAttributes
 from extra_data import FileDataBlock
+from serialize import Tracked, to_bytes, pack_bytes
+from reader import LinkParseError
 
 # No need to prebuild any of these classes,
 # no offsets present
@@ -18,8 +23,14 @@ class RootShellItem():
 		self.SortIndex = 0x50 # MY_COMPUTER
 		self.CLSID     = CLSID
 
-	def __bytes__(self):
-		return struct.pack('<B', self.SortIndex) + self.CLSID
+	def size(self):
+		return 1 + len(self.CLSID)
+
+	def pack_into(self, buf, offset):
+		struct.pack_into('<B', buf, offset, self.SortIndex)
+		return pack_bytes(buf, offset + 1, self.CLSID)
+
+	__bytes__ = to_bytes
 
 class VolumeShellItem():
 	""" Shell item representing the target volume """
@@ -29,8 +40,17 @@ class VolumeShellItem():
 	def __init__(self, volname):
 		self.Name = volname.encode('ascii')
 
-	def __bytes__(self):
-		return self.Name
+	def size(self):
+		return len(self.Name)
+
+	def pack_into(self, buf, offset):
+		return pack_bytes(buf, offset, self.Name)
+
+	__bytes__ = to_bytes
+
+# Same attributes as the ShellLinkHeader, stored in a short
+FileShellItemAttributes = BitFlags.define(FileAttributes.field_names,
+	storage_size=16, name='FileShellItemAttributes')
 
 class FileShellItem():
 	TYPE = 3
@@ -39,28 +59,10 @@ class FileShellItem():
 	def __init__(self, fname, flags={}):
 		self.FileSize = 0
 		self.Modified = 0
-		self.FileAttributes = BitFlags([
-			'FILE_ATTRIBUTE_READONLY',
-			'FILE_ATTRIBUTE_HIDDEN',
-			'FILE_ATTRIBUTE_SYSTEM',
-			'FILE_ATTRIBUTE_VOLUME_LABEL',
-			'FILE_ATTRIBUTE_DIRECTORY',
-			'FILE_ATTRIBUTE_ARCHIVE',
-			'FILE_ATTRIBUTE_NORMAL',
-			'FILE_ATTRIBUTE_TEMPORARY',
-			'FILE_ATTRIBUTE_SPARSE_FILE',
-			'FILE_ATTRIBUTE_REPARSE_POINT',
-			'FILE_ATTRIBUTE_COMPRESSED',
-			'FILE_ATTRIBUTE_OFFLINE',
-			'FILE_ATTRIBUTE_NOT_CONTENT_INDEXED',
-			'FILE_ATTRIBUTE_ENCRYPTED',
-			'FILE_ATTRIBUTE_INTEGRITY_STREAM',
-			'FILE_ATTRIBUTE_VIRTUAL'
-		], storage_size=16)
+		self.FileAttributes = FileShellItemAttributes()
 
 		# Initialize flags
-		for k in flags.keys():
-			self.set(k, flags[k])
+		self.FileAttributes.set_many(flags)
 
 		# Null-termination of PrimaryName necessary?
 		self.PrimaryName = fname.encode('ascii')
@@ -76,16 +78,56 @@ class FileShellItem():
 	def get(self, field_name):
 		return self.FileAttributes.get(field_name)
 
-	def __bytes__(self):
-		bs = struct.pack('<xII',
+	def size(self):
+		return (struct.calcsize('<xII') + self.FileAttributes.size() +
+			len(self.PrimaryName) + self.FileDataBlock.size())
+
+	def pack_into(self, buf, offset):
+		struct.pack_into('<xII', buf, offset,
 				self.FileSize,
 				self.Modified)
-		bs += bytes(self.FileAttributes)
-		bs += self.PrimaryName
-		bs += bytes(self.FileDataBlock)
-		return bs
-	
-class ItemID():
+		offset = self.FileAttributes.pack_into(buf,
+				offset + struct.calcsize('<xII'))
+		offset = pack_bytes(buf, offset, self.PrimaryName)
+		return self.FileDataBlock.pack_into(buf, offset)
+
+	__bytes__ = to_bytes
+
+# Serialized items are cached by from_path, so links sharing a
+# directory prefix share the bytes of its items
+ITEM_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=None)
+def _volume_item(drive):
+	# Padded as in the example of the specification
+	return bytes(VolumeShellItem(f'{drive.upper()}\\'.ljust(22, '\x00')))
+
+@functools.lru_cache(maxsize=ITEM_CACHE_SIZE)
+def _file_item(name, attributes, modified, created, accessed):
+	item = FileShellItem(name + '\x00')
+	item.FileAttributes.value = attributes
+	item.Modified = modified
+	item.FileDataBlock.Created = created
+	item.FileDataBlock.Accessed = accessed
+	return bytes(item)
+
+def _attributes(attrs):
+	""" FileShellItemAttributes value of a {name: state} dict or an int """
+	if isinstance(attrs, int):
+		return attrs
+	value = 0
+	for name, state in attrs.items():
+		if name not in FileShellItemAttributes.masks:
+			raise ValueError(f'Field {name} does not exist')
+		if state:
+			value |= FileShellItemAttributes.masks[name]
+	return value
+
+ROOT_ITEM = bytes(RootShellItem(bytes(CLSID.MY_COMPUTER.value)))
+DIRECTORY_ATTRIBUTES = FileShellItemAttributes.masks['FILE_ATTRIBUTE_DIRECTORY']
+NORMAL_ATTRIBUTES = FileShellItemAttributes.masks['FILE_ATTRIBUTE_NORMAL']
+
+class ItemID(Tracked):
 	def __init__(self, Type, TypeData, bs):
 		if not type(bs) == bytes:
 			raise ValueError("`Data` argument must be of type `bytes`")
@@ -98,46 +140,163 @@ class ItemID():
 		self.Type 		= Type
 		self.Data       = bs
 
-	def build(self):
-		bs = struct.pack('<HB', 
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		ItemIDSize, typeByte = reader.unpack_from('<HB', offset, 'ItemID')
+		if ItemIDSize < 3:
+			raise LinkParseError(f'Invalid ItemIDSize {ItemIDSize}', offset)
+
+		self = cls.__new__(cls)
+		self.ItemIDSize = ItemIDSize
+		self.TypeData   = typeByte & 0xF
+		self.Type		= typeByte >> 4
+		self.Data		= reader.slice(offset + 3, offset + ItemIDSize, 'ItemID')
+		return self
+
+	def size(self):
+		self.ItemIDSize = struct.calcsize('<HB') + len(self.Data)
+		return self.ItemIDSize
+
+	def pack_into(self, buf, offset):
+		struct.pack_into('<HB', buf, offset,
 				self.ItemIDSize,
 				self.TypeData | self.Type << 4)
-		bs += self.Data
-
-		self.ItemIDSize = len(bs)
-		return bs
+		return pack_bytes(buf, offset + 3, self.Data)
 
-	def __bytes__(self):
-		if not self.ItemIDSize:
-			self.build()
-		return self.build()
+	__bytes__ = to_bytes
 
-class IDList():
+class IDList(Tracked):
 	def __init__(self):
 		self.ItemIDList = [] 		# An array of zero or more ItemID structures
 		self.TerminalID = bytes(2)	# Must be zero
 
-	def __bytes__(self):
-		bs = b''
+	@classmethod
+	def from_buffer(cls, reader, offset, end):
+		""" Parses ItemIDs up to the TerminalID, which must be
+			the last two bytes before `end` """
+		self = cls()
+		while True:
+			itemIdSize, = reader.unpack_from('<H', offset, 'IDList')
+			if itemIdSize == 0:
+				break
+			if offset + itemIdSize > end:
+				raise LinkParseError('ItemID overflows the IDList', offset)
+			reader.limit('max_items', len(self.ItemIDList) + 1, offset)
+			self.ItemIDList.append(ItemID.from_buffer(reader, offset))
+			offset += itemIdSize
+
+		if offset + 2 != end:
+			raise LinkParseError('TerminalID does not end the IDList', offset)
+		self.TerminalID = reader.slice(offset, end)
+		return self
+
+	def size(self):
+		return (sum(itemId.size() for itemId in self.ItemIDList) +
+			len(self.TerminalID))
+
+	def pack_into(self, buf, offset):
 		for itemId in self.ItemIDList:
-			bs += bytes(itemId)
-		return bs + self.TerminalID
+			offset = itemId.pack_into(buf, offset)
+		return pack_bytes(buf, offset, self.TerminalID)
 
-class LinkTargetIDList():
+	__bytes__ = to_bytes
+
+class LinkTargetIDList(Tracked):
 	def __init__(self):
 		self.IDListSize = 0 # short
 		self.IDList     = IDList()
 
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		self = cls.__new__(cls)
+		self.IDListSize, = reader.unpack_from('<H', offset, 'LinkTargetIDList')
+		self.IDList = IDList.from_buffer(reader, offset + 2,
+			offset + 2 + self.IDListSize)
+		return self
+
+	@classmethod
+	def from_path(cls, path, attrs=None, modified=0, created=0, accessed=0):
+		""" Builds the IDList of a local path, like `C:\\test\\a.txt`:
+			My Computer, the volume, then a FileShellItem per directory
+			and one for the target.
+
+			`attrs` are the target FileShellItemAttributes, a {name: state}
+			dict or an int (FILE_ATTRIBUTE_NORMAL by default), `modified`,
+			`created` and `accessed` its DOS date and times. Directories
+			only have FILE_ATTRIBUTE_DIRECTORY.
+		"""
+		drive, rest = ntpath.splitdrive(path)
+		if len(drive) != 2:
+			raise ValueError(f'{path} is not a path on a drive letter')
+		names = [name for name in rest.replace('/', '\\').split('\\') if name]
+		attributes = NORMAL_ATTRIBUTES if attrs is None else _attributes(attrs)
+
+		items = [ItemID(RootShellItem.TYPE, RootShellItem.TYPEDATA, ROOT_ITEM),
+			ItemID(VolumeShellItem.TYPE, VolumeShellItem.TYPEDATA,
+				_volume_item(drive))]
+		for name in names[:-1]:
+			items.append(ItemID(FileShellItem.TYPE,
+				FileShellItemTypeData.DIRECTORY.value,
+				_file_item(name, DIRECTORY_ATTRIBUTES, 0, 0, 0)))
+		if names:
+			items.append(ItemID(FileShellItem.TYPE,
+				FileShellItemTypeData.FILE.value,
+				_file_item(names[-1], attributes, modified, created, accessed)))
+
+		self = cls()
+		self.extend(items)
+		return self
+
+	@staticmethod
+	def cache_info():
+		""" Statistics of the FileShellItem cache of from_path, a
+			functools cache_info() tuple """
+		return _file_item.cache_info()
+
+	@staticmethod
+	def cache_clear():
+		""" Empties the shell item caches of from_path """
+		_file_item.cache_clear()
+		_volume_item.cache_clear()
+
 	def add(self, Type, TypeData, bs):
 		""" Adds an item to this list (raw bytes)"""
-		self.IDList.ItemIDList.append(ItemID(Type, TypeData, bs))
-		self.IDListSize = len(bytes(self.IDList))
+		self.extend([ItemID(Type, TypeData, bs)])
 
 	def add_payload(self, shitem):
 		""" Adds a ShellItem object to this list """
-		self.IDList.ItemIDList.append(
-			ItemID(shitem.TYPE, shitem.TYPEDATA, bytes(shitem)))
-		self.IDListSize = len(bytes(self.IDList))
+		self.extend([shitem])
+
+	def extend(self, items):
+		""" Adds ItemIDs and/or ShellItem objects to this list
+
+			IDListSize is kept up to date from the sizes of the new
+			items only, the existing ones are not serialized again.
+			size() recomputes it from the items when the list is
+			written """
+		items = [item if isinstance(item, ItemID) else
+			ItemID(item.TYPE, item.TYPEDATA, bytes(item)) for item in items]
+
+		size = self.IDListSize or len(self.IDList.TerminalID)
+		for item in items:
+			size += item.size()
+		if size > MAX_SHORT:
+			raise ValueError('IDList can not be larger than 0xffff')
+
+		self.IDList.ItemIDList.extend(items)
+		self.IDListSize = size
+
+	def size(self):
+		""" Fills in IDListSize from the items, which may have been
+			changed in IDList.ItemIDList directly, returns the size """
+		size = self.IDList.size()
+		if size > MAX_SHORT:
+			raise ValueError('IDList can not be larger than 0xffff')
+		self.IDListSize = size
+		return 2 + size
+
+	def pack_into(self, buf, offset):
+		struct.pack_into('<H', buf, offset, self.IDListSize)
+		return self.IDList.pack_into(buf, offset + 2)
 
-	def __bytes__(self):
-		return struct.pack('<H', self.IDListSize) + bytes(self.IDList)
+	__bytes__ = to_bytes
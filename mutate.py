@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+""" Structure-aware mutation of links, for fuzzing link consumers
+
+A seed link is compiled once into the offset, format and role of
+each of its fields (sizes, offsets, counts, flags and plain values)
+and the byte range of each of its sections. A test case is then a copy
+of the seed bytes with a few fields patched in place and, at most, one
+structural change: a section or presence flag dropped, a section or
+ExtraData block duplicated, the link truncated or bytes inserted.
+
+With consistent=True only plain values, the flags that do not change
+the layout and the StringData and LocalBasePath contents (rendered
+through a LinkTemplate, which fixes up the sizes) are mutated, so
+cases still parse and only their content is hostile.
+
+Case i of a seed is a function of (seed, i) only, so any case can be
+regenerated on its own:
+
+	mutator = Mutator(gen_lnk.malicious(), seed=1)
+	for data in mutator.cases(1000000):
+		...
+	python3 mutate.py SEED.lnk -n 1000000 [-o OUT_DIR] [--consistent]
+"""
+
+import argparse
+import collections
+import os
+import random
+import struct
+import sys
+import time
+
+from extra_data import DATA_BLOCKS, FixedDataBlock
+from link_info import (CommonNetworkRelativeLink,
+	CommonNetworkRelativeLinkFlags, LinkInfo, VolumeID)
+from shell_link import STRING_FIELDS, CompactLink, LazyLink, Link
+from shell_link_header import ShellLinkHeader, LinkFlags
+from template import LinkTemplate
+from validate import FLAG_BLOCKS
+
+# Field roles. Only values and the `mask` bits of flags keep the
+# structure consistent
+SIZE, OFFSET, COUNT, FLAGS, VALUE = 'size', 'offset', 'count', 'flags', 'value'
+
+Field = collections.namedtuple('Field', [
+	'offset', 'fmt', 'kind', 'name',
+	'mask',		# flag bits that may change in consistent mode
+])
+
+Section = collections.namedtuple('Section', [
+	'name', 'start', 'end',
+	'flag',		# LinkFlags mask marking its presence, 0 if none
+])
+
+_FORMATS = {fmt: struct.Struct('<' + fmt) for fmt in 'BHIQ'}
+
+# LinkFlags changing which sections are present or how they are read
+# (IsUnicode), or announcing an ExtraData block
+LAYOUT_FLAGS = sum(LinkFlags.masks[name] for name in (
+	'HasLinkTargetIDList', 'HasLinkInfo', 'IsUnicode',
+	*(flag for flag, _ in STRING_FIELDS),
+	*(flag for flag, _ in FLAG_BLOCKS)))
+
+STRING_PAYLOADS = (
+	'', 'A' * 260, 'A' * 0x7FFE, '%s%n%x%p' * 8, '%WINDIR%\\..\\' * 20,
+	'..\\' * 64 + 'Windows\\system32\\cmd.exe', '\\\\?\\UNC\\host\\share',
+	'\u202e' + 'txt.exe', '\ud7ff\ue000\uffff' * 16, 'C:\\\x00hidden',
+	'"' * 128, '\\\\' * 130,
+)
+
+def _fields(layout, base, kinds, names=None):
+	""" Fields of a Layout at `base`, `kinds` giving the role of
+		named fields (VALUE by default). The fields of nested
+		structures (FileTime) are values """
+	found = []
+	nested = dict(layout.fields)
+	for name, (offset, fmt) in layout.offsets.items():
+		if names is not None and name not in names:
+			continue
+		if fmt in _FORMATS:
+			found.append(Field(base + offset, _FORMATS[fmt],
+				kinds.get(name, VALUE), name, 0))
+		elif not isinstance(nested[name], str):
+			found += [field._replace(name=f'{name}.{field.name}') for field
+				in _fields(nested[name].LAYOUT, base + offset, {})]
+	return found
+
+HEADER_KINDS = {'HeaderSize': SIZE, 'LinkFlags': FLAGS}
+
+LINK_INFO_KINDS = dict.fromkeys(('LinkInfoSize', 'LinkInfoHeaderSize',
+	'VolumeIDSize', 'CommonNetworkRelativeLinkSize'), SIZE)
+LINK_INFO_KINDS.update(dict.fromkeys(('LinkInfoFlags',
+	'CommonNetworkRelativeLinkFlags'), FLAGS))
+for _cls in (LinkInfo, VolumeID, CommonNetworkRelativeLink):
+	for _layout in (_cls.LAYOUT, _cls.UNICODE_LAYOUT):
+		LINK_INFO_KINDS.update({name: OFFSET for name in _layout.offsets
+			if 'Offset' in name})
+
+def _layout_fields(section, base):
+	""" Fields of a parsed LinkInfo structure at `base`, its
+		UNICODE_LAYOUT included if present """
+	found = _fields(section.LAYOUT, base, LINK_INFO_KINDS)
+	if section.use_opt:
+		found += _fields(section.UNICODE_LAYOUT, base, LINK_INFO_KINDS)
+	return found
+
+def compile_link(data):
+	""" The Fields and Sections of the link in `data` """
+	lnk = LazyLink(data)
+	index = lnk.index
+	fields = _fields(ShellLinkHeader.LAYOUT, 0, HEADER_KINDS)
+	for i, field in enumerate(fields):
+		if field.name == 'LinkFlags':
+			fields[i] = field._replace(mask=~LAYOUT_FLAGS & 0xFFFFFFFF)
+		elif field.name == 'FileAttributes':
+			fields[i] = field._replace(kind=FLAGS, mask=0xFFFFFFFF)
+	sections = [Section('ShellLinkHeader', 0, ShellLinkHeader.LAYOUT.size, 0)]
+	ends = sorted(index[name] for name in CompactLink.SECTIONS
+		if name in index)
+
+	def end_of(start):
+		return min(e for e in ends if e > start)
+
+	if 'LinkTargetIDList' in index:
+		start = index['LinkTargetIDList']
+		end = end_of(start)
+		sections.append(Section('LinkTargetIDList', start, end,
+			LinkFlags.masks['HasLinkTargetIDList']))
+		fields.append(Field(start, _FORMATS['H'], SIZE, 'IDListSize', 0))
+		pos = start + 2
+		while pos + 2 <= end:
+			size, = struct.unpack_from('<H', data, pos)
+			if not size:
+				fields.append(Field(pos, _FORMATS['H'], SIZE, 'TerminalID', 0))
+				break
+			fields.append(Field(pos, _FORMATS['H'], SIZE, 'ItemIDSize', 0))
+			fields.append(Field(pos + 2, _FORMATS['B'], VALUE, 'ItemIDType', 0))
+			pos += size
+
+	if 'LinkInfo' in index:
+		start = index['LinkInfo']
+		sections.append(Section('LinkInfo', start, end_of(start),
+			LinkFlags.masks['HasLinkInfo']))
+		info = lnk.LinkInfo
+		fields += _layout_fields(info, start)
+		if info.get('VolumeIDAndLocalBasePath'):
+			fields += _layout_fields(info.VolumeID,
+				start + info.VolumeIDOffset)
+		if info.get('CommonNetworkRelativeLinkAndPathSuffix'):
+			for field in _layout_fields(info.CommonNetworkRelativeLink,
+					start + info.CommonNetworkRelativeLinkOffset):
+				if field.kind == FLAGS:
+					field = field._replace(mask=CommonNetworkRelativeLinkFlags
+						.masks['ValidNetType'])
+				fields.append(field)
+
+	for flag, name in STRING_FIELDS:
+		if name in index:
+			start = index[name]
+			sections.append(Section(name, start, end_of(start),
+				LinkFlags.masks[flag]))
+			fields.append(Field(start, _FORMATS['H'], COUNT,
+				'CountCharacters', 0))
+
+	for start in index['DataBlocks']:
+		size, signature = struct.unpack_from('<II', data, start)
+		block = DATA_BLOCKS.get(signature)
+		sections.append(Section(block.__name__ if block else 'DataBlock',
+			start, start + size, 0))
+		fields.append(Field(start, _FORMATS['I'], SIZE, 'BlockSize', 0))
+		fields.append(Field(start + 4, _FORMATS['I'], SIZE,
+			'BlockSignature', 0))
+		if block is not None and issubclass(block, FixedDataBlock) and \
+				block.BLOCK_SIZE == size:
+			fields += _fields(block.LAYOUT, start, {}, set(block.LAYOUT.offsets)
+				- {'Size', 'Signature'})
+	terminal = index['end'] - 4
+	fields.append(Field(terminal, _FORMATS['I'], SIZE, 'TerminalBlock', 0))
+	return fields, sections
+
+def _interesting(fmt, value, size):
+	""" Boundary values for a field of `fmt`, around `value` and
+		the size of the link """
+	top = (1 << (8 * fmt.size)) - 1
+	values = {0, 1, top, top >> 1, (top >> 1) + 1, value + 1, value - 1,
+		value + 2, value - 2, value * 2, size, size + 1, 0x7F, 0x80, 0xFF,
+		0x100, 0xFFFF, 0x10000}
+	return sorted(v for v in values if 0 <= v <= top)
+
+class Mutator():
+	""" Generates mutated variants of a seed link, see the module
+		docstring. `lnk` is a Link or the bytes of one. At most
+		`max_mutations` fields are patched per case """
+
+	def __init__(self, lnk, seed=0, consistent=False, max_mutations=3):
+		self.data = bytes(lnk)
+		self.seed = seed
+		self.consistent = consistent
+		self.max_mutations = max_mutations
+		self.fields, self.sections = compile_link(self.data)
+		self._interesting = [_interesting(f.fmt, f.fmt.unpack_from(
+			self.data, f.offset)[0], len(self.data)) for f in self.fields]
+
+		if consistent:
+			self.mutable = [i for i, f in enumerate(self.fields)
+				if f.kind == VALUE or (f.kind == FLAGS and f.mask)]
+			# Rendered slots move the fields after them, not the header
+			self._header = [i for i in self.mutable
+				if self.fields[i].offset < ShellLinkHeader.LAYOUT.size]
+			view = LazyLink(self.data)
+			slots = [name for _, name in STRING_FIELDS if name in view.index]
+			if view.get('HasLinkInfo') and \
+					view.LinkInfo.get('VolumeIDAndLocalBasePath'):
+				slots.append('LocalBasePath')
+			# LinkTemplate compiles a Link, which it serializes again
+			self.template = LinkTemplate(Link.from_bytes(self.data),
+				slots) if slots else None
+			# Payloads as each slot can encode them
+			self.payloads = {}
+			for slot in slots:
+				if slot == 'LocalBasePath':
+					payloads = [p.encode('latin-1', 'replace')
+						for p in STRING_PAYLOADS]
+				elif view.get('IsUnicode'):
+					payloads = list(STRING_PAYLOADS)
+				else:
+					payloads = [p.encode('latin-1', 'replace').decode('latin-1')
+						for p in STRING_PAYLOADS]
+				self.payloads[slot] = payloads
+			self._slots = list(self.payloads.items())
+		else:
+			self.mutable = list(range(len(self.fields)))
+			self.template = None
+		self._rng = random.Random()
+
+	def _patch(self, rng, buf, i):
+		field = self.fields[i]
+		fmt = field.fmt
+		value = fmt.unpack_from(buf, field.offset)[0]
+		if field.kind == FLAGS:
+			bits = field.mask if self.consistent else (1 << 8 * fmt.size) - 1
+			if rng.random() < 0.7:
+				# One bit, or several
+				value ^= 1 << rng.choice([b for b in range(8 * fmt.size)
+					if bits >> b & 1])
+			else:
+				value = (value & ~bits) | (rng.getrandbits(8 * fmt.size) & bits)
+		elif field.kind == VALUE and rng.random() < 0.5:
+			value = rng.getrandbits(8 * fmt.size)
+		else:
+			value = rng.choice(self._interesting[i])
+		fmt.pack_into(buf, field.offset, value)
+
+	def _restructure(self, rng, buf):
+		""" One structural change, returns the new bytes """
+		op = rng.randrange(5)
+		section = rng.choice(self.sections[1:] or self.sections)
+		if op == 0 and section.flag:
+			# Presence flag without its section, or the reverse
+			flags, = struct.unpack_from('<I', buf, 0x14)
+			struct.pack_into('<I', buf, 0x14, flags ^ section.flag)
+			return bytes(buf)
+		if op <= 1:
+			return bytes(buf[:section.start] + buf[section.end:])
+		if op == 2:
+			return bytes(buf[:section.end] + buf[section.start:])
+		if op == 3:
+			field = rng.choice(self.fields)
+			return bytes(buf[:field.offset + rng.randrange(field.fmt.size + 1)])
+		junk = rng.randbytes(rng.choice((1, 2, 4, 16, 255)))
+		return bytes(buf[:section.start] + junk + buf[section.start:])
+
+	def mutate(self, index):
+		""" Test case `index` of this seed """
+		rng = self._rng
+		rng.seed(self.seed << 32 ^ index)
+
+		if self.template and rng.random() < 0.5:
+			slot, payloads = rng.choice(self._slots)
+			buf = bytearray(self.template.render(**{slot: rng.choice(payloads)}))
+			mutable = self._header
+		else:
+			buf = bytearray(self.data)
+			mutable = self.mutable
+
+		if mutable:
+			for _ in range(rng.randint(1, self.max_mutations)):
+				self._patch(rng, buf, rng.choice(mutable))
+
+		if not self.consistent and rng.random() < 0.25:
+			return self._restructure(rng, buf)
+		return bytes(buf)
+
+	def cases(self, count, start=0):
+		""" Yields the test cases start to start + count - 1 """
+		for index in range(start, start + count):
+			yield self.mutate(index)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Generate mutated variants '
+		'of a seed link')
+	parser.add_argument('seed_link', help='seed .lnk file')
+	parser.add_argument('-n', type=int, default=100000,
+		help='number of cases (default: 100000)')
+	parser.add_argument('--start', type=int, default=0,
+		help='first case index (default: 0)')
+	parser.add_argument('-s', '--seed', type=int, default=0)
+	parser.add_argument('-c', '--consistent', action='store_true',
+		help='keep sizes and offsets consistent')
+	parser.add_argument('-m', '--max-mutations', type=int, default=3)
+	parser.add_argument('-o', '--output', metavar='DIR',
+		help='write the cases to DIR/N.lnk, only counted otherwise')
+	args = parser.parse_args(argv)
+
+	with open(args.seed_link, 'rb') as f:
+		data = f.read()
+	mutator = Mutator(data, args.seed, args.consistent, args.max_mutations)
+	if args.output:
+		os.makedirs(args.output, exist_ok=True)
+
+	nbytes = 0
+	start = time.perf_counter()
+	for index, case in enumerate(mutator.cases(args.n, args.start),
+			args.start):
+		nbytes += len(case)
+		if args.output:
+			with open(os.path.join(args.output, f'{index}.lnk'), 'wb') as f:
+				f.write(case)
+	elapsed = max(time.perf_counter() - start, 1e-9)
+	print(f'{args.n} cases, {nbytes / 1e6:.1f} MB in {elapsed:.2f}s: '
+		f'{args.n / elapsed * 60:,.0f} cases/min', file=sys.stderr)
+
+if __name__ == '__main__':
+	main()
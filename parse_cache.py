@@ -0,0 +1,209 @@
+""" Persistent parse cache for repeated scans of the same files
+
+Each file's LinkRecord is stored in a SQLite database with its stat key
+(device, inode, size, mtime) and a hash of its content. A file whose
+stat key is unchanged is not read again. A file whose key changed is
+hashed, and only parsed again if its content changed too.
+
+	with ParseCache('links.db', max_entries=1000000) as cache:
+		for rec in cache.scan(['C:/Users']):
+			...
+		print(cache.stats())
+
+The cache is bounded by max_entries and/or max_bytes (of stored
+records). When over the bound, the entries unused for the most scans
+are evicted first.
+
+Records depend on the reader Limits they were parsed with, the cache
+is cleared when they change. Files going over the CPU time budget are
+not cached: whether they do depends on the machine and its load.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+from reader import DEFAULT_LIMITS
+from scan import LinkRecord, error_record, iter_files, parse_buffer
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS links (
+	path	TEXT PRIMARY KEY,
+	dev		INTEGER,
+	ino		INTEGER,
+	size	INTEGER,
+	mtime	INTEGER,
+	hash	BLOB,
+	record	TEXT,
+	used	INTEGER
+);
+CREATE INDEX IF NOT EXISTS links_used ON links (used);
+CREATE TABLE IF NOT EXISTS meta (
+	key		TEXT PRIMARY KEY,
+	value	TEXT
+);
+'''
+
+def content_hash(data):
+	return hashlib.blake2b(data, digest_size=16).digest()
+
+class ParseCache():
+	""" A SQLite backed cache of LinkRecords, see the module docstring """
+
+	def __init__(self, path, max_entries=None, max_bytes=None,
+			commit_every=10000, limits=DEFAULT_LIMITS):
+		self.db = sqlite3.connect(path)
+		self.db.executescript(SCHEMA)
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.commit_every = commit_every
+		self.limits = limits
+		self._pending = 0
+		self.counters = dict.fromkeys(('hits', 'rehashed', 'parsed',
+			'uncached', 'evicted'), 0)
+
+		# Records written with other LinkRecord fields are stale
+		fields = ','.join(LinkRecord._fields[1:])
+		if self._meta('fields') != fields:
+			self.db.execute('DELETE FROM links')
+			self._set_meta('fields', fields)
+
+		# So are records parsed with other limits. Those of files over
+		# the CPU time budget are not stored, the budget is left out
+		key = repr(limits and limits._replace(max_cpu_time=None))
+		if self._meta('limits') != key:
+			self.db.execute('DELETE FROM links')
+			self._set_meta('limits', key)
+
+		# Every scan is a new generation, entries remember the last
+		# one that used them
+		self.generation = int(self._meta('generation') or 0) + 1
+		self._set_meta('generation', self.generation)
+		self.db.commit()
+
+	def _meta(self, key):
+		row = self.db.execute('SELECT value FROM meta WHERE key = ?',
+			(key,)).fetchone()
+		return row[0] if row else None
+
+	def _set_meta(self, key, value):
+		self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+			(key, str(value)))
+
+	def _changed(self):
+		self._pending += 1
+		if self._pending >= self.commit_every:
+			self.commit()
+
+	def get(self, path):
+		""" The LinkRecord of `path`, parsed only if it changed """
+		try:
+			st = os.stat(path)
+		except OSError as e:
+			self.counters['uncached'] += 1
+			return error_record(path, None, str(e))
+		key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+		row = self.db.execute('SELECT dev, ino, size, mtime, hash, record '
+			'FROM links WHERE path = ?', (path,)).fetchone()
+		if row and row[:4] == key:
+			self.counters['hits'] += 1
+			self.db.execute('UPDATE links SET used = ? WHERE path = ?',
+				(self.generation, path))
+			self._changed()
+			return LinkRecord(path, *json.loads(row[5]))
+
+		try:
+			with open(path, 'rb') as f:
+				data = f.read()
+		except OSError as e:
+			self.counters['uncached'] += 1
+			return error_record(path, st.st_size, str(e))
+		digest = content_hash(data)
+
+		if row and row[4] == digest:
+			# Touched but not modified
+			self.counters['rehashed'] += 1
+			rec = LinkRecord(path, *json.loads(row[5]))
+			stored = row[5]
+		else:
+			self.counters['parsed'] += 1
+			rec = parse_buffer(path, data, self.limits)
+			if rec.limit == 'max_cpu_time':
+				self.counters['uncached'] += 1
+				return rec
+			stored = json.dumps(rec[1:], separators=(',', ':'))
+
+		self.db.execute('INSERT OR REPLACE INTO links '
+			'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+			(path, *key, digest, stored, self.generation))
+		self._changed()
+		return rec
+
+	def scan(self, paths, pattern='*.lnk'):
+		""" Yields the LinkRecord of every link below `paths`, like
+			scan.scan() but one at a time and through the cache """
+		for path in iter_files(paths, pattern):
+			yield self.get(path)
+		self.commit()
+
+	def evict(self):
+		""" Drops the least recently used entries until the cache is
+			within its bounds, returns the number of entries dropped """
+		evicted = 0
+		if self.max_entries is not None:
+			count, = self.db.execute('SELECT COUNT(*) FROM links').fetchone()
+			if count > self.max_entries:
+				evicted += self.db.execute('DELETE FROM links WHERE path IN '
+					'(SELECT path FROM links ORDER BY used LIMIT ?)',
+					(count - self.max_entries,)).rowcount
+
+		if self.max_bytes is not None:
+			total, = self.db.execute('SELECT COALESCE(SUM(LENGTH(record)), 0) '
+				'FROM links').fetchone()
+			excess = total - self.max_bytes
+			if excess > 0:
+				# Oldest entries whose records add up to the excess
+				cursor = self.db.execute('SELECT path, LENGTH(record) '
+					'FROM links ORDER BY used')
+				victims = []
+				for path, length in cursor:
+					victims.append((path,))
+					excess -= length
+					if excess <= 0:
+						break
+				self.db.executemany('DELETE FROM links WHERE path = ?',
+					victims)
+				evicted += len(victims)
+
+		self.counters['evicted'] += evicted
+		return evicted
+
+	def commit(self):
+		self.evict()
+		self.db.commit()
+		self._pending = 0
+
+	def stats(self):
+		""" Counters of this session and the size of the cache """
+		entries, nbytes = self.db.execute('SELECT COUNT(*), '
+			'COALESCE(SUM(LENGTH(record)), 0) FROM links').fetchone()
+		pages, = self.db.execute('PRAGMA page_count').fetchone()
+		page_size, = self.db.execute('PRAGMA page_size').fetchone()
+		lookups = sum(self.counters[k] for k in ('hits', 'rehashed', 'parsed'))
+		return dict(self.counters,
+			hit_rate=(self.counters['hits'] + self.counters['rehashed']) /
+				lookups if lookups else 0.0,
+			entries=entries, record_bytes=nbytes,
+			file_bytes=pages * page_size, generation=self.generation)
+
+	def close(self):
+		self.commit()
+		self.db.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+""" On-disk pivot index over the fields of parsed links
+
+Maps forensic pivots to the files they appear in:
+
+	serial		VolumeID.DriveSerialNumber, as 8 hex digits
+	path		LinkInfo LocalBasePath
+	netname		CommonNetworkRelativeLink NetName
+	machine		TrackerDataBlock MachineID
+	droid		TrackerDataBlock volume and file droids, current and birth
+	mac			MAC address in the TrackerDataBlock file droids
+	env			EnvironmentVariableDataBlock and IconEnvironmentDataBlock
+				targets
+
+Values are stored normalized (lower case, serials in hex) in a SQLite
+B-tree, so exact and prefix lookups only touch a few pages. Adding the
+records of a file again replaces its previous entries.
+
+	python3 pivot.py links.idx add DIR_OR_FILE...
+	python3 pivot.py links.idx serial 0x307A8A81
+	python3 pivot.py links.idx netname '\\\\server\\share' --prefix
+"""
+
+import argparse
+import itertools
+import sqlite3
+import sys
+import uuid
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+	id		INTEGER PRIMARY KEY,
+	path	TEXT UNIQUE
+);
+CREATE TABLE IF NOT EXISTS pivots (
+	kind	TEXT,
+	value	TEXT,
+	file	INTEGER,
+	PRIMARY KEY (kind, value, file)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pivots_file ON pivots (file);
+'''
+
+def _serial(value):
+	if isinstance(value, str):
+		value = int(value.replace('-', ''), 16)
+	return f'{value:08x}'
+
+def _text(value):
+	return value.lower()
+
+def _guid(value):
+	return str(uuid.UUID(str(value)))
+
+def _mac(value):
+	""" Accepts a MAC address or a version 1 droid GUID """
+	if isinstance(value, str) and len(value.replace('-', '')) == 32:
+		value = uuid.UUID(value).node
+	if isinstance(value, str):
+		value = int(value.replace(':', '').replace('-', ''), 16)
+	return ':'.join(f'{value:012x}'[i:i + 2] for i in range(0, 12, 2))
+
+def _hex_digits(value, separators):
+	value = str(value).strip().lower()
+	if value.startswith('0x'):
+		value = value[2:]
+	for sep in separators:
+		value = value.replace(sep, '')
+	return value
+
+def _serial_prefix(value):
+	if isinstance(value, int):
+		return f'{value:x}'
+	return _hex_digits(value, '-')
+
+def _guid_prefix(value):
+	""" Leading hex digits of a GUID, hyphenated like _guid() """
+	digits = _hex_digits(value, '{}-')
+	parts = []
+	for size in (8, 4, 4, 4, 12):
+		if digits:
+			parts.append(digits[:size])
+		digits = digits[size:]
+	prefix = '-'.join(parts)
+	# A complete group is followed by its hyphen
+	if 0 < len(parts) < 5 and len(parts[-1]) == (8, 4, 4, 4)[len(parts) - 1]:
+		prefix += '-'
+	return prefix
+
+def _mac_prefix(value):
+	""" Leading octets of a MAC address, with any separators """
+	digits = _hex_digits(value, ':-.')
+	prefix = ':'.join(digits[i:i + 2] for i in range(0, len(digits), 2))
+	if len(digits) % 2 == 0 and 0 < len(digits) < 12:
+		prefix += ':'
+	return prefix
+
+def _droid_macs(rec):
+	for droid in (rec.DroidFileID, rec.DroidBirthFileID):
+		if droid and uuid.UUID(droid).version == 1:
+			yield _mac(droid)
+
+# kind -> (normalize, normalize a prefix, values of a LinkRecord)
+KINDS = {
+	'serial':	(_serial, _serial_prefix, lambda rec: [rec.DriveSerialNumber]),
+	'path':		(_text, _text, lambda rec: [rec.LocalBasePath]),
+	'netname':	(_text, _text, lambda rec: [rec.NetName]),
+	'machine':	(_text, _text, lambda rec: [rec.MachineID]),
+	'droid':	(_guid, _guid_prefix, lambda rec: [rec.DroidVolumeID,
+		rec.DroidFileID, rec.DroidBirthVolumeID, rec.DroidBirthFileID]),
+	'mac':		(_mac, _mac_prefix, _droid_macs),
+	'env':		(_text, _text, lambda rec: [rec.EnvironmentTarget,
+		rec.IconEnvironmentTarget]),
+}
+
+def pivots(rec):
+	""" The (kind, normalized value) pairs of a LinkRecord """
+	found = set()
+	for kind, (normalize, _, values) in KINDS.items():
+		for value in values(rec):
+			if value is not None and value != '':
+				found.add((kind, normalize(value)))
+	return found
+
+class PivotIndex():
+	""" A SQLite pivot index, see the module docstring """
+
+	def __init__(self, path):
+		self.db = sqlite3.connect(path)
+		self.db.executescript(SCHEMA)
+
+	def _file_id(self, path):
+		self.db.execute('INSERT OR IGNORE INTO files (path) VALUES (?)',
+			(path,))
+		return self.db.execute('SELECT id FROM files WHERE path = ?',
+			(path,)).fetchone()[0]
+
+	def add(self, records):
+		""" Indexes LinkRecords, replacing what was indexed for the
+			same paths. Records of files that failed to parse remove
+			the file. Returns the number of records indexed """
+		count = 0
+		with self.db:
+			for rec in records:
+				file = self._file_id(rec.path)
+				self.db.execute('DELETE FROM pivots WHERE file = ?', (file,))
+				if rec.error is not None:
+					self.db.execute('DELETE FROM files WHERE id = ?', (file,))
+					continue
+				self.db.executemany('INSERT INTO pivots VALUES (?, ?, ?)',
+					[(kind, value, file) for kind, value in pivots(rec)])
+				count += 1
+		return count
+
+	def remove(self, paths):
+		""" Drops files from the index """
+		with self.db:
+			for path in paths:
+				self.db.execute('DELETE FROM pivots WHERE file IN '
+					'(SELECT id FROM files WHERE path = ?)', (path,))
+				self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+
+	def lookup(self, kind, value, prefix=False):
+		""" Paths of the files with `value` for the pivot `kind`, or
+			with a value starting with `value` if `prefix` is set """
+		if kind not in KINDS:
+			raise ValueError(f'Unknown pivot {kind}')
+		if prefix:
+			value = KINDS[kind][1](value)
+			cursor = self.db.execute('SELECT DISTINCT path FROM pivots '
+				'JOIN files ON files.id = pivots.file '
+				'WHERE kind = ? AND value >= ? AND value < ? ORDER BY path',
+				(kind, value, value + '\U0010ffff'))
+		else:
+			cursor = self.db.execute('SELECT path FROM pivots '
+				'JOIN files ON files.id = pivots.file '
+				'WHERE kind = ? AND value = ? ORDER BY path',
+				(kind, KINDS[kind][0](value)))
+		return [path for path, in cursor]
+
+	def values(self, kind):
+		""" (value, file count) for every value of a pivot """
+		return self.db.execute('SELECT value, COUNT(*) FROM pivots '
+			'WHERE kind = ? GROUP BY value', (kind,)).fetchall()
+
+	def close(self):
+		self.db.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Build and query a pivot '
+		'index over parsed links')
+	parser.add_argument('index', help='index database')
+	parser.add_argument('command', choices=['add', *KINDS],
+		help='add files to the index, or the pivot to look up')
+	parser.add_argument('values', nargs='+',
+		help='files or directories to add, or the values to look up')
+	parser.add_argument('--prefix', action='store_true',
+		help='match values starting with the given ones')
+	parser.add_argument('-j', '--workers', type=int, default=None,
+		help='worker processes when adding (default: CPU count)')
+	args = parser.parse_args(argv)
+
+	with PivotIndex(args.index) as index:
+		if args.command == 'add':
+			from scan import scan
+			records = itertools.chain.from_iterable(scan(args.values,
+				args.workers))
+			print(f'{index.add(records)} files indexed', file=sys.stderr)
+			return
+
+		for value in args.values:
+			for path in index.lookup(args.command, value, args.prefix):
+				print(path)
+
+if __name__ == '__main__':
+	main()
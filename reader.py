@@ -0,0 +1,133 @@
+""" Read side helpers shared by the structure parsers
+
+Parsers are classmethods named from_buffer(reader, offset) on each
+structure. They never copy the input: variable-length fields are kept
+as memoryview slices of the source buffer and only decoded when used.
+
+A Reader can be given Limits for parsing untrusted input. Sizes and
+counts over a limit, or parsing for longer than the CPU time budget,
+raise a LinkLimitError naming the limit.
+"""
+
+import collections
+import re
+import struct
+import time
+
+Limits = collections.namedtuple('Limits', [
+	'max_link_bytes',		# whole link, header to TerminalBlock
+	'max_section_bytes',	# IDList, LinkInfo or ExtraData block
+	'max_items',			# ItemIDs in an IDList
+	'max_blocks',			# ExtraData blocks
+	'max_string_chars',		# StringData CountCharacters
+	'max_cpu_time',			# seconds of CPU time per parse
+], defaults=(1 << 20, 1 << 16, 256, 64, 0x7FFF, 0.1))
+
+# Well above what Windows writes, with a budget of 100 ms per file
+DEFAULT_LIMITS = Limits()
+
+class LinkParseError(ValueError):
+	""" Raised when a buffer does not hold a valid structure """
+
+	def __init__(self, message, offset=None):
+		if offset is not None:
+			message = f'{message} (at offset {offset:#x})'
+		super().__init__(message)
+		self.offset = offset
+
+class LinkLimitError(LinkParseError):
+	""" Raised when parsing goes over one of the Reader Limits """
+
+	def __init__(self, limit, value, maximum, offset=None):
+		super().__init__(f'{limit} exceeded, {value} > {maximum}', offset)
+		self.limit = limit
+		self.value = value
+		self.maximum = maximum
+
+class Reader():
+	""" A bounds-checked, read-only view over a buffer
+
+		`data` is anything supporting the buffer protocol (bytes,
+		bytearray, mmap, memoryview), it is never copied.
+
+		`limits` (Limits) bound what may be parsed from the buffer. The
+		CPU time budget is the time of the calling thread since the
+		creation of the Reader or the last restart(), which the links
+		call whenever they parse a link or decode a section. Without
+		limits only the buffer bounds apply.
+	"""
+
+	__slots__ = ('data', 'mv', 'end', 'limits', 'deadline')
+
+	def __init__(self, data, end=None, limits=None):
+		if not hasattr(data, 'find'):
+			# Searched with re instead, which takes any buffer
+			data = memoryview(data).cast('B')
+		self.data = data
+		self.mv   = memoryview(data)
+		self.end  = len(self.mv) if end is None else end
+		self.limits = limits
+		self.deadline = None
+		self.restart()
+
+	def restart(self):
+		""" Starts a new CPU time budget, before parsing another link
+			or section from the same buffer """
+		if self.limits is not None and self.limits.max_cpu_time is not None:
+			self.deadline = time.thread_time() + self.limits.max_cpu_time
+
+	def limit(self, name, value, offset=None):
+		""" Checks `value` against the limit `name` and the time budget,
+			a no-op without limits """
+		if self.limits is None:
+			return
+		maximum = getattr(self.limits, name)
+		if maximum is not None and value > maximum:
+			raise LinkLimitError(name, value, maximum, offset)
+		if self.deadline is not None:
+			late = time.thread_time() - self.deadline
+			if late > 0:
+				budget = self.limits.max_cpu_time
+				raise LinkLimitError('max_cpu_time', budget + late,
+					budget, offset)
+
+	def check(self, offset, size, what='structure'):
+		if offset < 0 or offset + size > self.end:
+			raise LinkParseError(f'Truncated {what}, '
+				f'need {size} bytes', offset)
+
+	def unpack_from(self, fmt, offset, what='structure'):
+		""" Unpacks the struct.Struct (or format string) `fmt` """
+		if not isinstance(fmt, struct.Struct):
+			fmt = struct.Struct(fmt)
+		self.check(offset, fmt.size, what)
+		return fmt.unpack_from(self.mv, offset)
+
+	def slice(self, start, stop, what='field'):
+		""" Zero-copy view of [start, stop) """
+		if stop < start:
+			raise LinkParseError(f'Negative length {what}', start)
+		self.check(start, stop - start, what)
+		return self.mv[start:stop]
+
+	def find(self, sub, start=0, stop=None):
+		""" Like bytes.find(), without copying the buffer """
+		if stop is None:
+			stop = len(self.mv)
+		if hasattr(self.data, 'find'):
+			return self.data.find(sub, start, stop)
+		match = re.compile(re.escape(sub)).search(self.data, start, stop)
+		return -1 if match is None else match.start()
+
+	def cstring(self, start, stop, wide=False):
+		""" View of the NUL-terminated string at `start`, terminator
+			included. Ends at `stop` if no terminator is found before. """
+		self.check(start, stop - start, 'string')
+		if not wide:
+			i = self.find(b'\x00', start, stop)
+			return self.mv[start:stop if i < 0 else i + 1]
+
+		i = self.find(b'\x00\x00', start, stop)
+		while i >= 0 and (i - start) % 2:
+			i = self.find(b'\x00\x00', i + 1, stop)
+		return self.mv[start:stop if i < 0 else i + 2]
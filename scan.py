@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+""" Bulk scanner for directories of .lnk files
+
+Files are memory-mapped and parsed in a pool of worker processes. Workers
+send back one flat LinkRecord per file instead of the parsed object graph,
+and results are yielded in batches, so memory use is bounded by the number
+of batches in flight rather than the size of the corpus.
+
+	python3 scan.py DIR_OR_FILE... [-j WORKERS] > records.jsonl
+"""
+
+import argparse
+import collections
+import fnmatch
+import functools
+import json
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from shell_link import LazyLink
+from extra_data import (EnvironmentVariableDataBlock, IconEnvironmentDataBlock,
+	KnownFolderDataBlock, TrackerDataBlock)
+from string_data import ANSI_ENCODING
+from reader import DEFAULT_LIMITS, LinkLimitError, Reader
+
+LinkRecord = collections.namedtuple('LinkRecord', [
+	'path', 'size', 'error',
+	'limit',	# the Limits field the link went over, with the error
+	# ShellLinkHeader
+	'LinkFlags', 'FileAttributes',
+	'CreationTime', 'AccessTime', 'WriteTime',	# FILETIME, as integers
+	'FileSize', 'IconIndex', 'ShowCommand',
+	# LinkInfo
+	'DriveSerialNumber', 'LocalBasePath', 'NetName', 'CommonPathSuffix',
+	# StringData
+	'Name', 'RelativePath', 'WorkingDir', 'Arguments', 'IconLocation',
+	# ExtraData
+	'EnvironmentTarget', 'IconEnvironmentTarget', 'KnownFolderID',
+	'MachineID', 'DroidVolumeID', 'DroidFileID',
+	'DroidBirthVolumeID', 'DroidBirthFileID',
+])
+
+def _filetime(ft):
+	return ft.dwHighDateTime << 32 | ft.dwLowDateTime
+
+def _cstr(bs, wide=False):
+	""" Decodes a NUL-terminated string field """
+	if wide:
+		return str(bs, 'utf-16-le').split('\x00', 1)[0]
+	return bytes(bs).split(b'\x00', 1)[0].decode(ANSI_ENCODING)
+
+def _str(s):
+	return s.rstrip('\x00') if s else None
+
+def _target(block):
+	""" Target of an EnvironmentVariableDataBlock or alike """
+	if block is None:
+		return None
+	return (_cstr(block.TargetUnicode, wide=True) or
+		_cstr(block.TargetANSI)) or None
+
+def _extra(extra):
+	""" The LinkRecord fields read from the ExtraData """
+	env = extra.find(EnvironmentVariableDataBlock.SIGNATURE)
+	icon = extra.find(IconEnvironmentDataBlock.SIGNATURE)
+	known = extra.find(KnownFolderDataBlock.SIGNATURE)
+	tracker = extra.find(TrackerDataBlock.SIGNATURE)
+	ids = [None] * 5
+	if tracker is not None:
+		ids = [tracker.machine, *map(str, tracker.droid),
+			*map(str, tracker.droid_birth)]
+	return (_target(env), _target(icon),
+		str(known.guid) if known is not None else None, *ids)
+
+def record(path, size, lnk):
+	""" Flattens a Link or LazyLink into a LinkRecord """
+	hdr = lnk.ShellLinkHeader
+
+	serial = base = net = suffix = None
+	if lnk.get('HasLinkInfo'):
+		info = lnk.LinkInfo
+		if info.get('VolumeIDAndLocalBasePath'):
+			serial = info.VolumeID.DriveSerialNumber
+			if info.LocalBasePathUnicode:
+				base = _cstr(info.LocalBasePathUnicode, wide=True)
+			else:
+				base = _cstr(info.LocalBasePath)
+		if info.get('CommonNetworkRelativeLinkAndPathSuffix'):
+			net = _cstr(info.CommonNetworkRelativeLink.NetName)
+		suffix = _cstr(info.CommonPathSuffix)
+
+	return LinkRecord(path, size, None, None,
+		int(hdr.LinkFlags), int(hdr.FileAttributes),
+		_filetime(hdr.CreationTime), _filetime(hdr.AccessTime),
+		_filetime(hdr.WriteTime),
+		hdr.FileSize, hdr.IconIndex, hdr.ShowCommand,
+		serial, base, net, suffix,
+		_str(lnk.Name), _str(lnk.RelativePath), _str(lnk.WorkingDir),
+		_str(lnk.Arguments), _str(lnk.IconLocation),
+		*_extra(lnk.ExtraData))
+
+def error_record(path, size, error, limit=None):
+	return LinkRecord(path, size, error, limit,
+		*(None,) * (len(LinkRecord._fields) - 4))
+
+def _parse_mapped(path, size, mm, limits):
+	# Kept in its own frame so every view into `mm` is released
+	# when it returns, before the map is closed
+	try:
+		return record(path, size, LazyLink(Reader(mm, limits=limits)))
+	except LinkLimitError as e:
+		return error_record(path, size, str(e), e.limit)
+	except (ValueError, UnicodeDecodeError) as e:
+		return error_record(path, size, str(e))
+
+def parse_buffer(path, data, limits=DEFAULT_LIMITS):
+	""" Parses a file already read into `data` into a LinkRecord """
+	if not len(data):
+		return error_record(path, 0, 'Empty file')
+	return _parse_mapped(path, len(data), data, limits)
+
+def parse_file(path, limits=DEFAULT_LIMITS):
+	""" Memory-maps and parses a single file into a LinkRecord.
+		Files over the reader `limits` (None for no limits) are
+		reported as errors, like invalid ones """
+	try:
+		with open(path, 'rb') as f:
+			size = os.fstat(f.fileno()).st_size
+			if not size:
+				return error_record(path, 0, 'Empty file')
+			with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+				return _parse_mapped(path, size, mm, limits)
+	except OSError as e:
+		return error_record(path, None, str(e))
+
+def parse_batch(paths, limits=DEFAULT_LIMITS):
+	return [parse_file(path, limits) for path in paths]
+
+def iter_files(paths, pattern='*.lnk'):
+	""" Yields files given directly, and files matching `pattern`
+		(case insensitive) below the given directories """
+	pattern = pattern.lower()
+	for path in paths:
+		if not os.path.isdir(path):
+			yield path
+			continue
+
+		stack = [path]
+		while stack:
+			try:
+				entries = os.scandir(stack.pop())
+			except OSError:
+				continue
+			with entries:
+				for entry in entries:
+					if entry.is_dir(follow_symlinks=False):
+						stack.append(entry.path)
+					elif fnmatch.fnmatchcase(entry.name.lower(), pattern):
+						yield entry.path
+
+def _batches(iterable, batch_size):
+	batch = []
+	for item in iterable:
+		batch.append(item)
+		if len(batch) == batch_size:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+def scan(paths, workers=None, batch_size=256, pattern='*.lnk',
+		parse_batch=parse_batch):
+	""" Parses every link below `paths`, yielding lists of at most
+		`batch_size` LinkRecords in the order the files were found.
+
+		`workers` processes are used (os.cpu_count() by default), with
+		at most two batches per worker in flight. workers=0 parses in
+		the calling process. Another picklable `parse_batch` function
+		can be given to process the batches of paths differently.
+	"""
+	batches = _batches(iter_files(paths, pattern), batch_size)
+	if workers == 0:
+		for batch in batches:
+			yield parse_batch(batch)
+		return
+
+	workers = workers or os.cpu_count() or 1
+	with ProcessPoolExecutor(workers) as pool:
+		pending = collections.deque()
+		for batch in batches:
+			pending.append(pool.submit(parse_batch, batch))
+			if len(pending) >= 2 * workers:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Parse .lnk files in bulk '
+		'and write one JSON record per file to stdout')
+	parser.add_argument('paths', nargs='+', help='files or directories')
+	parser.add_argument('-j', '--workers', type=int, default=None,
+		help='worker processes (default: CPU count, 0: no pool)')
+	parser.add_argument('-b', '--batch-size', type=int, default=256)
+	parser.add_argument('-p', '--pattern', default='*.lnk',
+		help='file name pattern in directories (default: *.lnk)')
+	parser.add_argument('-c', '--cache', metavar='DB',
+		help='only parse files changed since the last scan with this '
+			'cache database, in a single process')
+	parser.add_argument('--cache-size', type=int, default=None,
+		help='most entries kept in the cache')
+	parser.add_argument('--max-cpu-time', type=float,
+		default=DEFAULT_LIMITS.max_cpu_time,
+		help='seconds of CPU time allowed per link or section parsed '
+			'(default: %(default)s)')
+	parser.add_argument('--no-limits', action='store_true',
+		help='parse files of any size and item, block and string counts')
+	args = parser.parse_args(argv)
+
+	limits = None if args.no_limits else \
+		DEFAULT_LIMITS._replace(max_cpu_time=args.max_cpu_time)
+
+	cache = None
+	if args.cache:
+		from parse_cache import ParseCache
+		cache = ParseCache(args.cache, max_entries=args.cache_size,
+			limits=limits)
+		batches = _batches(cache.scan(args.paths, args.pattern),
+			args.batch_size)
+	else:
+		batches = scan(args.paths, args.workers, args.batch_size,
+			args.pattern, functools.partial(parse_batch, limits=limits))
+
+	out = sys.stdout
+	files = errors = nbytes = 0
+	start = time.perf_counter()
+	for batch in batches:
+		for rec in batch:
+			files += 1
+			nbytes += rec.size or 0
+			errors += rec.error is not None
+			out.write(json.dumps(rec._asdict()) + '\n')
+
+	elapsed = max(time.perf_counter() - start, 1e-9)
+	print(f'{files} files ({errors} errors), {nbytes / 1e6:.1f} MB in '
+		f'{elapsed:.2f}s: {files / elapsed:.0f} files/s, '
+		f'{nbytes / 1e6 / elapsed:.1f} MB/s', file=sys.stderr)
+	if cache:
+		print('cache: ' + ', '.join(f'{k} {v:.2f}' if isinstance(v, float)
+			else f'{k} {v}' for k, v in cache.stats().items()), file=sys.stderr)
+		cache.close()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,60 @@
+""" Helpers shared by the serializable structures
+
+Every structure implements two methods:
+
+	size()					returns the number of bytes the structure
+							occupies, filling in its size and offset
+							fields on the way
+	pack_into(buf, offset)	writes the structure into `buf` (a bytearray
+							or writable memoryview) at `offset` and returns
+							the offset just past it. size() must have
+							been called first.
+
+Structures deriving from Tracked can snapshot their fields with state(),
+which lets a Link cache the serialized bytes of each section and only
+rebuild the sections that were modified.
+"""
+
+from bitflags import BitFlags
+
+def to_bytes(obj):
+	""" Serializes `obj` into a single preallocated buffer """
+	buf = bytearray(obj.size())
+	obj.pack_into(buf, 0)
+	return bytes(buf)
+
+def pack_bytes(buf, offset, bs):
+	""" Copies the raw bytes `bs` into `buf` at `offset` """
+	end = offset + len(bs)
+	buf[offset:end] = bs
+	return end
+
+# Immutable field types, compared as they are
+_PLAIN = frozenset((int, bool, float, str, bytes, memoryview, type(None)))
+
+def _snapshot(values):
+	values = tuple(values)
+	return values, tuple([state(v) for v in values if type(v) not in _PLAIN])
+
+def state(value):
+	""" A comparable snapshot of `value`, recursing into
+		structures, BitFlags and lists """
+	if isinstance(value, Tracked):
+		return value.state()
+	if isinstance(value, BitFlags):
+		return value.value
+	if isinstance(value, list):
+		return _snapshot(value)
+	return value
+
+class Tracked():
+	""" Base class for structures whose serialized bytes can be cached
+
+		state() snapshots every field, nested structures included. The
+		snapshot compares equal as long as nothing was changed, unchanged
+		fields are the same objects so comparing them is cheap. Buffers
+		modified in place (bytearray fields) are not noticed.
+	"""
+
+	def state(self):
+		return _snapshot(self.__dict__.values())
@@ -0,0 +1,456 @@
+"""
+The Shell Link (.LNK) binary file format
+
+SHELL_LINK = SHELL_LINK_HEADER [LINKTARGET_IDLIST] [LINKINFO] [STRING_DATA] *EXTRA_DATA
+
+"""
+
+import struct
+
+from shell_link_header import ShellLinkHeader, LinkFlags
+from linktarget_idlist import LinkTargetIDList
+from link_info import LinkInfo
+from string_data import StringData, ANSI_ENCODING
+from extra_data import ExtraData
+from reader import Reader, LinkParseError
+from serialize import pack_bytes, state
+
+# StringData fields in file order, with the LinkFlags marking their presence
+STRING_FIELDS = (
+	('HasName', 'Name'),
+	('HasRelativePath', 'RelativePath'),
+	('HasWorkingDir', 'WorkingDir'),
+	('HasArguments', 'Arguments'),
+	('HasIconLocation', 'IconLocation'),
+)
+STRING_NAMES = frozenset(name for _, name in STRING_FIELDS)
+
+def _string_field(name):
+	""" A str attribute that may be backed by a parsed StringData,
+		decoded when read """
+	def getter(self):
+		s = self._strings[name]
+		return s.value if isinstance(s, StringData) else s
+	def setter(self, value):
+		self._strings[name] = value
+	return property(getter, setter)
+
+def _filetime(ft):
+	return ft.dwHighDateTime << 32 | ft.dwLowDateTime
+
+def index_sections(reader, header, offset):
+	""" Start offsets of the optional sections following the `header`
+		parsed at `offset`. Only reads the size prefixes.
+
+		Returns a dict keyed on section (LinkTargetIDList, LinkInfo, each
+		present StringData field and ExtraData), plus the offsets of each
+		ExtraData block in 'DataBlocks' and the end of the link in 'end'
+	"""
+	index = {}
+	start = offset
+	offset += header.size()
+
+	if header.LinkFlags.get('HasLinkTargetIDList'):
+		index['LinkTargetIDList'] = offset
+		size, = reader.unpack_from('<H', offset, 'LinkTargetIDList')
+		reader.limit('max_section_bytes', size, offset)
+		offset += 2 + size
+
+	if header.LinkFlags.get('HasLinkInfo'):
+		index['LinkInfo'] = offset
+		size, = reader.unpack_from('<I', offset, 'LinkInfo')
+		if size < 0x1C:
+			raise LinkParseError(f'Invalid LinkInfoSize {size:#x}', offset)
+		reader.limit('max_section_bytes', size, offset)
+		offset += size
+
+	width = 2 if header.LinkFlags.get('IsUnicode') else 1
+	for flag, name in STRING_FIELDS:
+		if header.LinkFlags.get(flag):
+			index[name] = offset
+			count, = reader.unpack_from('<H', offset, 'StringData')
+			reader.limit('max_string_chars', count, offset)
+			offset += 2 + count * width
+
+	index['ExtraData'] = offset
+	index['DataBlocks'], index['end'] = ExtraData.index(reader, offset)
+	reader.limit('max_link_bytes', index['end'] - start, start)
+	return index
+
+class Link():
+	def __init__(self):
+		self.ShellLinkHeader = ShellLinkHeader()
+		self.LinkTargetIDList = LinkTargetIDList()
+		self.LinkInfo = LinkInfo()
+		self.ExtraData = ExtraData()
+
+		self._cache = {}
+		self._strings = {}
+		self.Name = 'name\x00'
+		self.RelativePath = 'relative_path\x00'
+		self.WorkingDir = 'working_dir\x00'
+		self.Arguments  = 'arguments\x00'
+		self.IconLocation = 'icon_location\x00'
+
+	Name = _string_field('Name')
+	RelativePath = _string_field('RelativePath')
+	WorkingDir = _string_field('WorkingDir')
+	Arguments = _string_field('Arguments')
+	IconLocation = _string_field('IconLocation')
+
+	@classmethod
+	def from_bytes(cls, data, offset=0):
+		""" Parses the link starting at `offset` in `data`. Variable
+			length fields are views into `data`, not copies """
+		reader = data if isinstance(data, Reader) else Reader(data)
+		reader.restart()
+
+		self = cls.__new__(cls)
+		self._cache = {}
+		self.ShellLinkHeader = ShellLinkHeader.from_buffer(reader, offset)
+		index = index_sections(reader, self.ShellLinkHeader, offset)
+
+		self.LinkTargetIDList = LinkTargetIDList()
+		if 'LinkTargetIDList' in index:
+			self.LinkTargetIDList = LinkTargetIDList.from_buffer(reader,
+				index['LinkTargetIDList'])
+
+		self.LinkInfo = LinkInfo()
+		if 'LinkInfo' in index:
+			self.LinkInfo = LinkInfo.from_buffer(reader, index['LinkInfo'])
+
+		self._strings = {}
+		unicode = bool(self.get('IsUnicode'))
+		for _, name in STRING_FIELDS:
+			if name in index:
+				self._strings[name] = StringData.from_buffer(reader,
+					index[name], unicode)
+			else:
+				self._strings[name] = ''
+
+		self.ExtraData = ExtraData.from_buffer(reader, index['ExtraData'],
+			index['DataBlocks'])
+		return self
+
+	@classmethod
+	def from_file(cls, path):
+		with open(path, 'rb') as f:
+			return cls.from_bytes(f.read())
+
+	# Setters/getters for LinkHeader flags
+	def get(self, field_name):
+		return self.ShellLinkHeader.LinkFlags.get(field_name)
+	def set(self, field_name, field_state):
+		self.ShellLinkHeader.LinkFlags.set(field_name, field_state)
+
+	def _sections(self):
+		""" (name, section) pairs in file order. StringData fields
+			are given as stored, a str or a parsed StringData """
+		yield 'ShellLinkHeader', self.ShellLinkHeader	# SHELL_LINK_HEADER
+
+		if self.get('HasLinkTargetIDList'):				# [LINKTARGET_IDLIST]
+			yield 'LinkTargetIDList', self.LinkTargetIDList
+		if self.get('HasLinkInfo'):						# [LINKINFO]
+			yield 'LinkInfo', self.LinkInfo
+
+		# [STRING_DATA]
+		# Fail in 010 cause it only supports wchar_t
+		for flag, name in STRING_FIELDS:
+			if self.get(flag):
+				yield name, self._strings[name]
+
+		yield 'ExtraData', self.ExtraData				# *EXTRA_DATA
+
+	def _unicode(self):
+		""" Whether the strings are written in UTF-16. IsUnicode is set
+			if a present string can not be written in the code page """
+		if self.get('IsUnicode'):
+			return True
+
+		for flag, name in STRING_FIELDS:
+			s = self._strings[name]
+			if not self.get(flag) or isinstance(s, StringData):
+				continue
+			try:
+				s.encode(ANSI_ENCODING)
+			except UnicodeEncodeError:
+				self.set('IsUnicode', 1)
+				return True
+		return False
+
+	def _string_data(self, name, unicode):
+		s = self._strings[name]
+		if not isinstance(s, StringData) or s.unicode != unicode:
+			s = StringData(getattr(self, name), unicode)
+		return s
+
+	def sections(self):
+		""" Returns the structures making up this link, in file order """
+		unicode = self._unicode()
+		return [self._string_data(name, unicode) if name in STRING_NAMES
+			else section for name, section in self._sections()]
+
+	def section_bytes(self):
+		""" Returns the serialized sections, in file order
+
+			The bytes of each section are cached, a section is only
+			rebuilt if it was replaced or changed since the last call """
+		unicode = self._unicode()
+		parts = []
+		for name, section in self._sections():
+			if name in STRING_NAMES:
+				current = (unicode, state(section))
+			else:
+				current = section.state()
+
+			cached = self._cache.get(name)
+			if cached and cached[0] is section and cached[1] == current:
+				parts.append(cached[2])
+				continue
+
+			if name in STRING_NAMES:
+				bs = bytes(self._string_data(name, unicode))
+			else:
+				# Serializing fills in sizes and offsets, so the
+				# state is taken afterwards
+				bs = bytes(section)
+				current = section.state()
+			self._cache[name] = (section, current, bs)
+			parts.append(bs)
+		return parts
+
+	def index(self):
+		""" Start offsets of the sections as written, keyed like
+			index_sections() but without the ExtraData blocks """
+		index = {}
+		offset = 0
+		for (name, _), bs in zip(self._sections(), self.section_bytes()):
+			if name != 'ShellLinkHeader':
+				index[name] = offset
+			offset += len(bs)
+		index['end'] = offset
+		return index
+
+	def size(self):
+		return sum(map(len, self.section_bytes()))
+
+	def serialize_into(self, buf, offset=0):
+		""" Writes the link into the preallocated `buf` (a bytearray or
+			writable memoryview) at `offset`, returns the end offset """
+		parts = self.section_bytes()
+		end = offset + sum(map(len, parts))
+		if end > len(buf):
+			raise ValueError(f'Buffer too small, need {end} bytes')
+
+		for bs in parts:
+			offset = pack_bytes(buf, offset, bs)
+		return offset
+
+	def write_to(self, fileobj):
+		""" Writes the link to a binary file object,
+			returns the number of bytes written """
+		buf = bytearray(self.size())
+		self.serialize_into(buf)
+		fileobj.write(buf)
+		return len(buf)
+
+	def __bytes__(self):
+		return b''.join(self.section_bytes())
+
+def _lazy_section(name):
+	""" A section of a LazyLink, parsed on first access """
+	def getter(self):
+		try:
+			return self._sections[name]
+		except KeyError:
+			value = self._sections[name] = self._parse(name)
+			return value
+	return property(getter)
+
+class LazyLink():
+	""" A read-only view of a link that only parses what is used
+
+		The ShellLinkHeader is parsed up front. The start offset of every
+		other section is indexed on first use, and a section is only
+		decoded (and then cached) when its attribute is read.
+	"""
+
+	def __init__(self, data, offset=0):
+		self._reader = data if isinstance(data, Reader) else Reader(data)
+		self._offset = offset
+		self._index = None
+		self._sections = {}
+		self._reader.restart()
+		self.ShellLinkHeader = ShellLinkHeader.from_buffer(self._reader, offset)
+
+	@classmethod
+	def from_bytes(cls, data, offset=0):
+		return cls(data, offset)
+
+	@classmethod
+	def from_file(cls, path):
+		with open(path, 'rb') as f:
+			return cls(f.read())
+
+	def get(self, field_name):
+		return self.ShellLinkHeader.LinkFlags.get(field_name)
+
+	@property
+	def index(self):
+		""" Section start offsets, see index_sections() """
+		if self._index is None:
+			self._reader.restart()
+			self._index = index_sections(self._reader,
+				self.ShellLinkHeader, self._offset)
+		return self._index
+
+	def _parse(self, name):
+		offset = self.index.get(name)
+		self._reader.restart()
+		if name == 'LinkTargetIDList':
+			if offset is None:
+				return LinkTargetIDList()
+			return LinkTargetIDList.from_buffer(self._reader, offset)
+		if name == 'LinkInfo':
+			if offset is None:
+				return LinkInfo()
+			return LinkInfo.from_buffer(self._reader, offset)
+		if name == 'ExtraData':
+			return ExtraData.from_buffer(self._reader, offset,
+				self.index['DataBlocks'])
+
+		# StringData
+		if offset is None:
+			return ''
+		return StringData.from_buffer(self._reader, offset,
+			bool(self.get('IsUnicode'))).value
+
+	LinkTargetIDList = _lazy_section('LinkTargetIDList')
+	LinkInfo = _lazy_section('LinkInfo')
+	Name = _lazy_section('Name')
+	RelativePath = _lazy_section('RelativePath')
+	WorkingDir = _lazy_section('WorkingDir')
+	Arguments = _lazy_section('Arguments')
+	IconLocation = _lazy_section('IconLocation')
+	ExtraData = _lazy_section('ExtraData')
+
+	def load(self):
+		""" Parses the whole link into a Link """
+		return Link.from_bytes(self._reader, self._offset)
+
+	def __bytes__(self):
+		return bytes(self._reader.mv[self._offset:self.index['end']])
+
+def _decoded_section(name):
+	""" A section of a CompactLink, parsed on every access """
+	return property(lambda self: self._parse(name))
+
+class CompactLink():
+	""" A small, read-only parsed link for keeping millions in memory
+
+		Header fields are plain ints (FILETIMEs as 64 bit integers,
+		flags as their integer value), section offsets are packed into
+		one bytes object and every other field is decoded from the
+		source buffer when read, nothing decoded is kept. The source
+		buffer is referenced, not copied, and must stay unchanged.
+		Sections are decoded with the Limits of the Reader the link
+		was parsed with, each with a new CPU time budget.
+	"""
+
+	__slots__ = ('data', 'offset', 'limits',
+		'LinkFlags', 'FileAttributes', 'CreationTime', 'AccessTime',
+		'WriteTime', 'FileSize', 'IconIndex', 'ShowCommand', 'HotKey',
+		'_sections', '_blocks')
+
+	# Start of each section relative to the link, 0 if absent
+	SECTIONS = ('LinkTargetIDList', 'LinkInfo',
+		*(name for _, name in STRING_FIELDS), 'ExtraData', 'end')
+	_SECTIONS = struct.Struct(f'<{len(SECTIONS)}I')
+
+	def __init__(self, data, offset=0):
+		reader = data if isinstance(data, Reader) else Reader(data)
+		reader.restart()
+		header = ShellLinkHeader.from_buffer(reader, offset)
+		index = index_sections(reader, header, offset)
+
+		self.data = reader.data
+		self.offset = offset
+		self.limits = reader.limits
+		self.LinkFlags = header.LinkFlags.value
+		self.FileAttributes = header.FileAttributes.value
+		self.CreationTime = _filetime(header.CreationTime)
+		self.AccessTime = _filetime(header.AccessTime)
+		self.WriteTime = _filetime(header.WriteTime)
+		self.FileSize = header.FileSize
+		self.IconIndex = header.IconIndex
+		self.ShowCommand = header.ShowCommand
+		self.HotKey, = struct.unpack('<H', header.HotKey)
+		self._sections = self._SECTIONS.pack(*(index[name] - offset
+			if name in index else 0 for name in self.SECTIONS))
+		self._blocks = struct.pack(f'<{len(index["DataBlocks"])}I',
+			*(block - offset for block in index['DataBlocks']))
+
+	@classmethod
+	def from_bytes(cls, data, offset=0):
+		return cls(data, offset)
+
+	@classmethod
+	def from_file(cls, path):
+		with open(path, 'rb') as f:
+			return cls(f.read())
+
+	def get(self, field_name):
+		""" State of a LinkFlags field, 0 or 1 """
+		try:
+			return int(bool(self.LinkFlags & LinkFlags.masks[field_name]))
+		except KeyError:
+			raise ValueError(f'Field {field_name} does not exist') from None
+
+	def _offset(self, name):
+		""" Absolute offset of a section, None if absent """
+		start = self._SECTIONS.unpack(self._sections)[self.SECTIONS.index(name)]
+		return self.offset + start if start else None
+
+	def _reader(self):
+		return Reader(self.data, limits=self.limits)
+
+	def _parse(self, name):
+		reader = self._reader()
+		offset = self._offset(name)
+		if name == 'LinkTargetIDList':
+			if offset is None:
+				return LinkTargetIDList()
+			return LinkTargetIDList.from_buffer(reader, offset)
+		if name == 'LinkInfo':
+			if offset is None:
+				return LinkInfo()
+			return LinkInfo.from_buffer(reader, offset)
+		if name == 'ExtraData':
+			blocks = struct.unpack(f'<{len(self._blocks) // 4}I', self._blocks)
+			return ExtraData.from_buffer(reader, offset,
+				[self.offset + block for block in blocks])
+
+		# StringData
+		if offset is None:
+			return ''
+		return StringData.from_buffer(reader, offset,
+			bool(self.get('IsUnicode'))).value
+
+	LinkTargetIDList = _decoded_section('LinkTargetIDList')
+	LinkInfo = _decoded_section('LinkInfo')
+	Name = _decoded_section('Name')
+	RelativePath = _decoded_section('RelativePath')
+	WorkingDir = _decoded_section('WorkingDir')
+	Arguments = _decoded_section('Arguments')
+	IconLocation = _decoded_section('IconLocation')
+	ExtraData = _decoded_section('ExtraData')
+
+	def load(self):
+		""" Parses the whole link into a Link """
+		return Link.from_bytes(self._reader(), self.offset)
+
+	def __len__(self):
+		return self._offset('end') - self.offset
+
+	def __bytes__(self):
+		return bytes(memoryview(self.data)[self.offset:self._offset('end')])
@@ -1,10 +1,60 @@
-import struct
 import os
 
 from filetime import FileTime
 from bitflags import BitFlags
+from layout import Layout
+from serialize import Tracked, to_bytes
+from reader import LinkParseError
 
-class ShellLinkHeader():
+LinkFlags = BitFlags.define([
+	'HasLinkTargetIDList',
+	'HasLinkInfo',
+	'HasName',
+	'HasRelativePath',
+	'HasWorkingDir',
+	'HasArguments',
+	'HasIconLocation',
+	'IsUnicode',
+	'ForceNoLinkInfo',
+	'HasExpString',
+	'RunInSeparateProcess',
+	'Unused1',
+	'HasDawinID',
+	'RunAsUser',					# <- Run as what user?
+	'HasExpIcon',
+	'NoPidlAlias',
+	'Unused2',
+	'RunWithShimLayer',
+	'ForceNoLinkTrack',
+	'EnableTargetMetadata',
+	'DisableLinkPathTracking',
+	'DisableKnownFolderTracking',
+	'DisableKnownFolderAlias',
+	'AllowLinkToLink',
+	'UnaliasOnSave',
+	'PreferEnvironmentPath',
+	'KeepLocalIDListForUNCTarget'], name='LinkFlags')
+
+FileAttributes = BitFlags.define([
+	'FILE_ATTRIBUTE_READONLY',
+	'FILE_ATTRIBUTE_HIDDEN',
+	'FILE_ATTRIBUTE_SYSTEM',
+	'FILE_ATTRIBUTE_VOLUME_LABEL',
+	'FILE_ATTRIBUTE_DIRECTORY',
+	'FILE_ATTRIBUTE_ARCHIVE',
+	'FILE_ATTRIBUTE_NORMAL',
+	'FILE_ATTRIBUTE_TEMPORARY',
+	'FILE_ATTRIBUTE_SPARSE_FILE',
+	'FILE_ATTRIBUTE_REPARSE_POINT',
+	'FILE_ATTRIBUTE_COMPRESSED',
+	'FILE_ATTRIBUTE_OFFLINE',
+	'FILE_ATTRIBUTE_NOT_CONTENT_INDEXED',
+	'FILE_ATTRIBUTE_ENCRYPTED',
+	'FILE_ATTRIBUTE_INTEGRITY_STREAM',
+	'FILE_ATTRIBUTE_VIRTUAL'
+], name='FileAttributes')
+
+class ShellLinkHeader(Tracked):
 	""" Contains identification information, timestamps, and flags
 		that specify the presence of optional structures like
 		LinkTargetIDList, LinkInfo and StringData
@@ -13,55 +63,31 @@ class ShellLinkHeader():
 	# LNK Class identifier, must be the following
 	CLSID = [1, 20, 2, 0, 0, 0, 0, 0, 192, 0, 0, 0, 0, 0, 0, 70] 
 
+	# HeaderSize and LinkCLSID, the first bytes of every link
+	SIGNATURE = bytes([0x4C, 0, 0, 0] + CLSID)
+
+	LAYOUT = Layout('ShellLinkHeader', [
+		('HeaderSize', 'I'),
+		('LinkCLSID', '16s'),
+		('LinkFlags', 'I'),
+		('FileAttributes', 'I'),
+		('CreationTime', FileTime),
+		('AccessTime', FileTime),
+		('WriteTime', FileTime),
+		('FileSize', 'I'),
+		('IconIndex', 'I'),
+		('ShowCommand', 'I'),
+		('HotKey', '2s'),
+		('Reserved1', '2s'),
+		('Reserved2', 'I'),
+		('Reserved3', 'I'),
+	])
+
 	def __init__(self):
 		self.HeaderSize = 0x4C			# Must be 0x0000004C
 		self.LinkCLSID  = bytes(self.CLSID)
-		self.LinkFlags  = BitFlags([
-			'HasLinkTargetIDList',
-			'HasLinkInfo',
-			'HasName',
-			'HasRelativePath',
-			'HasWorkingDir',
-			'HasArguments',
-			'HasIconLocation',
-			'IsUnicode',
-			'ForceNoLinkInfo',
-			'HasExpString',
-			'RunInSeparateProcess',
-			'Unused1',
-			'HasDawinID',
-			'RunAsUser',					# <- Run as what user?
-			'HasExpIcon',
-			'NoPidlAlias',
-			'Unused2',
-			'RunWithShimLayer',
-			'ForceNoLinkTrack',
-			'EnableTargetMetadata',
-			'DisableLinkPathTracking',
-			'DisableKnownFolderTracking',
-			'DisableKnownFolderAlias',
-			'AllowLinkToLink',
-			'UnaliasOnSave',
-			'PreferEnvironmentPath',
-			'KeepLocalIDListForUNCTarget'])
-		self.FileAttributes = BitFlags([
-			'FILE_ATTRIBUTE_READONLY',
-			'FILE_ATTRIBUTE_HIDDEN',
-			'FILE_ATTRIBUTE_SYSTEM',
-			'FILE_ATTRIBUTE_VOLUME_LABEL',
-			'FILE_ATTRIBUTE_DIRECTORY',
-			'FILE_ATTRIBUTE_ARCHIVE',
-			'FILE_ATTRIBUTE_NORMAL',
-			'FILE_ATTRIBUTE_TEMPORARY',
-			'FILE_ATTRIBUTE_SPARSE_FILE',
-			'FILE_ATTRIBUTE_REPARSE_POINT',
-			'FILE_ATTRIBUTE_COMPRESSED',
-			'FILE_ATTRIBUTE_OFFLINE',
-			'FILE_ATTRIBUTE_NOT_CONTENT_INDEXED',
-			'FILE_ATTRIBUTE_ENCRYPTED',
-			'FILE_ATTRIBUTE_INTEGRITY_STREAM',
-			'FILE_ATTRIBUTE_VIRTUAL'
-		])
+		self.LinkFlags  = LinkFlags()
+		self.FileAttributes = FileAttributes()
 
 		self.CreationTime = FileTime(0,0)
 		self.AccessTime   = FileTime(0,0)
@@ -74,18 +100,25 @@ class ShellLinkHeader():
 		self.Reserved2	  = 0
 		self.Reserved3    = 0
 
-	def __bytes__(self):
-		bs = struct.pack('<I', self.HeaderSize)
-		bs += self.LinkCLSID
-		bs += bytes(self.LinkFlags)
-		bs += bytes(self.FileAttributes)
-		bs += bytes(self.CreationTime)
-		bs += bytes(self.AccessTime)
-		bs += bytes(self.WriteTime)
-		bs += struct.pack('<III',
-				self.FileSize, self.IconIndex, self.ShowCommand)
-		bs += self.HotKey
-		bs += self.Reserved1
-		bs += struct.pack('<II', self.Reserved2, self.Reserved3)
+	@classmethod
+	def from_buffer(cls, reader, offset):
+		self = cls.__new__(cls)
+		cls.LAYOUT.unpack_into(self, reader, offset)
+
+		if self.HeaderSize != 0x4C:
+			raise LinkParseError(f'Invalid HeaderSize {self.HeaderSize:#x}',
+				offset)
+		if self.LinkCLSID != bytes(cls.CLSID):
+			raise LinkParseError('Invalid LinkCLSID', offset + 4)
+
+		self.LinkFlags  = LinkFlags.from_int(self.LinkFlags)
+		self.FileAttributes = FileAttributes.from_int(self.FileAttributes)
+		return self
+
+	def size(self):
+		return self.LAYOUT.size
+
+	def pack_into(self, buf, offset):
+		return self.LAYOUT.pack_into(self, buf, offset)
 
-		return bs
+	__bytes__ = to_bytes
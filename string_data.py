@@ -1,16 +1,25 @@
 import struct
 
 from constants import MAX_SHORT
+from serialize import Tracked, to_bytes, pack_bytes
 
-class StringData():
-	""" Represents a StringData object 
+# The code page of the machine that wrote the link is unknown,
+# latin-1 at least maps every byte
+ANSI_ENCODING = 'latin-1'
+
+class StringData(Tracked):
+	""" Represents a StringData object
 	STRING_DATA = [NAME_STRING] [RELATIVE_PATH] [WORKING_DIR]
 				  [COMMAND_LINE_ARGUMENTS] [ICON_LOCATION]
 
 	Each field is present if the corresponding
-	flag is set in the ShellLinkHeader	
+	flag is set in the ShellLinkHeader
+
+	Strings are UTF-16 if IsUnicode is set in the ShellLinkHeader,
+	otherwise they are in the system default code page. Link sets
+	IsUnicode when a string can not be written in the code page
 	"""
-	def __init__(self, s):
+	def __init__(self, s, unicode=True):
 		if len(s) > MAX_SHORT:
 			raise ValueError('`String` can not be longer than 0xffff')
 
@@ -21,9 +30,30 @@ class StringData():
 			s += '\x00'
 
 		self.CountCharacters = len(s) # 2 times length for wchar_t
-		self.String = s.encode('utf-16-le')
+		self.unicode = unicode
+		self.String = s.encode('utf-16-le' if unicode else ANSI_ENCODING)
+
+	@classmethod
+	def from_buffer(cls, reader, offset, unicode=True):
+		CountCharacters, = reader.unpack_from('<H', offset, 'StringData')
+		length = CountCharacters * 2 if unicode else CountCharacters
+
+		self = cls.__new__(cls)
+		self.CountCharacters = CountCharacters
+		self.unicode = unicode
+		self.String = reader.slice(offset + 2, offset + 2 + length, 'StringData')
+		return self
+
+	@property
+	def value(self):
+		""" The decoded string """
+		return str(self.String, 'utf-16-le' if self.unicode else ANSI_ENCODING)
+
+	def size(self):
+		return 2 + len(self.String)
 
-	def __bytes__(self):
-		return (struct.pack('<H', self.CountCharacters) +
-			    self.String)
+	def pack_into(self, buf, offset):
+		struct.pack_into('<H', buf, offset, self.CountCharacters)
+		return pack_bytes(buf, offset + 2, self.String)
 
+	__bytes__ = to_bytes
@@ -0,0 +1,193 @@
+""" Link templates for generating many variants of one link
+
+A template is compiled once from a Link: it is split into fixed byte
+segments around the variable slots, and every size or offset field that
+depends on a slot is recorded as a fixup. Rendering a variant only
+encodes the slot values, copies the segments and patches the fixups.
+
+	tpl = LinkTemplate(gen_lnk.malicious(), ('Arguments', 'WriteTime'))
+	bs  = tpl.render(Arguments='/c calc.exe', WriteTime=0x01D8...)
+"""
+
+import struct
+
+from constants import MAX_SHORT
+from filetime import FileTime
+from shell_link import STRING_FIELDS
+from string_data import ANSI_ENCODING
+
+# Fixed size ShellLinkHeader slots: offset and format
+HEADER_SLOTS = {
+	'CreationTime': (0x1C, struct.Struct('<Q')),
+	'AccessTime':	(0x24, struct.Struct('<Q')),
+	'WriteTime':	(0x2C, struct.Struct('<Q')),
+	'FileSize':		(0x34, struct.Struct('<I')),
+	'IconIndex':	(0x38, struct.Struct('<I')),
+	'ShowCommand':	(0x3C, struct.Struct('<I')),
+}
+
+STRING_SLOTS = {name: flag for flag, name in STRING_FIELDS}
+
+# Slots filled from the value of another slot
+SLOT_SOURCES = {'LocalBasePathUnicode': 'LocalBasePath'}
+
+def _filetime(value):
+	if isinstance(value, FileTime):
+		return value.dwHighDateTime << 32 | value.dwLowDateTime
+	return value
+
+def _string_encoder(unicode):
+	""" Encodes a StringData as the writer does, in UTF-16 if the link
+		has IsUnicode """
+	encoding = 'utf-16-le' if unicode else ANSI_ENCODING
+	def encode(s):
+		if not s.endswith('\x00'):
+			s += '\x00'
+		if len(s) > MAX_SHORT:
+			raise ValueError('`String` can not be longer than 0xffff')
+		return struct.pack('<H', len(s)) + s.encode(encoding)
+	return encode
+
+def _cstring_encoder(s):
+	if isinstance(s, str):
+		s = s.encode(ANSI_ENCODING)
+	if not s.endswith(b'\x00'):
+		s += b'\x00'
+	return s
+
+def _wide_cstring_encoder(s):
+	if isinstance(s, bytes):
+		s = s.decode(ANSI_ENCODING)
+	if not s.endswith('\x00'):
+		s += '\x00'
+	return s.encode('utf-16-le')
+
+class LinkTemplate():
+	""" A Link compiled into fixed segments and patchable slots
+
+		Supported slots are the StringData fields, the LinkInfo
+		LocalBasePath and the fixed size ShellLinkHeader fields in
+		HEADER_SLOTS. Variable slots must be present in the link.
+		LocalBasePath also renders LocalBasePathUnicode if the link
+		has one.
+	"""
+
+	def __init__(self, lnk, slots):
+		data = bytes(lnk)
+		# Taken from the writer rather than parsed back
+		index = lnk.index()
+		encode_string = _string_encoder(lnk.get('IsUnicode'))
+
+		self.header = {}	# name -> (offset, struct, default)
+		variable = []		# (start, end, name, encoder)
+		self.fixups = []	# (offset, struct, value, [dependent slot names])
+
+		for name in slots:
+			if name in HEADER_SLOTS:
+				offset, fmt = HEADER_SLOTS[name]
+				self.header[name] = (offset, fmt,
+					fmt.unpack_from(data, offset)[0])
+
+			elif name in STRING_SLOTS:
+				if name not in index:
+					raise ValueError(f'Slot {name} needs '
+						f'{STRING_SLOTS[name]} to be set')
+				start = index[name]
+				end = min(pos for pos in index.values() if pos > start)
+				variable.append((start, end, name, encode_string))
+
+			elif name == 'LocalBasePath':
+				info = lnk.LinkInfo
+				if not (lnk.get('HasLinkInfo') and
+						info.get('VolumeIDAndLocalBasePath')):
+					raise ValueError('Slot LocalBasePath needs HasLinkInfo '
+						'and VolumeIDAndLocalBasePath to be set')
+				base = index['LinkInfo']
+				strings = [(name, info.LocalBasePathOffset)]
+				start = base + info.LocalBasePathOffset
+				variable.append((start, start + len(info.LocalBasePath),
+					name, _cstring_encoder))
+				if info.use_opt and info.LocalBasePathUnicode:
+					strings.append(('LocalBasePathUnicode',
+						info.LocalBasePathOffsetUnicode))
+					start = base + info.LocalBasePathOffsetUnicode
+					variable.append((start,
+						start + len(info.LocalBasePathUnicode),
+						'LocalBasePathUnicode', _wide_cstring_encoder))
+				self.fixups += self._link_info_fixups(info, base, strings)
+
+			else:
+				raise ValueError(f'Unsupported slot {name}')
+
+		variable.sort()
+		self.slots = []		# (name, encoder, default bytes, compiled offset)
+		self.segments = []	# fixed bytes before each slot, and after the last
+		prev = 0
+		for start, end, name, encoder in variable:
+			if start < prev:
+				raise ValueError(f'Slot {name} overlaps another slot')
+			self.segments.append(data[prev:start])
+			self.slots.append((name, encoder, data[start:end], start))
+			prev = end
+		self.segments.append(data[prev:])
+
+	@staticmethod
+	def _link_info_fixups(info, base, strings):
+		""" LinkInfo fields moved by a change of length of the
+			`strings`, (slot name, offset in the LinkInfo) pairs """
+		fmt = struct.Struct('<I')
+		fixups = [(base, fmt, info.LinkInfoSize,
+			[name for name, _ in strings])]
+
+		after = [(0x14, info.CommonNetworkRelativeLinkOffset),
+				 (0x18, info.CommonPathSuffixOffset)]
+		if info.use_opt:
+			after += [(0x1C, info.LocalBasePathOffsetUnicode),
+					  (0x20, info.CommonPathSuffixOffsetUnicode)]
+		for field, value in after:
+			names = [name for name, offset in strings if value > offset]
+			if names:
+				fixups.append((base + field, fmt, value, names))
+		return fixups
+
+	def render(self, **values):
+		""" Builds the link with `values` for some of the slots,
+			the others keep the value of the compiled link """
+		parts = []
+		deltas = {}
+		for (name, encoder, default, _), segment in zip(self.slots,
+				self.segments):
+			parts.append(segment)
+			source = SLOT_SOURCES.get(name, name)
+			if source in values:
+				encoded = encoder(values[source])
+				deltas[name] = len(encoded) - len(default)
+				parts.append(encoded)
+			else:
+				parts.append(default)
+		parts.append(self.segments[-1])
+
+		buf = bytearray().join(parts)
+
+		for name, (offset, fmt, default) in self.header.items():
+			if name in values:
+				fmt.pack_into(buf, offset, _filetime(values[name]))
+
+		for offset, fmt, value, names in self.fixups:
+			delta = sum(deltas.get(n, 0) for n in names)
+			if delta:
+				# Slots before the field may have moved it
+				fmt.pack_into(buf, offset + self._shift(offset, deltas),
+					value + delta)
+
+		return bytes(buf)
+
+	def _shift(self, offset, deltas):
+		""" How far the byte at `offset` of the compiled link moved """
+		return sum(deltas.get(name, 0)
+			for name, _, _, start in self.slots if start < offset)
+
+	def render_many(self, variants):
+		""" Yields a rendered link for each dict of slot values """
+		for values in variants:
+			yield self.render(**values)
@@ -0,0 +1,27 @@
+import pickle
+
+import pytest
+
+from bitflags import BitFlags
+
+def test_baseline_constructor():
+	flags = BitFlags(['a', 'b', 'c'], 8)
+	assert isinstance(flags, BitFlags)
+	assert flags.get('b') == 0
+	flags.set('b', 1)
+	assert bytes(flags) == b'\x02'
+	assert type(flags) is type(BitFlags(['a', 'b', 'c'], storage_size=8))
+	with pytest.raises(ValueError):
+		BitFlags(['a', 'a'])
+
+def test_schemas_keep_their_name():
+	a = BitFlags.define(['x', 'y'], name='A')
+	b = BitFlags.define(['x', 'y'], name='B')
+	assert a is BitFlags.define(['x', 'y'], name='A')
+	assert (a.__name__, b.__name__) == ('A', 'B')
+	assert a(1) != b(1)
+
+def test_hash():
+	schema = BitFlags.define(['x', 'y'], name='H')
+	assert len({schema(1), schema(1), schema(2)}) == 2
+	assert hash(schema(2)) == hash(pickle.loads(pickle.dumps(schema(2))))
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+import gen_lnk
+from bulk_write import format_stats, main, write_links
+
+def _items(directory, n):
+	for i in range(n):
+		lnk = gen_lnk.malicious()
+		lnk.set('HasArguments', 1)
+		lnk.Arguments = f'{i}'
+		# Every other link is handed over serialized
+		yield str(directory / f'{i}.lnk'), bytes(lnk) if i % 2 else lnk
+
+@pytest.mark.parametrize('pool', ['thread', 'process'])
+def test_round_trip(tmp_path, pool):
+	expected = {path: bytes(lnk) for path, lnk in _items(tmp_path, 20)}
+	seen = []
+	stats = asyncio.run(write_links(_items(tmp_path, 20), concurrency=3,
+		queue_size=2, pool=pool, workers=2, progress=seen.append))
+	for path, data in expected.items():
+		assert open(path, 'rb').read() == data
+	assert stats.files == 20
+	assert stats.bytes == sum(map(len, expected.values()))
+	assert stats.max_queue <= 2
+	assert stats.fsyncs == 0
+	assert seen == list(range(1, 21))
+	assert '20 files' in format_stats(stats)
+
+def test_fsync_batches(tmp_path):
+	stats = asyncio.run(write_links(_items(tmp_path, 10), concurrency=2,
+		fsync_every=4))
+	assert stats.files == 10
+	# Two full batches and the remainder
+	assert stats.fsyncs == 3
+	assert len(list(tmp_path.iterdir())) == 10
+
+def test_first_error_is_raised(tmp_path):
+	def items():
+		yield from _items(tmp_path, 3)
+		yield str(tmp_path / 'missing' / 'x.lnk'), b'data'
+		yield from _items(tmp_path / 'missing', 100)
+	with pytest.raises(FileNotFoundError):
+		asyncio.run(write_links(items(), concurrency=2, fsync_every=2))
+	assert len(list(tmp_path.iterdir())) == 3
+
+def test_cli(tmp_path, capsys):
+	out = tmp_path / 'out'
+	main([str(out), '-n', '5', '--shape', 'example', '--fsync-every', '2'])
+	assert sorted(p.name for p in out.iterdir()) == \
+		[f'{i}.lnk' for i in range(5)]
+	assert '5 files' in capsys.readouterr().err
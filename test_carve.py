@@ -0,0 +1,33 @@
+import carve
+import gen_lnk
+from shell_link import Link
+
+def _image(tmp_path, parts):
+	path = tmp_path / 'image.raw'
+	path.write_bytes(b''.join(parts))
+	return path
+
+def test_carve_finds_links(tmp_path):
+	example = bytes(gen_lnk.example())
+	malicious = bytes(gen_lnk.malicious())
+	junk = b'\xff' * 100
+	# A header signature followed by garbage is not reported
+	parts = [junk, example, junk, carve.SIGNATURE + junk, malicious, junk]
+	path = _image(tmp_path, parts)
+
+	offsets = [100, len(b''.join(parts[:4]))]
+	for chunk_size in (1 << 20, 97):
+		found = [c for batch in carve.carve(path, workers=0,
+			chunk_size=chunk_size, extract=True) for c in batch]
+		assert [c.offset for c in found] == offsets
+		assert [c.data for c in found] == [example, malicious]
+		assert bytes(Link.from_bytes(found[0].data)) == example
+		assert found[0].record.path == f'{path}@0x64'
+
+def test_max_size(tmp_path):
+	malicious = bytes(gen_lnk.malicious())
+	path = _image(tmp_path, [malicious])
+	assert carve.carve_chunk(path, 0, len(malicious),
+		max_size=len(malicious))
+	assert not carve.carve_chunk(path, 0, len(malicious),
+		max_size=len(malicious) - 1)
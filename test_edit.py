@@ -0,0 +1,101 @@
+import os
+import stat
+
+import pytest
+
+import gen_lnk
+import validate
+from edit import LinkEditor, edit_file, main
+from extra_data import EnvironmentVariableDataBlock, ConsoleDataBlock
+from link_info import LinkInfo
+from shell_link import Link
+
+def _check(ed):
+	""" The edited link parses, writes back unchanged and is valid """
+	data = bytes(ed)
+	lnk = Link.from_bytes(data)
+	assert bytes(lnk) == data
+	assert validate.is_valid(validate.validate(data))
+	return lnk
+
+def test_set_strings():
+	ed = LinkEditor(bytes(gen_lnk.example()))
+	ed.set('WorkingDir', 'C:\\Windows')
+	ed.set('Arguments', '/c echo hi')
+	ed.set('RelativePath', None)
+	lnk = _check(ed)
+	assert lnk.WorkingDir == 'C:\\Windows\x00'
+	assert lnk.Arguments == '/c echo hi\x00'
+	assert not lnk.get('HasRelativePath')
+	assert lnk.get('HasArguments')
+
+def test_set_link_info_and_idlist():
+	ed = LinkEditor(bytes(gen_lnk.example()))
+	ed.set('LocalBasePath', 'C:\\Windows\\notepad.exe')
+	ed.set('LinkTargetIDList', 'C:\\Windows\\notepad.exe')
+	lnk = _check(ed)
+	assert bytes(lnk.LinkInfo.LocalBasePath) == b'C:\\Windows\\notepad.exe\x00'
+	assert len(lnk.LinkTargetIDList.IDList.ItemIDList) == 4
+	assert lnk.LinkInfo.LinkInfoSize == len(bytes(lnk.LinkInfo))
+
+def test_local_base_path_unicode():
+	lnk = gen_lnk.example()
+	info = LinkInfo(use_opt=True)
+	info.set('VolumeIDAndLocalBasePath', 1)
+	info.VolumeID = lnk.LinkInfo.VolumeID
+	info.LocalBasePath = b'C:\\test\\a.txt\x00'
+	info.CommonPathSuffix = b'\x00'
+	info.LocalBasePathUnicode = 'C:\\test\\a.txt\x00'.encode('utf-16-le')
+	info.CommonPathSuffixUnicode = b'\x00\x00'
+	lnk.LinkInfo = info
+	ed = LinkEditor(bytes(lnk))
+	# The UTF-16 copy follows
+	ed.set('LocalBasePath', b'C:\\Windows\\notepad.exe')
+	info.LocalBasePath = b'C:\\Windows\\notepad.exe\x00'
+	info.LocalBasePathUnicode = 'C:\\Windows\\notepad.exe\x00'.encode(
+		'utf-16-le')
+	assert bytes(_check(ed)) == bytes(lnk)
+
+def test_blocks():
+	data = bytes(gen_lnk.malicious())
+	ed = LinkEditor(data)
+	ed.set_block(EnvironmentVariableDataBlock('%windir%\\notepad.exe'))
+	ed.remove_block(ConsoleDataBlock.SIGNATURE)
+	lnk = _check(ed)
+	assert [b.Signature for b in lnk.ExtraData.DataBlocks] == \
+		[EnvironmentVariableDataBlock.SIGNATURE]
+
+	ed.remove_block(EnvironmentVariableDataBlock.SIGNATURE)
+	lnk = _check(ed)
+	assert not lnk.ExtraData.DataBlocks
+	assert not lnk.get('HasExpString')
+	with pytest.raises(ValueError):
+		ed.remove_block(EnvironmentVariableDataBlock.SIGNATURE)
+
+def test_header_range():
+	ed = LinkEditor(bytes(gen_lnk.example()))
+	ed.set('WriteTime', 0x01D9A2B3C4D5E6F7)
+	ed.set('FileSize', 0xFFFFFFFF)
+	lnk = _check(ed)
+	assert lnk.ShellLinkHeader.WriteTime.dwHighDateTime == 0x01D9A2B3
+	for name, value in (('WriteTime', -1), ('FileSize', 1 << 32),
+			('FileAttributes', -1)):
+		with pytest.raises(ValueError, match=name):
+			ed.set(name, value)
+	with pytest.raises(ValueError):
+		ed.set('HeaderSize', 0)
+
+def test_edit_file_keeps_mode(tmp_path):
+	path = tmp_path / 'a.lnk'
+	path.write_bytes(bytes(gen_lnk.example()))
+	os.chmod(path, 0o644)
+	edit_file(str(path), WorkingDir='C:\\Windows')
+	assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+	assert Link.from_file(path).WorkingDir == 'C:\\Windows\x00'
+	assert [p.name for p in tmp_path.iterdir()] == ['a.lnk']
+
+def test_cli_errors(tmp_path, capsys):
+	path = tmp_path / 'a.lnk'
+	path.write_bytes(bytes(gen_lnk.example()))
+	assert main([str(path), 'WriteTime=-1']) == 1
+	assert 'WriteTime' in capsys.readouterr().err
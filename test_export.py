@@ -0,0 +1,70 @@
+import datetime
+import io
+import json
+
+import pytest
+
+import export
+import gen_lnk
+import scan
+
+def _records(n=5):
+	return [scan.parse_buffer(f'{i}.lnk', bytes(gen_lnk.example() if i % 2
+		else gen_lnk.malicious())) for i in range(n)]
+
+def test_batches():
+	assert list(export.batches(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+	assert list(export.batches(iter([]), 3)) == []
+
+def test_write_jsonl(tmp_path):
+	records = _records()
+	path = tmp_path / 'links.jsonl'
+	assert export.write_jsonl(records, str(path), batch_size=2) == 5
+	rows = [json.loads(line) for line in path.read_text().splitlines()]
+	assert rows == [rec._asdict() for rec in records]
+
+	f = io.StringIO()
+	assert export.write_jsonl(iter(records), f) == 5
+	assert f.getvalue() == path.read_text()
+
+def test_format_from_extension(tmp_path):
+	records = _records(2)
+	assert export.export(records, str(tmp_path / 'a.JSON')) == 2
+	assert (tmp_path / 'a.JSON').read_text().count('\n') == 2
+	with pytest.raises(ValueError, match='Unknown output format'):
+		export.export(records, str(tmp_path / 'a.csv'))
+	with pytest.raises(ValueError, match='Unknown output format'):
+		export.export(records, str(tmp_path / 'a.jsonl'), fmt='csv')
+
+def test_pyarrow_required(tmp_path, monkeypatch):
+	monkeypatch.setattr(export, 'pa', None)
+	with pytest.raises(ImportError, match='jsonl'):
+		export.export(_records(1), str(tmp_path / 'a.parquet'))
+
+def test_record_batch():
+	pytest.importorskip('pyarrow')
+	rec = _records(1)[0]._replace(
+		CreationTime=export.UNIX_EPOCH_FILETIME + 10**7 + 15,
+		AccessTime=0, IconIndex=0xFFFFFFFF)
+	error = scan.error_record('bad.lnk', 3, 'Truncated')
+	batch = export.to_record_batch([rec, error])
+	assert batch.schema == export.schema()
+	row = batch.to_pylist()[0]
+	assert row['CreationTime'] == datetime.datetime(1970, 1, 1, 0, 0, 1, 1,
+		tzinfo=datetime.timezone.utc)
+	assert row['AccessTime'] is None
+	assert row['IconIndex'] == -1
+	assert batch.to_pylist()[1]['error'] == 'Truncated'
+
+@pytest.mark.parametrize('suffix', ['.parquet', '.arrow'])
+def test_arrow_round_trip(tmp_path, suffix):
+	pa = pytest.importorskip('pyarrow')
+	import pyarrow.parquet as pq
+	path = str(tmp_path / f'links{suffix}')
+	assert export.export(_records(), path, batch_size=2) == 5
+	if suffix == '.parquet':
+		table = pq.read_table(path)
+		assert pq.ParquetFile(path).num_row_groups == 3
+	else:
+		table = pa.ipc.open_file(path).read_all()
+	assert table.column('path').to_pylist() == [f'{i}.lnk' for i in range(5)]
@@ -0,0 +1,56 @@
+import gen_lnk
+from extra_data import (DATA_BLOCKS, ExtraData, RawDataBlock,
+	EnvironmentVariableDataBlock, ConsoleDataBlock, KnownFolderDataBlock)
+from reader import Reader
+from shell_link import Link
+
+def test_blocks_stay_raw_until_decoded():
+	data = bytes(gen_lnk.malicious())
+	lnk = Link.from_bytes(data)
+	blocks = lnk.ExtraData.DataBlocks
+	assert all(type(b) is RawDataBlock for b in blocks)
+	assert [b.Signature for b in blocks] == [
+		EnvironmentVariableDataBlock.SIGNATURE, ConsoleDataBlock.SIGNATURE]
+
+	console = lnk.ExtraData.find(ConsoleDataBlock.SIGNATURE)
+	assert type(console) is ConsoleDataBlock
+	assert bytes(console) == bytes(ConsoleDataBlock())
+	assert [type(b) for b in lnk.ExtraData.decode()] == [
+		EnvironmentVariableDataBlock, ConsoleDataBlock]
+	assert bytes(lnk) == data
+
+def test_decode_in_place():
+	data = bytes(gen_lnk.malicious())
+	raw = Link.from_bytes(data).ExtraData.DataBlocks[0]
+	block = raw.decode()
+	# A view of the source buffer, not of a copy of the block
+	assert block.TargetANSI.obj is data
+	assert bytes(block.TargetANSI).rstrip(b'\x00') == \
+		b'%windir%\\system32\\cmd.exe'
+
+	# Modified blocks are decoded from their own bytes
+	target = EnvironmentVariableDataBlock('%windir%\\notepad.exe')
+	raw.Data = bytes(target)[8:]
+	block = raw.decode()
+	assert block.TargetANSI.obj is not data
+	assert bytes(block) == bytes(target)
+
+def test_unknown_and_mis_sized_blocks():
+	unknown = RawDataBlock(0xA00000FF, b'abcd')
+	# A known signature with the wrong size is not decoded
+	short = RawDataBlock(KnownFolderDataBlock.SIGNATURE, b'1234')
+	extra = ExtraData()
+	extra.DataBlocks = [unknown, short]
+	data = bytes(extra)
+
+	parsed = ExtraData.from_buffer(Reader(data), 0)
+	assert parsed.decode()[0].Data == b'abcd'
+	assert type(parsed.DataBlocks[1]) is RawDataBlock
+	assert parsed.find(KnownFolderDataBlock.SIGNATURE) is None
+	assert parsed.find(0xA00000FF).Data == b'abcd'
+	assert bytes(parsed) == data
+
+def test_registry():
+	for signature, block in DATA_BLOCKS.items():
+		assert block.SIGNATURE == signature
+		assert signature >> 28 == 0xA
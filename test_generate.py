@@ -0,0 +1,110 @@
+import io
+import json
+import os
+
+import pytest
+
+import gen_lnk
+from extra_data import EnvironmentVariableDataBlock, TrackerDataBlock
+from generate import _output_path, build, generate, main, read_specs
+from shell_link import Link
+
+def test_build_flags_and_strings():
+	lnk = build({'flags': 'RunAsUser|HasExpIcon', 'attributes':
+		{'FILE_ATTRIBUTE_READONLY': 1}, 'WorkingDir': 'C:\\Windows',
+		'IconIndex': 3, 'WriteTime': 0x01D9A2B3C4D5E6F7})
+	assert lnk.get('RunAsUser') and lnk.get('HasExpIcon')
+	assert lnk.ShellLinkHeader.FileAttributes.get('FILE_ATTRIBUTE_READONLY')
+	# Setting a string sets its flag and IsUnicode
+	assert lnk.get('HasWorkingDir') and lnk.get('IsUnicode')
+	assert lnk.ShellLinkHeader.IconIndex == 3
+	assert lnk.ShellLinkHeader.WriteTime.dwHighDateTime == 0x01D9A2B3
+	assert bytes(Link.from_bytes(bytes(lnk))) == bytes(lnk)
+
+	ansi = build({'flags': {'IsUnicode': 0}, 'Arguments': '/c dir'})
+	assert not ansi.get('IsUnicode')
+	assert Link.from_bytes(bytes(ansi)).Arguments == '/c dir\x00'
+
+def test_build_target():
+	lnk = build({'target': 'C:\\test\\a.txt', 'serial': 0x1234})
+	parsed = Link.from_bytes(bytes(lnk))
+	assert parsed.get('HasLinkTargetIDList') and parsed.get('HasLinkInfo')
+	assert parsed.LinkInfo.VolumeID.DriveSerialNumber == 0x1234
+	assert bytes(parsed.LinkInfo.LocalBasePath) == b'C:\\test\\a.txt\x00'
+	assert bytes(parsed.LinkTargetIDList) == \
+		bytes(gen_lnk.example().LinkTargetIDList)
+
+def test_build_extra():
+	lnk = build({'base': 'example', 'extra': [
+		{'block': 'EnvironmentVariableDataBlock', 'target': '%TEMP%\\a'},
+		{'block': 'TrackerDataBlock', 'MachineID': 'host',
+			'Droid': [str(i) * 32 for i in '12']},
+	]})
+	assert lnk.get('HasExpString')
+	env, tracker = Link.from_bytes(bytes(lnk)).ExtraData.decode()
+	assert type(env) is EnvironmentVariableDataBlock
+	assert type(tracker) is TrackerDataBlock
+	assert tracker.machine == 'host'
+
+@pytest.mark.parametrize('spec', [
+	{'base': 'other'},
+	{'colour': 'red'},
+	{'extra': [{'block': 'NoSuchDataBlock'}]},
+])
+def test_build_errors(spec):
+	with pytest.raises(ValueError):
+		build(spec)
+
+def test_read_specs():
+	jsonl = io.StringIO('{"Name": "a"}\n\nnot json\n[1]\n{"IconIndex": 2}\n')
+	specs = list(read_specs(jsonl))
+	assert specs[0] == {'Name': 'a'} and specs[3] == {'IconIndex': 2}
+	assert all(isinstance(s, ValueError) for s in specs[1:3])
+
+	extra = json.dumps([{'block': 'EnvironmentVariableDataBlock',
+		'target': 'x'}]).replace('"', '""')
+	csv = io.StringIO(f'Name,IconIndex,serial,extra\na,,0x10,\n'
+		f'b,x,,\n,1,,"{extra}"\n')
+	specs = list(read_specs(csv, 'csv'))
+	assert specs[0] == {'Name': 'a', 'serial': 16}
+	assert isinstance(specs[1], ValueError)
+	assert specs[2]['extra'][0]['target'] == 'x'
+
+	# Bad rows are reported by their index
+	results = [r for batch in generate(specs, workers=0) for r in batch]
+	assert [index for index, _, error in results if error] == [1]
+
+@pytest.mark.parametrize('name', ['/tmp/a.lnk', '../a.lnk', 'sub/a.lnk',
+	os.path.join('..', 'a.lnk'), '..', '', 7])
+def test_output_path_rejected(tmp_path, name):
+	with pytest.raises(ValueError):
+		_output_path(str(tmp_path), {'output': name}, 0)
+
+def test_output_path(tmp_path):
+	assert _output_path(str(tmp_path), {}, 3) == str(tmp_path / '3.lnk')
+	assert _output_path(str(tmp_path), {'output': 'a.lnk'}, 3) == \
+		str(tmp_path / 'a.lnk')
+
+def test_generate(tmp_path):
+	specs = [{'Name': str(i)} for i in range(5)] + [{'output': '../x'}]
+	expected = [bytes(build(spec)) for spec in specs[:5]]
+
+	results = [r for batch in generate(specs, workers=0, batch_size=2)
+		for r in batch]
+	assert [data for _, data, _ in results[:5]] == expected
+	assert results[5][2] is None
+
+	results = [r for batch in generate(specs, str(tmp_path), workers=0)
+		for r in batch]
+	assert [data for _, data, _ in results] == [None] * 6
+	assert results[5][2].startswith('ValueError')
+	assert [(tmp_path / f'{i}.lnk').read_bytes() for i in range(5)] == \
+		expected
+
+def test_main_archive(tmp_path):
+	specs = tmp_path / 'specs.jsonl'
+	specs.write_text('{"Name": "a"}\n{"Name": "b"}\n')
+	archive = tmp_path / 'links.bin'
+	assert main([str(specs), '-a', str(archive), '-j', '0']) == 0
+	assert archive.read_bytes() == b''.join(bytes(build({'Name': n}))
+		for n in 'ab')
@@ -0,0 +1,72 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import gen_lnk
+import header_batch
+from filetime import FileTime
+from reader import Reader
+from shell_link_header import ShellLinkHeader
+
+def test_read_files(tmp_path):
+	paths = []
+	for i, make in enumerate((gen_lnk.example, gen_lnk.malicious)):
+		path = tmp_path / f'{i}.lnk'
+		path.write_bytes(bytes(make()))
+		paths.append(path)
+	short = tmp_path / 'short.lnk'
+	short.write_bytes(b'\x4c\x00')
+	paths.append(short)
+
+	headers = header_batch.read_files(paths)
+	assert len(headers) == 3
+	assert list(header_batch.is_valid(headers)) == [True, True, False]
+	expected = header_batch.from_buffer(b''.join(p.read_bytes()[:0x4C]
+		for p in paths[:2]))
+	assert headers[:2].tobytes() == expected.tobytes()
+	assert headers[2].tobytes() == bytes(0x4C)
+
+def test_filetime_to_datetime64():
+	times = header_batch.filetime_to_datetime64(np.array([0,
+		header_batch.UNIX_EPOCH_FILETIME, 2**63 + 10, 2**64 - 1],
+		dtype=np.uint64))
+	assert np.isnat(times[0])
+	assert times[1] == np.datetime64('1970-01-01', 'us')
+	assert times[2] > times[1]
+	assert times[3] > times[2]
+
+def test_filetime_round_trip():
+	times = np.array(['2022-01-01T12:34:56.789012'], dtype='datetime64[us]')
+	filetimes = header_batch.datetime64_to_filetime(times)
+	assert header_batch.filetime_to_datetime64(filetimes)[0] == times[0]
+
+def test_matches_shell_link_header():
+	links = [gen_lnk.example(), gen_lnk.malicious()]
+	links[0].ShellLinkHeader.WriteTime = FileTime(0xC4D5E6F7, 0x01D9A2B3)
+	links[1].ShellLinkHeader.IconIndex = 0xFFFFFFFF
+	datas = [bytes(lnk) for lnk in links]
+	buf = b''.join(datas)
+	offsets = [0, len(datas[0])]
+	headers = header_batch.from_buffer(buf, offsets)
+
+	# The dtype mirrors the Layout of the parser
+	assert [(name, headers.dtype.fields[name][1]) for name in
+		headers.dtype.names] == [(name, pos) for name, (pos, _) in
+		ShellLinkHeader.LAYOUT.offsets.items()]
+	for row, offset in zip(headers, offsets):
+		hdr = ShellLinkHeader.from_buffer(Reader(buf), offset)
+		assert row['LinkFlags'] == int(hdr.LinkFlags)
+		assert row['FileAttributes'] == int(hdr.FileAttributes)
+		for name in ('CreationTime', 'AccessTime', 'WriteTime'):
+			ft = getattr(hdr, name)
+			assert row[name] == ft.dwHighDateTime << 32 | ft.dwLowDateTime
+		for name in ('FileSize', 'IconIndex', 'ShowCommand'):
+			assert row[name] == getattr(hdr, name)
+		assert row['HotKey'] == int.from_bytes(hdr.HotKey, 'little')
+	assert list(header_batch.has_flags(headers, 'HasWorkingDir')) == \
+		[bool(lnk.get('HasWorkingDir')) for lnk in links]
+	assert list(header_batch.any_flags(headers, 'HasArguments',
+		'HasIconLocation')) == [bool(lnk.get('HasArguments') or
+		lnk.get('HasIconLocation')) for lnk in links]
+	with pytest.raises(ValueError):
+		header_batch.has_flags(headers, 'NoSuchFlag')
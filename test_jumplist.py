@@ -0,0 +1,185 @@
+import struct
+import types
+
+import pytest
+
+import gen_lnk
+import jumplist
+from jumplist import CompoundFile, ENDOFCHAIN, NOSTREAM
+from reader import LinkParseError
+from shell_link import LazyLink
+
+FREESECT = 0xFFFFFFFF
+FATSECT = 0xFFFFFFFD
+SECTOR = 512
+
+def _entry(name, object_type, start=ENDOFCHAIN, size=0):
+	encoded = name.encode('utf-16-le') + b'\x00\x00'
+	entry = types.SimpleNamespace(Name=encoded.ljust(64, b'\x00'),
+		NameLength=len(encoded), ObjectType=object_type, ColorFlag=1,
+		LeftSiblingID=NOSTREAM, RightSiblingID=NOSTREAM, ChildID=NOSTREAM,
+		CLSID=bytes(16), StateBits=0, CreationTime=0, ModifiedTime=0,
+		StartingSector=start, StreamSize=size)
+	buf = bytearray(CompoundFile.DIRECTORY_ENTRY.size)
+	CompoundFile.DIRECTORY_ENTRY.pack_into(entry, buf, 0)
+	return buf
+
+def compound_file(streams, interleave=False):
+	""" A version 3 compound file holding `streams`, a list of (name,
+		data). Streams under 4096 bytes go in the mini stream. With
+		`interleave`, the sectors of the regular streams alternate """
+	sectors = []
+	fat = []
+
+	def chains(datas, unit, table, store):
+		""" Stores `datas` in `unit` sized pieces with `store`,
+			chained in `table`, returns the start of each """
+		pieces = [[d[i:i + unit] for i in range(0, len(d), unit)]
+			for d in datas]
+		order = []
+		if interleave:
+			for i in range(max(map(len, pieces), default=0)):
+				order += [(n, p[i]) for n, p in enumerate(pieces)
+					if i < len(p)]
+		else:
+			order = [(n, piece) for n, p in enumerate(pieces) for piece in p]
+		starts = [ENDOFCHAIN] * len(datas)
+		last = [None] * len(datas)
+		for n, piece in order:
+			index = store(piece.ljust(unit, b'\x00'))
+			table.append(ENDOFCHAIN)
+			if last[n] is None:
+				starts[n] = index
+			else:
+				table[last[n]] = index
+			last[n] = index
+		return starts
+
+	def sector(data):
+		sectors.append(data)
+		return len(sectors) - 1
+
+	ministream = bytearray()
+	def mini_sector(data):
+		ministream.extend(data)
+		return len(ministream) // 64 - 1
+
+	small = [i for i, (_, d) in enumerate(streams) if len(d) < 4096]
+	large = [i for i, (_, d) in enumerate(streams) if len(d) >= 4096]
+	minifat = []
+	starts = {}
+	for i, start in zip(small, chains([streams[i][1] for i in small],
+			64, minifat, mini_sector)):
+		starts[i] = start
+	for i, start in zip(large, chains([streams[i][1] for i in large],
+			SECTOR, fat, sector)):
+		starts[i] = start
+
+	mini_start, = chains([bytes(ministream)], SECTOR, fat, sector) \
+		if ministream else [ENDOFCHAIN]
+	minifat_data = b''.join(i.to_bytes(4, 'little') for i in minifat)
+	minifat_start, = chains([minifat_data], SECTOR, fat, sector) \
+		if minifat else [ENDOFCHAIN]
+
+	directory = _entry('Root Entry', 5, mini_start, len(ministream))
+	for i, (name, data) in enumerate(streams):
+		directory += _entry(name, 2, starts[i], len(data))
+	directory_start, = chains([bytes(directory)], SECTOR, fat, sector)
+
+	# One FAT sector holds 128 entries, itself included
+	fat_sector = len(sectors)
+	fat.append(FATSECT)
+	assert len(fat) <= SECTOR // 4
+	fat += [FREESECT] * (SECTOR // 4 - len(fat))
+	sectors.append(b''.join(i.to_bytes(4, 'little') for i in fat))
+
+	header = types.SimpleNamespace(Signature=jumplist.CFB_SIGNATURE,
+		CLSID=bytes(16), MinorVersion=0x3E, MajorVersion=3,
+		ByteOrder=0xFFFE, SectorShift=9, MiniSectorShift=6,
+		NumDirectorySectors=0, NumFATSectors=1,
+		FirstDirectorySector=directory_start, TransactionSignature=0,
+		MiniStreamCutoff=4096, FirstMiniFATSector=minifat_start,
+		NumMiniFATSectors=1 if minifat else 0,
+		FirstDIFATSector=ENDOFCHAIN, NumDIFATSectors=0,
+		DIFAT=[fat_sector] + [FREESECT] * 108)
+	buf = bytearray(SECTOR)
+	CompoundFile.HEADER.pack_into(header, buf, 0)
+	return bytes(buf) + b''.join(sectors)
+
+def _padded(make, size):
+	""" A link followed by padding, as a stream of `size` bytes """
+	return bytes(make()).ljust(size, b'\x00')
+
+@pytest.mark.parametrize('size', [0, 5000])
+@pytest.mark.parametrize('interleave', [False, True])
+def test_automatic(tmp_path, size, interleave):
+	example = _padded(gen_lnk.example, size)
+	malicious = _padded(gen_lnk.malicious, size)
+	corrupt = bytearray(malicious)
+	corrupt[0x4C:0x4E] = b'\xff\xff'	# IDListSize past the stream
+	data = compound_file([('DestList', b'\x01' * 64), ('1', example),
+		('2', bytes(corrupt)), ('a', malicious)], interleave)
+
+	links = list(jumplist.iter_automatic(data))
+	assert [name for name, _ in links] == ['1', 'a']
+	assert bytes(links[0][1]) == bytes(gen_lnk.example())
+	assert bytes(links[1][1]) == bytes(gen_lnk.malicious())
+
+	# LazyLink only checks the header up front, so the corrupt
+	# stream is left out
+	path = tmp_path / 'x.automaticDestinations-ms'
+	path.write_bytes(compound_file([('DestList', b'\x01' * 64),
+		('1', example), ('a', malicious)], interleave))
+	lazy = list(jumplist.iter_links(path, LazyLink))
+	assert [lnk.WorkingDir for _, lnk in lazy] == ['C:\\test\x00', '%TEMP%\x00']
+
+def test_contiguous_streams_are_shared():
+	# Over the mini stream cutoff, in consecutive sectors
+	malicious = bytes(gen_lnk.malicious())
+	data = compound_file([('1', malicious)])
+	cfb = CompoundFile(data)
+	reader, offset = cfb.open(next(cfb.streams()))
+	assert reader.data is cfb.reader.data
+	assert bytes(reader.mv[offset:reader.end]) == malicious
+
+def test_custom(tmp_path):
+	example = bytes(gen_lnk.example())
+	malicious = bytes(gen_lnk.malicious())
+	# A signature followed by garbage is skipped
+	data = (b'\x02\x00\x00\x00' + example + b'\xab\xfb\xbf\xba' +
+		jumplist.SIGNATURE + b'\xff' * 40 + malicious)
+	links = list(jumplist.iter_custom(data))
+	assert [offset for offset, _ in links] == [4,
+		len(data) - len(malicious)]
+	assert [bytes(lnk) for _, lnk in links] == [example, malicious]
+
+	path = tmp_path / 'x.customDestinations-ms'
+	path.write_bytes(data)
+	assert len(list(jumplist.iter_links(path))) == 2
+	empty = tmp_path / 'empty.customDestinations-ms'
+	empty.write_bytes(b'')
+	assert list(jumplist.iter_links(empty)) == []
+
+def test_invalid_compound_file():
+	data = bytearray(compound_file([('1', bytes(gen_lnk.example()))]))
+	data[0x1C] = 0
+	with pytest.raises(ValueError):
+		CompoundFile(bytes(data))
+
+def test_cyclic_difat():
+	data = bytearray(compound_file([('1', bytes(gen_lnk.example()))]))
+	# A DIFAT sector listing no FAT sectors and pointing to itself
+	difat = len(data) // SECTOR - 1
+	data += struct.pack(f'<{SECTOR // 4 - 1}I', *[FREESECT] *
+		(SECTOR // 4 - 1)) + struct.pack('<I', difat)
+	struct.pack_into('<I', data, 0x44, difat)
+	struct.pack_into('<I', data, 0x48, 0x00FFFFFF)
+	# The FAT is complete before the DIFAT is walked
+	assert list(CompoundFile(bytes(data)).streams())
+
+	struct.pack_into('<I', data, 0x2C, 1000)
+	with pytest.raises(LinkParseError, match='DIFAT'):
+		CompoundFile(bytes(data))
+	struct.pack_into('<I', data, 0x44, difat + 1)
+	with pytest.raises(LinkParseError, match='DIFAT'):
+		CompoundFile(bytes(data))
@@ -0,0 +1,148 @@
+import struct
+import types
+
+import pytest
+
+import extra_data
+import gen_lnk
+import jumplist
+import link_info
+from filetime import FileTime
+from layout import Layout
+from reader import LinkParseError, Reader
+from shell_link_header import ShellLinkHeader
+
+LAYOUTS = [extra_data.BLOCK_HEADER, FileTime.LAYOUT, ShellLinkHeader.LAYOUT,
+	jumplist.CompoundFile.HEADER, jumplist.CompoundFile.DIRECTORY_ENTRY]
+for cls in (*extra_data.DATA_BLOCKS.values(), extra_data.FileDataBlock,
+		link_info.CommonNetworkRelativeLink, link_info.VolumeID,
+		link_info.LinkInfo):
+	LAYOUTS += [getattr(cls, name) for name in ('LAYOUT', 'UNICODE_LAYOUT')
+		if hasattr(cls, name)]
+
+def _sample(layout):
+	""" An object with a distinct value in every field of `layout` """
+	obj = types.SimpleNamespace()
+	n = 0
+	def value(code):
+		nonlocal n
+		n += 1
+		bits = 8 * struct.calcsize(code) - 1
+		return (n * 0x9E3779B1) % (1 << bits)
+	for field, fmt in layout.fields:
+		if field is None:
+			continue
+		if not isinstance(fmt, str):
+			nested = fmt.__new__(fmt)
+			for f, code in fmt.LAYOUT.fields:
+				setattr(nested, f, value(code))
+			setattr(obj, field, nested)
+			continue
+		count, code = int(fmt[:-1] or 1), fmt[-1]
+		if code == 's':
+			setattr(obj, field, bytes((n + i) % 256 for i in range(count)))
+			n += 1
+		elif fmt[:-1]:
+			setattr(obj, field, [value(code) for _ in range(count)])
+		else:
+			setattr(obj, field, value(code))
+	return obj
+
+def _values(layout, obj):
+	values = {}
+	for field, fmt in layout.fields:
+		if field is None:
+			continue
+		value = getattr(obj, field)
+		if not isinstance(fmt, str):
+			value = tuple(getattr(value, f) for f, _ in fmt.LAYOUT.fields)
+		elif fmt[-1] == 's':
+			value = bytes(value)
+		values[field] = value
+	return values
+
+@pytest.mark.parametrize('layout', LAYOUTS, ids=repr)
+def test_round_trip(layout):
+	obj = _sample(layout)
+	buf = bytearray(3 + layout.end)
+	assert layout.pack_into(obj, buf, 3) == 3 + layout.end
+	assert layout.struct.size == layout.size
+
+	parsed = types.SimpleNamespace()
+	layout.unpack_into(parsed, Reader(bytes(buf)), 3)
+	assert _values(layout, parsed) == _values(layout, obj)
+	again = bytearray(len(buf))
+	layout.pack_into(parsed, again, 3)
+	assert again == buf
+
+	# Every field is at its offset
+	for field, (pos, fmt) in layout.offsets.items():
+		value = _values(layout, obj)[field]
+		if fmt.endswith('s'):
+			assert buf[3 + pos:3 + pos + len(value)] == value
+		else:
+			if isinstance(value, int):
+				value = [value]
+			assert struct.unpack_from('<' + fmt, buf, 3 + pos) == \
+				tuple(value)
+	pos, fmt = list(layout.offsets.values())[-1]
+	assert pos + struct.calcsize('<' + fmt) <= layout.end
+	assert min(pos for pos, _ in layout.offsets.values()) >= layout.start
+
+@pytest.mark.parametrize('layout', LAYOUTS, ids=repr)
+def test_truncated(layout):
+	buf = bytearray(layout.end)
+	layout.pack_into(_sample(layout), buf, 0)
+	reader = Reader(bytes(buf[:-1]))
+	with pytest.raises(LinkParseError):
+		layout.unpack_into(types.SimpleNamespace(), reader, 0)
+	with pytest.raises(LinkParseError):
+		layout.unpack(reader, 0)
+
+def test_offsets():
+	layout = Layout('Test', [
+		('a', 'B'),
+		(None, '3x'),
+		('b', '4s'),
+		('c', '2H'),
+		('t', FileTime),
+	])
+	assert layout.offsets == {'a': (0, 'B'), 'b': (4, '4s'),
+		'c': (8, '2H'), 't': (12, 'II')}
+	assert layout.size == layout.end == 20
+	tail = Layout('Tail', [('d', 'I')], start=layout.end)
+	assert tail.offsets == {'d': (20, 'I')}
+	assert (tail.size, tail.end) == (4, 24)
+
+	obj = types.SimpleNamespace(a=1, b=b'abcd', c=[2, 3], t=FileTime(4, 5),
+		d=6)
+	buf = bytearray(tail.end)
+	assert tail.pack_into(obj, buf, layout.pack_into(obj, buf, 0) -
+		layout.end) == 24
+	assert bytes(buf) == struct.pack('<B3x4s2H2II', 1, b'abcd', 2, 3, 4, 5, 6)
+	assert layout.unpack(Reader(bytes(buf)), 0) == (1, b'abcd', 2, 3, 4, 5)
+	assert tail.unpack(Reader(bytes(buf)), 0) == (6,)
+
+def test_raw_fields_are_exact():
+	layout = Layout('Test', [('b', '4s')])
+	with pytest.raises(ValueError, match='b must be 4 bytes'):
+		layout.pack_into(types.SimpleNamespace(b=b'abc'), bytearray(4), 0)
+
+@pytest.mark.parametrize('fields', [
+	[('a', 'Z')],
+	[('a', '2x')],
+	[(None, 'I')],
+	[('not valid', 'I')],
+	[('t', ShellLinkHeader)],
+])
+def test_invalid_layouts(fields):
+	with pytest.raises(ValueError):
+		Layout('Test', fields)
+
+@pytest.mark.parametrize('make', (gen_lnk.example, gen_lnk.malicious))
+def test_structures(make):
+	lnk = make()
+	for obj in (lnk.ShellLinkHeader, lnk.LinkInfo, lnk.LinkInfo.VolumeID,
+			lnk.ShellLinkHeader.WriteTime):
+		data = bytes(obj)
+		assert bytes(type(obj).from_buffer(Reader(data), 0)) == data
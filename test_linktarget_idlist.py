@@ -0,0 +1,56 @@
+import pytest
+
+import gen_lnk
+from linktarget_idlist import (LinkTargetIDList, ItemID, FileShellItem,
+	FileShellItemAttributes)
+from shell_link import Link
+
+def test_extend_keeps_idlist_size():
+	idlist = LinkTargetIDList()
+	idlist.add_payload(FileShellItem('a.txt\x00'))
+	idlist.add(3, 1, b'abc')
+	assert idlist.IDListSize == idlist.IDList.size()
+	assert bytes(LinkTargetIDList()) == b'\x02\x00\x00\x00'
+
+def test_size_follows_direct_changes():
+	lnk = gen_lnk.example()
+	lnk.LinkTargetIDList.IDList.ItemIDList.append(ItemID(3, 1, b'abcd'))
+	data = bytes(lnk)
+	parsed = Link.from_bytes(data)
+	assert len(parsed.LinkTargetIDList.IDList.ItemIDList) == 5
+	assert bytes(parsed) == data
+
+	# A stale running total is ignored as well
+	idlist = LinkTargetIDList()
+	idlist.IDListSize = 100
+	idlist.add(3, 1, b'abc')
+	assert bytes(idlist)[:2] == b'\x08\x00'
+	assert idlist.IDListSize == 8
+
+def test_from_path_matches_example():
+	expected = bytes(gen_lnk.example().LinkTargetIDList)
+	assert bytes(LinkTargetIDList.from_path('C:\\test\\a.txt')) == expected
+	assert bytes(LinkTargetIDList.from_path('c:/test/a.txt')) == expected
+
+def test_from_path_cache():
+	LinkTargetIDList.cache_clear()
+	a = LinkTargetIDList.from_path('C:\\dir\\a.txt')
+	b = LinkTargetIDList.from_path('C:\\dir\\b.txt')
+	# The directory item is built once and shared
+	assert a.IDList.ItemIDList[2].Data is b.IDList.ItemIDList[2].Data
+	assert LinkTargetIDList.cache_info().hits == 1
+	LinkTargetIDList.cache_clear()
+	assert LinkTargetIDList.cache_info().currsize == 0
+
+def test_from_path_attributes():
+	hidden = LinkTargetIDList.from_path('C:\\a.txt',
+		attrs={'FILE_ATTRIBUTE_HIDDEN': 1})
+	mask = FileShellItemAttributes.masks['FILE_ATTRIBUTE_HIDDEN']
+	assert bytes(hidden) == bytes(LinkTargetIDList.from_path('C:\\a.txt',
+		attrs=mask))
+	assert bytes(hidden) != bytes(LinkTargetIDList.from_path('C:\\a.txt'))
+	assert hidden.IDList.ItemIDList[-1].TypeData == 2
+	with pytest.raises(ValueError):
+		LinkTargetIDList.from_path('test\\a.txt')
+	with pytest.raises(ValueError):
+		LinkTargetIDList.from_path('C:\\a.txt', attrs={'NOPE': 1})
@@ -0,0 +1,36 @@
+import pytest
+
+import gen_lnk
+import validate
+from mutate import Mutator, compile_link
+from shell_link import Link
+
+@pytest.mark.parametrize('make', (gen_lnk.example, gen_lnk.malicious))
+def test_consistent_cases_parse(make):
+	mutator = Mutator(make(), seed=1, consistent=True)
+	assert mutator.template is not None
+	for data in mutator.cases(500):
+		Link.from_bytes(data)
+		errors = [f for f in validate.validate(data)
+			if f.severity == validate.ERROR]
+		assert not errors
+
+def test_cases_are_reproducible():
+	mutator = Mutator(gen_lnk.malicious(), seed=7)
+	cases = list(mutator.cases(20))
+	assert [mutator.mutate(i) for i in range(20)] == cases
+	assert list(Mutator(gen_lnk.malicious(), seed=7).cases(5, 10)) == \
+		cases[10:15]
+
+def test_compile_link():
+	data = bytes(gen_lnk.example())
+	fields, sections = compile_link(data)
+	lnk = Link.from_bytes(data)
+	values = {f.name: f.fmt.unpack_from(data, f.offset)[0] for f in fields}
+	assert values['WriteTime.dwLowDateTime'] == \
+		lnk.ShellLinkHeader.WriteTime.dwLowDateTime
+	assert values['LocalBasePathOffset'] == lnk.LinkInfo.LocalBasePathOffset
+	assert values['DriveSerialNumber'] == \
+		lnk.LinkInfo.VolumeID.DriveSerialNumber
+	assert [s.name for s in sections][:3] == ['ShellLinkHeader',
+		'LinkTargetIDList', 'LinkInfo']
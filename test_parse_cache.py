@@ -0,0 +1,85 @@
+import os
+
+import gen_lnk
+import scan
+from parse_cache import ParseCache
+from reader import DEFAULT_LIMITS
+
+def _corpus(tmp_path, n=3):
+	paths = []
+	for i in range(n):
+		path = tmp_path / f'{i}.lnk'
+		path.write_bytes(bytes(gen_lnk.example() if i % 2 else
+			gen_lnk.malicious()))
+		paths.append(str(path))
+	return paths
+
+def _records(cache, tmp_path):
+	return sorted(cache.scan([str(tmp_path)]))
+
+def test_hits_and_changes(tmp_path):
+	paths = _corpus(tmp_path)
+	db = str(tmp_path / 'cache.db')
+	with ParseCache(db) as cache:
+		first = _records(cache, tmp_path)
+		assert cache.counters['parsed'] == 3
+	assert first == sorted(scan.parse_buffer(p, open(p, 'rb').read())
+		for p in paths)
+
+	# Touched only, then modified
+	st = os.stat(paths[0])
+	os.utime(paths[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+	with open(paths[1], 'wb') as f:
+		f.write(bytes(gen_lnk.malicious()))
+	with ParseCache(db) as cache:
+		second = _records(cache, tmp_path)
+		assert (cache.counters['hits'], cache.counters['rehashed'],
+			cache.counters['parsed']) == (1, 1, 1)
+		assert cache.stats()['generation'] == 2
+	assert second[0] == first[0]
+	assert second[1].size == os.path.getsize(paths[1])
+
+def test_limits_clear_the_cache(tmp_path):
+	_corpus(tmp_path)
+	db = str(tmp_path / 'cache.db')
+	with ParseCache(db) as cache:
+		_records(cache, tmp_path)
+	limits = DEFAULT_LIMITS._replace(max_blocks=1)
+	with ParseCache(db, limits=limits) as cache:
+		records = _records(cache, tmp_path)
+		assert cache.counters['parsed'] == 3
+	assert [r.limit for r in records] == ['max_blocks', None, 'max_blocks']
+	# The CPU time budget is not part of the key
+	with ParseCache(db, limits=limits._replace(max_cpu_time=5)) as cache:
+		_records(cache, tmp_path)
+		assert cache.counters['hits'] == 3
+
+def test_cpu_budget_not_cached(tmp_path):
+	_corpus(tmp_path, 1)
+	db = str(tmp_path / 'cache.db')
+	limits = DEFAULT_LIMITS._replace(max_cpu_time=-1)
+	with ParseCache(db, limits=limits) as cache:
+		rec, = _records(cache, tmp_path)
+		assert rec.limit == 'max_cpu_time'
+		assert cache.counters['uncached'] == 1
+		assert cache.stats()['entries'] == 0
+
+def test_eviction(tmp_path):
+	paths = _corpus(tmp_path, 4)
+	db = str(tmp_path / 'cache.db')
+	with ParseCache(db) as cache:
+		_records(cache, tmp_path)
+	with ParseCache(db, max_entries=2) as cache:
+		for path in paths[2:]:
+			cache.get(path)
+		cache.commit()
+		assert cache.counters['evicted'] == 2
+		assert cache.stats()['entries'] == 2
+		cache.get(paths[0])
+		assert cache.counters['parsed'] == 1
+
+def test_missing_file(tmp_path):
+	with ParseCache(str(tmp_path / 'cache.db')) as cache:
+		rec = cache.get(str(tmp_path / 'missing.lnk'))
+		assert rec.error
+		assert cache.counters['uncached'] == 1
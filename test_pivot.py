@@ -0,0 +1,73 @@
+import uuid
+
+import pytest
+
+import gen_lnk
+import scan
+from extra_data import TrackerDataBlock
+from pivot import PivotIndex, pivots
+
+VOLUME = uuid.UUID('b4e3a9a4-0fd5-4a55-8e63-5c0d2b9c1e01')
+FILE = uuid.uuid1(node=0x0011223344AA, clock_seq=1)
+
+def _records():
+	lnk = gen_lnk.example()
+	lnk.ExtraData.DataBlocks.append(TrackerDataBlock('WORKSTATION',
+		VOLUME.bytes_le + FILE.bytes_le))
+	tracked = scan.parse_buffer('tracked.lnk', bytes(lnk))
+	plain = scan.parse_buffer('malicious.lnk', bytes(gen_lnk.malicious()))
+	broken = scan.parse_buffer('broken.lnk', bytes(gen_lnk.example())[:100])
+	return tracked, plain, broken
+
+def test_pivots():
+	tracked, plain, _ = _records()
+	found = pivots(tracked)
+	assert ('serial', '307a8a81') in found
+	assert ('path', 'c:\\test\\a.txt') in found
+	assert ('machine', 'workstation') in found
+	assert ('droid', str(FILE)) in found
+	assert ('mac', '00:11:22:33:44:aa') in found
+	assert pivots(plain) == {('env', '%windir%\\system32\\cmd.exe')}
+
+def test_lookups(tmp_path):
+	tracked, plain, broken = _records()
+	with PivotIndex(str(tmp_path / 'links.idx')) as index:
+		assert index.add([tracked, plain, broken]) == 2
+		assert index.lookup('serial', 0x307A8A81) == ['tracked.lnk']
+		assert index.lookup('serial', '307A-8A81') == ['tracked.lnk']
+		assert index.lookup('path', 'C:\\TEST\\A.TXT') == ['tracked.lnk']
+		assert index.lookup('mac', '00-11-22-33-44-AA') == ['tracked.lnk']
+		assert index.lookup('mac', str(FILE)) == ['tracked.lnk']
+		assert index.lookup('env', '%WINDIR%\\system32\\cmd.exe') == \
+			['malicious.lnk']
+		assert index.lookup('serial', '307a8a82') == []
+		with pytest.raises(ValueError):
+			index.lookup('colour', 'red')
+
+@pytest.mark.parametrize('kind, prefix', [
+	('serial', '0x307A'),
+	('serial', '307a-8'),
+	('path', 'C:\\Test'),
+	('droid', '{' + str(VOLUME)[:9].upper()),
+	('droid', VOLUME.hex[:10]),
+	('mac', '00-11-22'),
+	('mac', '0011.22'),
+	('mac', '001122334'),
+])
+def test_prefix_lookups(tmp_path, kind, prefix):
+	tracked, _, _ = _records()
+	with PivotIndex(str(tmp_path / 'links.idx')) as index:
+		index.add([tracked])
+		assert index.lookup(kind, prefix, prefix=True) == ['tracked.lnk']
+
+def test_replace_and_remove(tmp_path):
+	tracked, plain, _ = _records()
+	with PivotIndex(str(tmp_path / 'links.idx')) as index:
+		index.add([tracked, plain])
+		# Re-adding a path replaces its pivots
+		index.add([plain._replace(path='tracked.lnk')])
+		assert index.lookup('serial', 0x307A8A81) == []
+		assert index.values('env') == [('%windir%\\system32\\cmd.exe', 2)]
+		index.remove(['malicious.lnk'])
+		assert index.lookup('env', '%windir%\\system32\\cmd.exe') == \
+			['tracked.lnk']
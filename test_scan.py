@@ -0,0 +1,88 @@
+import functools
+import json
+
+import pytest
+
+import gen_lnk
+import scan
+from reader import DEFAULT_LIMITS
+
+def _corpus(tmp_path):
+	""" Good, corrupt and empty links, some nested, and files that are
+		not links. Returns {path: expected record} """
+	example = bytes(gen_lnk.example())
+	malicious = bytes(gen_lnk.malicious())
+	files = {
+		'a.lnk': example,
+		'B.LNK': malicious,
+		'sub/c.lnk': example,
+		'sub/deeper/d.lnk': malicious,
+		'sub/truncated.lnk': malicious[:100],
+		'sub/bad_header.lnk': b'\x00' + example[1:],
+		'empty.lnk': b'',
+		'notes.txt': b'not a link',
+	}
+	expected = {}
+	for name, data in files.items():
+		path = tmp_path / name
+		path.parent.mkdir(parents=True, exist_ok=True)
+		path.write_bytes(data)
+		if name.lower().endswith('.lnk'):
+			expected[str(path)] = scan.parse_buffer(str(path), data)
+	return expected
+
+def _flatten(batches):
+	return [rec for batch in batches for rec in batch]
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_scan(tmp_path, workers):
+	expected = _corpus(tmp_path)
+	batches = list(scan.scan([str(tmp_path)], workers, batch_size=3))
+	assert all(0 < len(batch) <= 3 for batch in batches)
+	records = _flatten(batches)
+	assert sorted(rec.path for rec in records) == sorted(expected)
+	for rec in records:
+		assert rec == expected[rec.path]
+
+	errors = {rec.path.rsplit('/', 1)[-1]: rec.error for rec in records
+		if rec.error}
+	assert sorted(errors) == ['bad_header.lnk', 'empty.lnk',
+		'truncated.lnk']
+	assert errors['empty.lnk'] == 'Empty file'
+	assert 'HeaderSize' in errors['bad_header.lnk']
+
+	good = [rec for rec in records if rec.path.endswith('c.lnk')][0]
+	assert good.LocalBasePath == 'C:\\test\\a.txt'
+	assert good.WorkingDir == 'C:\\test'
+
+def test_scan_order_and_arguments(tmp_path):
+	_corpus(tmp_path)
+	missing = str(tmp_path / 'missing.lnk')
+	paths = [str(tmp_path / 'notes.txt'), str(tmp_path / 'sub'), missing]
+	serial = _flatten(scan.scan(paths, 0, batch_size=2))
+	# Files given directly are parsed whatever their name
+	assert serial[0].path.endswith('notes.txt') and serial[0].error
+	assert serial[-1].path == missing
+	assert serial[-1].size is None and serial[-1].error
+	assert _flatten(scan.scan(paths, 2, batch_size=2)) == serial
+
+	# The pattern and another batch parser are passed through
+	limits = DEFAULT_LIMITS._replace(max_blocks=1)
+	records = _flatten(scan.scan([str(tmp_path)], 2, pattern='b.*',
+		parse_batch=functools.partial(scan.parse_batch, limits=limits)))
+	assert [rec.limit for rec in records] == ['max_blocks']
+
+def test_iter_files(tmp_path):
+	_corpus(tmp_path)
+	found = list(scan.iter_files([str(tmp_path / 'sub'),
+		str(tmp_path / 'nowhere')]))
+	assert len(found) == 5
+	assert found[-1] == str(tmp_path / 'nowhere')
+
+def test_main(tmp_path, capsys):
+	expected = _corpus(tmp_path)
+	scan.main([str(tmp_path), '-j', '0'])
+	out, err = capsys.readouterr()
+	rows = [json.loads(line) for line in out.splitlines()]
+	assert sorted(row['path'] for row in rows) == sorted(expected)
+	assert f'{len(expected)} files (3 errors)' in err
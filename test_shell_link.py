@@ -0,0 +1,116 @@
+import io
+import time
+
+import pytest
+
+import gen_lnk
+import scan
+from extra_data import EnvironmentVariableDataBlock
+from reader import DEFAULT_LIMITS, Reader
+from shell_link import Link, LazyLink, CompactLink
+
+SHAPES = (gen_lnk.example, gen_lnk.malicious)
+
+@pytest.mark.parametrize('make', SHAPES)
+def test_round_trip(make):
+	data = bytes(make())
+	lnk = Link.from_bytes(data)
+	assert bytes(lnk) == data
+	assert bytes(Link.from_bytes(memoryview(data))) == data
+
+@pytest.mark.parametrize('make', SHAPES)
+def test_write_to(make):
+	lnk = make()
+	f = io.BytesIO()
+	assert lnk.write_to(f) == len(f.getvalue())
+	assert f.getvalue() == bytes(lnk)
+
+@pytest.mark.parametrize('make', SHAPES)
+def test_strings_follow_is_unicode(make):
+	lnk = make()
+	for unicode in (0, 1):
+		lnk.set('IsUnicode', unicode)
+		data = bytes(lnk)
+		parsed = Link.from_bytes(data)
+		assert bytes(parsed) == data
+		# The writer counts the terminating NUL in the string
+		expected = lnk.WorkingDir.rstrip('\x00') + '\x00'
+		assert parsed.WorkingDir == expected
+		assert LazyLink(data).WorkingDir == expected
+		assert CompactLink(data).WorkingDir == expected
+
+def test_non_latin1_string_sets_is_unicode():
+	lnk = Link()
+	lnk.set('HasName', 1)
+	lnk.Name = 'Привет'
+	data = bytes(lnk)
+	assert lnk.get('IsUnicode')
+	parsed = Link.from_bytes(data)
+	assert parsed.Name == 'Привет\x00'
+	assert bytes(parsed) == data
+
+def test_latin1_strings_keep_code_page():
+	lnk = Link()
+	lnk.set('HasName', 1)
+	lnk.Name = 'café'
+	data = bytes(lnk)
+	assert not lnk.get('IsUnicode')
+	assert Link.from_bytes(data).Name == 'café\x00'
+
+def test_cpu_budget_per_parse():
+	data = bytes(gen_lnk.malicious())
+	limits = DEFAULT_LIMITS._replace(max_cpu_time=0.05)
+	lazy = LazyLink(Reader(data, limits=limits))
+	compact = CompactLink(Reader(data, limits=limits))
+	# CPU time spent before a section is decoded does not count
+	deadline = time.thread_time() + 0.1
+	while time.thread_time() < deadline:
+		pass
+	assert lazy.ExtraData.DataBlocks
+	assert compact.ExtraData.DataBlocks
+
+def test_limit_in_record():
+	data = bytes(gen_lnk.malicious())
+	rec = scan.parse_buffer('a.lnk', data, DEFAULT_LIMITS._replace(
+		max_blocks=1))
+	assert rec.limit == 'max_blocks'
+	assert rec.error.startswith('max_blocks exceeded')
+	assert scan.parse_buffer('a.lnk', data).limit is None
+
+def _rebuilt(lnk, before):
+	""" Names of the sections whose bytes are not the cached objects of
+		`before`, checking the link writes like a freshly parsed one """
+	after = dict(zip((name for name, _ in lnk._sections()),
+		lnk.section_bytes()))
+	assert b''.join(after.values()) == bytes(Link.from_bytes(bytes(lnk)))
+	return sorted(name for name, bs in after.items()
+		if before.get(name) is not bs), after
+
+def test_section_cache():
+	lnk = Link.from_bytes(bytes(gen_lnk.malicious()))
+	lnk.set('HasLinkInfo', 1)
+	lnk.LinkInfo = gen_lnk.example().LinkInfo
+	_, parts = _rebuilt(lnk, {})
+	# Unchanged, every section is reused
+	assert _rebuilt(lnk, parts)[0] == []
+	assert [a is b for a, b in zip(lnk.section_bytes(),
+		lnk.section_bytes())] == [True] * len(parts)
+
+	edits = [
+		('ShellLinkHeader', lambda: setattr(
+			lnk.ShellLinkHeader.CreationTime, 'dwLowDateTime', 0x12345678)),
+		('LinkInfo', lambda: setattr(
+			lnk.LinkInfo.VolumeID, 'DriveSerialNumber', 0xDEADBEEF)),
+		('ExtraData', lambda: lnk.ExtraData.DataBlocks.append(
+			EnvironmentVariableDataBlock('%windir%\\notepad.exe'))),
+		('WorkingDir', lambda: setattr(lnk, 'WorkingDir', 'C:\\Windows')),
+	]
+	for name, edit in edits:
+		edit()
+		changed, parts = _rebuilt(lnk, parts)
+		assert changed == [name]
+	parsed = Link.from_bytes(bytes(lnk))
+	assert parsed.ShellLinkHeader.CreationTime.dwLowDateTime == 0x12345678
+	assert parsed.LinkInfo.VolumeID.DriveSerialNumber == 0xDEADBEEF
+	assert len(parsed.ExtraData.DataBlocks) == 3
+	assert parsed.WorkingDir == 'C:\\Windows\x00'
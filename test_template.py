@@ -0,0 +1,82 @@
+import pytest
+
+import gen_lnk
+from filetime import FileTime
+from link_info import LinkInfo
+from shell_link import Link
+from template import LinkTemplate
+
+def _unicode_link():
+	""" example() with a LinkInfo holding the unicode paths """
+	lnk = gen_lnk.example()
+	info = LinkInfo(use_opt=True)
+	info.set('VolumeIDAndLocalBasePath', 1)
+	info.VolumeID = lnk.LinkInfo.VolumeID
+	info.LocalBasePath = b'C:\\test\\a.txt\x00'
+	info.CommonPathSuffix = b'\x00'
+	info.LocalBasePathUnicode = 'C:\\test\\a.txt\x00'.encode('utf-16-le')
+	info.CommonPathSuffixUnicode = b'\x00\x00'
+	lnk.LinkInfo = info
+	return lnk
+
+def test_local_base_path():
+	lnk = gen_lnk.example()
+	tpl = LinkTemplate(lnk, ('LocalBasePath',))
+	assert tpl.render() == bytes(lnk)
+
+	path = 'C:\\Windows\\System32\\notepad.exe'
+	parsed = Link.from_bytes(tpl.render(LocalBasePath=path))
+	info = parsed.LinkInfo
+	assert bytes(info.LocalBasePath) == path.encode() + b'\x00'
+	delta = len(path) - len('C:\\test\\a.txt')
+	assert info.LinkInfoSize == lnk.LinkInfo.LinkInfoSize + delta
+	assert info.CommonPathSuffixOffset == \
+		lnk.LinkInfo.CommonPathSuffixOffset + delta
+	assert bytes(info.CommonPathSuffix) == b'\x00'
+
+	lnk.LinkInfo.LocalBasePath = path.encode() + b'\x00'
+	assert tpl.render(LocalBasePath=path) == bytes(lnk)
+
+def test_local_base_path_unicode():
+	lnk = _unicode_link()
+	lnk.set('HasArguments', 1)
+	lnk.Arguments = '/x'
+	tpl = LinkTemplate(lnk, ('LocalBasePath', 'Arguments'))
+	assert tpl.render() == bytes(lnk)
+
+	path = 'C:\\Windows\\notepad.exe'
+	data = tpl.render(LocalBasePath=path.encode(), Arguments='/a')
+	info = Link.from_bytes(data).LinkInfo
+	assert str(info.LocalBasePathUnicode, 'utf-16-le') == path + '\x00'
+	assert info.CommonPathSuffixOffsetUnicode == \
+		info.LocalBasePathOffsetUnicode + 2 * len(path) + 2
+
+	lnk.LinkInfo.LocalBasePath = path.encode() + b'\x00'
+	lnk.LinkInfo.LocalBasePathUnicode = (path + '\x00').encode('utf-16-le')
+	lnk.Arguments = '/a'
+	assert data == bytes(lnk)
+
+@pytest.mark.parametrize('unicode', [0, 1])
+def test_string_and_header_slots(unicode):
+	slots = ('Arguments', 'WorkingDir', 'WriteTime', 'IconIndex',
+		'ShowCommand')
+	lnk = gen_lnk.malicious()
+	lnk.set('IsUnicode', unicode)
+	tpl = LinkTemplate(lnk, slots)
+	assert tpl.render() == bytes(lnk)
+
+	values = {'Arguments': '/c calc.exe', 'WorkingDir': 'C:\\Windows',
+		'WriteTime': 0x01D9A2B3C4D5E6F7, 'IconIndex': 7, 'ShowCommand': 3}
+	lnk.Arguments = values['Arguments']
+	lnk.WorkingDir = values['WorkingDir']
+	lnk.ShellLinkHeader.WriteTime = FileTime(0xC4D5E6F7, 0x01D9A2B3)
+	lnk.ShellLinkHeader.IconIndex = 7
+	lnk.ShellLinkHeader.ShowCommand = 3
+	assert tpl.render(**values) == bytes(lnk)
+	assert list(tpl.render_many([values, {}]))[0] == bytes(lnk)
+
+def test_unsupported_slots():
+	with pytest.raises(ValueError, match='Unsupported'):
+		LinkTemplate(gen_lnk.example(), ('LocalBasePathUnicode',))
+	with pytest.raises(ValueError, match='HasArguments'):
+		LinkTemplate(gen_lnk.example(), ('Arguments',))
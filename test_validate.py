@@ -0,0 +1,76 @@
+import struct
+
+import pytest
+
+import gen_lnk
+import validate
+from shell_link import Link
+
+SHAPES = (gen_lnk.example, gen_lnk.malicious)
+
+def _errors(findings):
+	return [f for f in findings if f.severity == validate.ERROR]
+
+@pytest.mark.parametrize('make', SHAPES)
+def test_valid_links(make):
+	data = bytes(make())
+	for buf in (data, bytearray(data), memoryview(data)):
+		findings = validate.validate(buf)
+		assert validate.is_valid(findings)
+	shifted = validate.validate(b'\x00' * 8 + data, 8)
+	assert [f.offset - 8 for f in shifted] == [f.offset for f in findings]
+
+def test_unterminated_string():
+	lnk = gen_lnk.example()
+	data = bytearray(bytes(lnk))
+	# CommonPathSuffix is the last string of the LinkInfo
+	start = lnk.index()['LinkInfo'] + lnk.LinkInfo.CommonPathSuffixOffset
+	data[start] = ord('A')
+	# Searched in place, bytearrays and memoryviews included
+	for buf in (bytes(data), data, memoryview(data)):
+		errors = _errors(validate.validate(buf))
+		assert [(f.section, f.offset) for f in errors] == \
+			[('CommonPathSuffix', start)]
+
+def test_truncated():
+	data = bytes(gen_lnk.malicious())
+	errors = _errors(validate.validate(data[:-10]))
+	assert errors and errors[0].section in ('ExtraData',
+		'ConsoleDataBlock')
+	assert _errors(validate.validate(data[:0x20]))[0].section == \
+		'ShellLinkHeader'
+
+def test_bad_idlist():
+	lnk = gen_lnk.example()
+	data = bytearray(bytes(lnk))
+	start = lnk.index()['LinkTargetIDList']
+	struct.pack_into('<H', data, start + 2, 1)
+	errors = _errors(validate.validate(data))
+	assert errors[0].message == 'Invalid ItemIDSize 1'
+
+def test_flag_block_mismatch():
+	lnk = gen_lnk.malicious()
+	lnk.set('HasExpString', 0)
+	findings = validate.validate(bytes(lnk))
+	assert validate.is_valid(findings)
+	assert any(f.message.startswith('HasExpString is 0') for f in findings)
+
+def test_trailing_bytes():
+	data = bytes(gen_lnk.example())
+	findings = validate.validate(data + b'junk')
+	assert findings[-1].message == '4 bytes after the TerminalBlock'
+	assert Link.from_bytes(data + b'junk')
+
+def test_volume_id_without_unicode_label_offset():
+	# A link of only a LinkInfo, its VolumeID of 0x11 bytes ends the
+	# buffer and claims a VolumeLabelOffsetUnicode at 0x10
+	header = bytearray(bytes(gen_lnk.example())[:0x4C])
+	struct.pack_into('<I', header, 0x14, 2)		# HasLinkInfo
+	volume = struct.pack('<4I', 0x11, 3, 0, 0x14) + b'\x00'
+	link_info = struct.pack('<7I', 0x1C + len(volume), 0x1C, 1, 0x1C,
+		0x2C, 0, 0x2C) + volume
+	data = bytes(header) + link_info
+	assert len(data) == 121
+	errors = _errors(validate.validate(data))
+	assert errors[0].section == 'VolumeID'
+	assert 'VolumeLabelOffsetUnicode' in errors[0].message
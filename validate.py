@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+""" Structural validation of links
+
+validate() walks a link once, front to back, and checks every size and
+offset field against the bounds of its structure, the terminal ID and
+block, and that the LinkFlags agree with the sections and ExtraData
+blocks present. Nothing is decoded or copied. Every problem found is
+returned as a Finding rather than raised, so the whole link is checked.
+
+	findings = validate(bytes(lnk))
+	python3 validate.py DIR_OR_FILE... [-j WORKERS] > findings.jsonl
+"""
+
+import argparse
+import collections
+import json
+import struct
+import sys
+
+from constants import DriveType, ShowCommand
+from extra_data import (DATA_BLOCKS, EnvironmentVariableDataBlock,
+	DarwinDataBlock, IconEnvironmentDataBlock, ShimDataBlock)
+from link_info import CommonNetworkRelativeLinkFlags, LinkInfoFlags
+from reader import Reader
+from shell_link import STRING_FIELDS
+from shell_link_header import ShellLinkHeader, LinkFlags
+
+ERROR = 'error'		# the link can not be parsed as specified
+WARNING = 'warning'	# parsable, but not what the specification requires
+
+Finding = collections.namedtuple('Finding', [
+	'severity', 'section', 'offset', 'message'])
+
+# LinkFlags announcing an ExtraData block
+FLAG_BLOCKS = (
+	('HasExpString', EnvironmentVariableDataBlock),
+	('HasDawinID', DarwinDataBlock),
+	('HasExpIcon', IconEnvironmentDataBlock),
+	('RunWithShimLayer', ShimDataBlock),
+)
+
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+
+def _mask(schema):
+	return (1 << len(schema.field_names)) - 1
+
+class _Validator():
+	def __init__(self, data, offset):
+		self.reader = Reader(data)
+		self.mv = self.reader.mv
+		self.base = offset
+		self.end = len(self.mv)
+		self.findings = []
+
+	def report(self, severity, section, offset, message):
+		self.findings.append(Finding(severity, section, offset, message))
+
+	def u16(self, offset):
+		return _U16.unpack_from(self.mv, offset)[0]
+
+	def u32(self, offset):
+		return _U32.unpack_from(self.mv, offset)[0]
+
+	def fits(self, section, offset, size, end=None):
+		""" Whether [offset, offset + size) lies before `end`,
+			reports an error otherwise """
+		end = self.end if end is None else end
+		if offset + size > end:
+			self.report(ERROR, section, offset, f'{section} of {size} bytes '
+				f'overflows its bounds by {offset + size - end}')
+			return False
+		return True
+
+	def terminated(self, section, start, stop, wide=False):
+		""" Checks a NUL-terminated string ends before `stop` """
+		if wide:
+			for i in range(start, stop - 1, 2):
+				if not self.mv[i] and not self.mv[i + 1]:
+					return
+		elif self.reader.find(b'\x00', start, stop) >= 0:
+			return
+		self.report(ERROR, section, start, 'String is not NUL-terminated')
+
+	def run(self):
+		offset = self.base
+		if not self.fits('ShellLinkHeader', offset, 0x4C):
+			return self.findings
+		flags = self.header(offset)
+		offset += 0x4C
+
+		if flags & LinkFlags.masks['HasLinkTargetIDList']:
+			offset = self.idlist(offset)
+		if offset is not None and flags & LinkFlags.masks['HasLinkInfo']:
+			offset = self.link_info(offset)
+		if offset is not None:
+			offset = self.string_data(offset, flags)
+		if offset is not None:
+			self.extra_data(offset, flags)
+		return self.findings
+
+	def header(self, offset):
+		section = 'ShellLinkHeader'
+		if self.u32(offset) != 0x4C:
+			self.report(ERROR, section, offset,
+				f'HeaderSize is {self.u32(offset):#x}, not 0x4C')
+		if self.mv[offset + 4:offset + 20] != bytes(ShellLinkHeader.CLSID):
+			self.report(ERROR, section, offset + 4, 'Invalid LinkCLSID')
+
+		flags = self.u32(offset + 0x14)
+		if flags & ~_mask(LinkFlags):
+			self.report(WARNING, section, offset + 0x14,
+				f'Undefined LinkFlags {flags & ~_mask(LinkFlags):#x}')
+		if flags & LinkFlags.masks['ForceNoLinkInfo'] and \
+				flags & LinkFlags.masks['HasLinkInfo']:
+			self.report(WARNING, section, offset + 0x14,
+				'HasLinkInfo is set with ForceNoLinkInfo')
+
+		show = self.u32(offset + 0x3C)
+		if show not in {s.value for s in ShowCommand}:
+			self.report(WARNING, section, offset + 0x3C,
+				f'ShowCommand {show:#x} is undefined, read as SW_SHOWNORMAL')
+		if self.mv[offset + 0x42:offset + 0x4C] != bytes(10):
+			self.report(WARNING, section, offset + 0x42,
+				'Reserved fields are not zero')
+		return flags
+
+	def idlist(self, offset):
+		section = 'LinkTargetIDList'
+		if not self.fits(section, offset, 2):
+			return None
+		size = self.u16(offset)
+		end = offset + 2 + size
+		if not self.fits(section, offset + 2, size):
+			return None
+
+		pos = offset + 2
+		while True:
+			if not self.fits(section, pos, 2, end):
+				self.report(ERROR, section, pos, 'Missing TerminalID')
+				return end
+			item = self.u16(pos)
+			if item == 0:
+				break
+			if item < 3:
+				self.report(ERROR, section, pos, f'Invalid ItemIDSize {item}')
+				return end
+			if not self.fits('ItemID', pos, item, end):
+				return end
+			pos += item
+		if pos + 2 != end:
+			self.report(ERROR, section, pos, 'TerminalID does not end '
+				f'the IDList, {end - pos - 2} bytes follow')
+		return end
+
+	def link_info(self, offset):
+		section = 'LinkInfo'
+		if not self.fits(section, offset, 0x1C):
+			return None
+		size, header_size, flags, volume, base, cnrl, suffix = \
+			struct.unpack_from('<7I', self.mv, offset)
+		if size < 0x1C or not self.fits(section, offset, size):
+			if size < 0x1C:
+				self.report(ERROR, section, offset,
+					f'Invalid LinkInfoSize {size:#x}')
+			return None
+		end = offset + size
+
+		if header_size != 0x1C and header_size < 0x24:
+			self.report(ERROR, section, offset + 4,
+				f'Invalid LinkInfoHeaderSize {header_size:#x}')
+		use_opt = header_size >= 0x24
+		base_unicode = suffix_unicode = 0
+		if use_opt and self.fits(section, offset, 0x24, end):
+			base_unicode, suffix_unicode = struct.unpack_from('<II',
+				self.mv, offset + 0x1C)
+		if flags & ~_mask(LinkInfoFlags):
+			self.report(WARNING, section, offset + 8,
+				f'Undefined LinkInfoFlags {flags & ~_mask(LinkInfoFlags):#x}')
+
+		def field(name, value, present, wide=False):
+			""" Checks the offset of a field, True if it is present """
+			if not present:
+				if value:
+					self.report(WARNING, section, offset, f'{name} is '
+						f'{value:#x} but its LinkInfoFlags is not set')
+				return False
+			if value < header_size or value >= size:
+				self.report(ERROR, section, offset, f'{name} {value:#x} is '
+					f'outside of the LinkInfo body [{header_size:#x}, {size:#x})')
+				return False
+			return True
+
+		local = flags & LinkInfoFlags.masks['VolumeIDAndLocalBasePath']
+		network = flags & LinkInfoFlags.masks[
+			'CommonNetworkRelativeLinkAndPathSuffix']
+		if field('VolumeIDOffset', volume, local):
+			self.volume_id(offset + volume, end)
+		if field('LocalBasePathOffset', base, local):
+			self.terminated('LocalBasePath', offset + base, end)
+		if field('CommonNetworkRelativeLinkOffset', cnrl, network):
+			self.network_link(offset + cnrl, end)
+		if field('CommonPathSuffixOffset', suffix, True):
+			self.terminated('CommonPathSuffix', offset + suffix, end)
+		if use_opt:
+			if field('LocalBasePathOffsetUnicode', base_unicode, local):
+				self.terminated('LocalBasePathUnicode',
+					offset + base_unicode, end, wide=True)
+			if suffix_unicode and field('CommonPathSuffixOffsetUnicode',
+					suffix_unicode, True):
+				self.terminated('CommonPathSuffixUnicode',
+					offset + suffix_unicode, end, wide=True)
+		return end
+
+	def volume_id(self, offset, parent_end):
+		section = 'VolumeID'
+		if not self.fits(section, offset, 0x10, parent_end):
+			return
+		size, drive_type, _, label = struct.unpack_from('<4I', self.mv, offset)
+		if size <= 0x10:
+			self.report(ERROR, section, offset, f'Invalid VolumeIDSize {size:#x}')
+			return
+		if not self.fits(section, offset, size, parent_end):
+			return
+		if drive_type not in {d.value for d in DriveType}:
+			self.report(WARNING, section, offset + 4,
+				f'Invalid DriveType {drive_type:#x}')
+		if label == 0x14:
+			if size < 0x14:
+				self.report(ERROR, section, offset, f'VolumeIDSize {size:#x} '
+					'leaves no room for VolumeLabelOffsetUnicode')
+				return
+			if not self.fits(section, offset, 0x14, parent_end):
+				return
+			label, = _U32.unpack_from(self.mv, offset + 0x10)
+			if label < 0x14 or label >= size:
+				self.report(ERROR, section, offset + 0x10, 'VolumeLabelOffset'
+					f'Unicode {label:#x} is outside of the VolumeID')
+			else:
+				self.terminated('VolumeLabelUnicode', offset + label,
+					offset + size, wide=True)
+		elif label < 0x10 or label >= size:
+			self.report(ERROR, section, offset + 0xC,
+				f'VolumeLabelOffset {label:#x} is outside of the VolumeID')
+		else:
+			self.terminated('VolumeLabel', offset + label, offset + size)
+
+	def network_link(self, offset, parent_end):
+		section = 'CommonNetworkRelativeLink'
+		if not self.fits(section, offset, 0x14, parent_end):
+			return
+		size, flags, net_name, device_name, _ = struct.unpack_from('<5I',
+			self.mv, offset)
+		if size < 0x14:
+			self.report(ERROR, section, offset,
+				f'Invalid CommonNetworkRelativeLinkSize {size:#x}')
+			return
+		if not self.fits(section, offset, size, parent_end):
+			return
+		end = offset + size
+		first = 0x1C if net_name > 0x14 else 0x14
+
+		def string(name, value, wide=False):
+			if value < first or value >= size:
+				self.report(ERROR, section, offset, f'{name}Offset '
+					f'{value:#x} is outside of the {section}')
+			else:
+				self.terminated(name, offset + value, end, wide)
+
+		string('NetName', net_name)
+		valid_device = flags & CommonNetworkRelativeLinkFlags.masks['ValidDevice']
+		if valid_device:
+			string('DeviceName', device_name)
+		elif device_name:
+			self.report(WARNING, section, offset + 0xC, 'DeviceNameOffset '
+				'is set but ValidDevice is not')
+		if net_name > 0x14 and self.fits(section, offset, 0x1C, end):
+			net_unicode, device_unicode = struct.unpack_from('<II',
+				self.mv, offset + 0x14)
+			string('NetNameUnicode', net_unicode, wide=True)
+			if valid_device:
+				string('DeviceNameUnicode', device_unicode, wide=True)
+
+	def string_data(self, offset, flags):
+		width = 2 if flags & LinkFlags.masks['IsUnicode'] else 1
+		for flag, name in STRING_FIELDS:
+			if not flags & LinkFlags.masks[flag]:
+				continue
+			if not self.fits(name, offset, 2):
+				return None
+			count = self.u16(offset)
+			if not self.fits(name, offset + 2, count * width):
+				return None
+			offset += 2 + count * width
+		return offset
+
+	def extra_data(self, offset, flags):
+		section = 'ExtraData'
+		seen = collections.Counter()
+		while True:
+			if not self.fits(section, offset, 4):
+				self.report(ERROR, section, offset, 'Missing TerminalBlock')
+				break
+			size = self.u32(offset)
+			if size < 4:
+				if size:
+					self.report(WARNING, section, offset,
+						f'TerminalBlock is {size:#x}, not 0')
+				offset += 4
+				break
+			if size < 8:
+				self.report(ERROR, section, offset, f'Invalid BlockSize {size:#x}')
+				break
+			if not self.fits(section, offset, size):
+				break
+
+			signature = self.u32(offset + 4)
+			seen[signature] += 1
+			block = DATA_BLOCKS.get(signature)
+			if block is None:
+				self.report(WARNING, section, offset,
+					f'Unknown BlockSignature {signature:#x}')
+			elif block.BLOCK_SIZE not in (None, size):
+				self.report(ERROR, block.__name__, offset, f'BlockSize '
+					f'{size:#x}, should be {block.BLOCK_SIZE:#x}')
+			if seen[signature] == 2:
+				self.report(WARNING, section, offset,
+					f'Duplicate block {signature:#x}')
+			offset += size
+
+		for flag, block in FLAG_BLOCKS:
+			has_flag = bool(flags & LinkFlags.masks[flag])
+			if has_flag != bool(seen[block.SIGNATURE]):
+				self.report(WARNING, section, self.base,
+					f'{flag} is {int(has_flag)} but the link has '
+					f'{"no" if has_flag else "a"} {block.__name__}')
+
+		if offset < self.end:
+			self.report(WARNING, section, offset,
+				f'{self.end - offset} bytes after the TerminalBlock')
+
+def validate(data, offset=0):
+	""" Checks the link at `offset` of `data`, returns a list of
+		Findings (empty for a valid link). Bytes following the link
+		are reported, pass a buffer ending with the link. """
+	return _Validator(data, offset).run()
+
+def is_valid(findings):
+	""" Whether none of the findings is an error """
+	return not any(f.severity == ERROR for f in findings)
+
+def validate_file(path):
+	""" (path, findings) of a file, an unreadable file is an error """
+	try:
+		with open(path, 'rb') as f:
+			return path, validate(f.read())
+	except OSError as e:
+		return path, [Finding(ERROR, 'file', None, str(e))]
+
+def validate_batch(paths):
+	return [validate_file(path) for path in paths]
+
+def main(argv=None):
+	from scan import scan
+
+	parser = argparse.ArgumentParser(description='Validate .lnk files in '
+		'bulk and write their findings as JSON to stdout')
+	parser.add_argument('paths', nargs='+', help='files or directories')
+	parser.add_argument('-j', '--workers', type=int, default=None,
+		help='worker processes (default: CPU count, 0: no pool)')
+	parser.add_argument('-b', '--batch-size', type=int, default=256)
+	parser.add_argument('-p', '--pattern', default='*.lnk',
+		help='file name pattern in directories (default: *.lnk)')
+	parser.add_argument('-a', '--all', action='store_true',
+		help='also write files without findings')
+	args = parser.parse_args(argv)
+
+	files = invalid = 0
+	for batch in scan(args.paths, args.workers, args.batch_size,
+			args.pattern, parse_batch=validate_batch):
+		for path, findings in batch:
+			files += 1
+			invalid += not is_valid(findings)
+			if findings or args.all:
+				sys.stdout.write(json.dumps({'path': path,
+					'findings': [f._asdict() for f in findings]}) + '\n')
+	print(f'{files} files, {invalid} invalid', file=sys.stderr)
+
+if __name__ == '__main__':
+	main()